@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import random
+import time
+
+from dns_wire import (
+    CLASS_IN,
+    FLAG_QR,
+    RCODE_NAMES,
+    RCODE_NOERROR,
+    RCODE_NXDOMAIN,
+    TYPE_A,
+    DNSError,
+    build_query,
+    parse_header,
+    parse_message,
+)
+
+
+class DNSTimeout(Exception):
+    """No matching answer after every retry"""
+
+
+class ResolverProtocol(asyncio.DatagramProtocol):
+    """One shared UDP socket, hands every datagram to the resolver"""
+
+    def __init__(self, resolver, index):
+        self.resolver = resolver
+        self.index = index
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.resolver.received(self.index, data)
+
+    def error_received(self, exc):
+        # ICMP port unreachable and friends: the pending queries just time out
+        self.resolver.errors += 1
+
+
+class PendingQuery:
+    __slots__ = ("name", "qtype", "future")
+
+    def __init__(self, name, qtype, future):
+        self.name = name
+        self.qtype = qtype
+        self.future = future
+
+
+class AsyncResolver:
+    """Resolves many names at once over a few shared UDP sockets
+
+    Queries are spread round-robin over `sockets` connected UDP sockets.
+    An answer is accepted only if its transaction ID is pending on the
+    socket it came in on and its question matches what was asked, so late
+    or spoofed datagrams are dropped. A query that gets no answer is sent
+    again (new ID, next socket) with the timeout multiplied by `backoff`
+    each time, and at most max_in_flight queries are outstanding at once.
+    With a ResolverCache, answers are served from it while their TTL lasts
+    and hot entries are refreshed in the background just before expiry.
+    """
+
+    def __init__(self, server, port=53, sockets=4, timeout=2.0, retries=2, backoff=2.0,
+                 max_in_flight=256, cache=None):
+        self.server = server
+        self.port = port
+        self.socket_count = sockets
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_in_flight = max_in_flight
+        self.protocols = []
+        self.pending = {}  # (socket index, txid) -> PendingQuery
+        self.next_socket = 0
+        self.limit = None
+        self.cache = cache
+        self.prefetching = set()  # background refresh tasks
+
+        # Counters
+        self.sent = 0
+        self.answered = 0
+        self.retried = 0
+        self.timeouts = 0
+        self.mismatched = 0
+        self.errors = 0
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self.limit = asyncio.Semaphore(self.max_in_flight)
+        for index in range(self.socket_count):
+            _, protocol = await loop.create_datagram_endpoint(
+                lambda index=index: ResolverProtocol(self, index),
+                remote_addr=(self.server, self.port)
+            )
+            self.protocols.append(protocol)
+        return self
+
+    def close(self):
+        for protocol in self.protocols:
+            protocol.transport.close()
+        self.protocols = []
+        for task in self.prefetching:
+            task.cancel()
+        for query in self.pending.values():
+            if not query.future.done():
+                query.future.cancel()
+        self.pending.clear()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def received(self, index, data):
+        try:
+            txid, flags = parse_header(data)[:2]
+        except DNSError:
+            self.mismatched += 1
+            return
+        query = self.pending.get((index, txid))
+        if query is None or not flags & FLAG_QR:
+            self.mismatched += 1
+            return
+        try:
+            message = parse_message(data)
+        except DNSError:
+            self.mismatched += 1
+            return
+        if message.question != (query.name, query.qtype, CLASS_IN):
+            # Right ID, wrong question: not the answer to our query
+            self.mismatched += 1
+            return
+        if not query.future.done():
+            self.answered += 1
+            query.future.set_result(message)
+
+    def send(self, name, qtype, future):
+        """Send a query on the next socket, returns its pending key"""
+        index = self.next_socket
+        self.next_socket = (index + 1) % len(self.protocols)
+        txid = random.getrandbits(16)
+        while (index, txid) in self.pending:
+            txid = random.getrandbits(16)
+        self.pending[(index, txid)] = PendingQuery(name, qtype, future)
+        self.protocols[index].transport.sendto(build_query(name, qtype, txid))
+        self.sent += 1
+        return index, txid
+
+    async def query(self, name, qtype=TYPE_A):
+        """The full response message for one question, DNSTimeout if none came"""
+        name = name.strip(".").lower()
+        async with self.limit:
+            # Every attempt stays pending, a late answer to an earlier one still counts
+            future = asyncio.get_running_loop().create_future()
+            keys = []
+            timeout = self.timeout
+            try:
+                for attempt in range(self.retries + 1):
+                    if attempt:
+                        self.retried += 1
+                    keys.append(self.send(name, qtype, future))
+                    await asyncio.wait((future,), timeout=timeout)
+                    if future.done():
+                        return future.result()
+                    timeout *= self.backoff
+            finally:
+                for key in keys:
+                    self.pending.pop(key, None)
+            self.timeouts += 1
+            raise DNSTimeout(f"no answer for {name} from {self.server} after {self.retries + 1} tries")
+
+    async def resolve(self, name, qtype=TYPE_A):
+        """Addresses for a name, [] when it does not exist or has none of that type"""
+        name = name.strip(".").lower()
+        if self.cache is not None:
+            entry, prefetch = self.cache.lookup(name, qtype)
+            if entry is not None:
+                if prefetch:
+                    task = asyncio.ensure_future(self.refresh(name, qtype))
+                    self.prefetching.add(task)
+                    task.add_done_callback(self.prefetching.discard)
+                return list(entry.addresses)
+        message = await self.query(name, qtype)
+        if message.rcode not in (RCODE_NOERROR, RCODE_NXDOMAIN):
+            raise DNSError(f"{name}: server answered {RCODE_NAMES.get(message.rcode, message.rcode)}")
+        if self.cache is not None:
+            self.cache.store(name, qtype, message)
+        return message.addresses(qtype)
+
+    async def refresh(self, name, qtype):
+        """Prefetch: query again and replace the cache entry before it expires"""
+        try:
+            message = await self.query(name, qtype)
+        except (DNSTimeout, DNSError):
+            return
+        if message.rcode in (RCODE_NOERROR, RCODE_NXDOMAIN):
+            self.cache.store(name, qtype, message)
+
+    async def resolve_many(self, names, qtype=TYPE_A):
+        """{name: addresses} for every name, None for names that failed"""
+
+        async def one(name):
+            try:
+                return await self.resolve(name, qtype)
+            except (DNSTimeout, DNSError):
+                return None
+
+        results = await asyncio.gather(*(one(name) for name in names))
+        return dict(zip(names, results))
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "answered": self.answered,
+            "retried": self.retried,
+            "timeouts": self.timeouts,
+            "mismatched": self.mismatched,
+            "errors": self.errors,
+        }
+
+
+async def resolve_many(names, server, qtype=TYPE_A, **options):
+    """Resolve a list of names with a short-lived AsyncResolver"""
+    async with AsyncResolver(server, **options) as resolver:
+        return await resolver.resolve_many(names, qtype)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Resolve many names concurrently against one DNS server")
+    parser.add_argument("names", nargs="*", help="names to resolve")
+    parser.add_argument("--file", help="file with one name per line")
+    parser.add_argument("--server", default="169.254.123.252")
+    parser.add_argument("--port", type=int, default=53)
+    parser.add_argument("--sockets", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=2.0, help="first attempt timeout in seconds")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--max-in-flight", type=int, default=256)
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    names = list(args.names)
+    if args.file:
+        with open(args.file) as f:
+            names += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    started = time.monotonic()
+    async with AsyncResolver(args.server, args.port, args.sockets, args.timeout, args.retries,
+                             max_in_flight=args.max_in_flight) as resolver:
+        results = await resolver.resolve_many(names)
+        stats = resolver.stats()
+    elapsed = time.monotonic() - started
+    for name, addresses in results.items():
+        if addresses is None:
+            print(f"✗ {name}: no answer")
+        else:
+            print(f"✓ {name} -> {', '.join(addresses) if addresses else '(no records)'}")
+    print(f"\n📊 {len(names)} names in {elapsed * 1000:.1f} ms: {stats['sent']} queries sent, "
+          f"{stats['retried']} retries, {stats['timeouts']} timeouts, {stats['mismatched']} ignored")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,10 +1,190 @@
 #!/usr/bin/env python3
+import argparse
+import atexit
+import concurrent.futures
+import functools
+import http.client
+import json
+import os
+import random
+import shutil
 import socket
-import requests
 import subprocess
-import struct
-import random
+import sys
+import threading
 import time
+import urllib.parse
+
+from latency_stats import percentile
+from dns_wire import RCODE_FORMERR, RCODE_NAMES, RCODE_NOERROR, RCODE_NXDOMAIN, TYPE_NAMES, UDP_LIMIT, DNSError, build_query, parse_message
+from resolver_cache import ResolverCache
+
+# Answers (and NXDOMAIN/NODATA) of dns_query_raw, kept for their TTL; one
+# cache per (server, port), as servers may well answer differently
+DNS_CACHES = {}
+
+
+def dns_cache(dns_server, port=53):
+    cache = DNS_CACHES.get((dns_server, port))
+    if cache is None:
+        cache = DNS_CACHES.setdefault((dns_server, port), ResolverCache())
+    return cache
+
+# What dns_query_raw returns when the server says the name has no such
+# record (NXDOMAIN or NODATA): falsy like a failure, but not None, so
+# callers can tell an answer from an error
+NO_RECORDS = ""
+
+# Where resolve_dns_custom keeps how each method did in earlier runs
+METHOD_STATS_FILE = os.path.expanduser("~/.cache/clienttest_methods.json")
+
+
+class MethodStats:
+    """Success rate and latency of each resolution method
+
+    Used to order the subprocess fallbacks: the most reliable first, the
+    faster of equally reliable ones before the other. The rate is smoothed
+    so an untried method starts at 50% and one bad run does not bury a
+    tool for good; latency is a moving average that follows recent runs.
+    The file is rewritten at most every save_every records or
+    save_interval seconds, and once more at exit.
+    """
+
+    def __init__(self, path=None, alpha=0.3, save_every=50, save_interval=5.0):
+        self.path = path
+        self.alpha = alpha
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # keeps an older snapshot from overwriting a newer one
+        self.methods = {}  # name -> {"attempts", "successes", "latency"}
+        self.unsaved = 0
+        self.saved_at = time.monotonic()
+        if path:
+            try:
+                with open(path) as f:
+                    self.methods = json.load(f)
+            except (OSError, ValueError):
+                pass
+            atexit.register(self.save)
+
+    def record(self, method, seconds, success):
+        with self.lock:
+            stats = self.methods.setdefault(method, {"attempts": 0, "successes": 0, "latency": seconds})
+            stats["attempts"] += 1
+            stats["successes"] += bool(success)
+            stats["latency"] += self.alpha * (seconds - stats["latency"])
+            self.unsaved += 1
+            due = (self.unsaved >= self.save_every
+                   or time.monotonic() - self.saved_at >= self.save_interval)
+        if due:
+            self.save()
+
+    def success_rate(self, method):
+        stats = self.methods.get(method, {"attempts": 0, "successes": 0})
+        return (stats["successes"] + 1) / (stats["attempts"] + 2)
+
+    def latency(self, method):
+        return self.methods.get(method, {}).get("latency", 0.0)
+
+    def order(self, methods):
+        with self.lock:
+            return sorted(methods, key=lambda method: (-self.success_rate(method), self.latency(method)))
+
+    def save(self):
+        """Write the stats if anything changed since the last save"""
+        with self.save_lock:
+            with self.lock:
+                if not self.path or not self.unsaved:
+                    return
+                snapshot = json.dumps(self.methods)
+                self.unsaved = 0
+                self.saved_at = time.monotonic()
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "w") as f:
+                    f.write(snapshot)
+            except OSError:
+                pass
+
+
+METHOD_STATS = MethodStats(METHOD_STATS_FILE)
+
+# UDP payload size dns_query_raw advertises with EDNS0 (the DNS flag day 2020 default,
+# small enough not to be fragmented on any usual path)
+EDNS_PAYLOAD = 1232
+
+
+class TCPConnections:
+    """Idle TCP connections to DNS servers, reused for later queries
+
+    A truncated UDP answer is asked again over TCP; keeping the connection
+    open means the next large answer from that server costs one round trip
+    instead of a handshake first. Servers close idle connections after a
+    while, so a reused connection that turns out dead is replaced once.
+    """
+
+    def __init__(self, max_idle=4, timeout=10):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle = {}  # (server, port) -> [socket]
+        self.lock = threading.Lock()
+
+    def take(self, key):
+        with self.lock:
+            sockets = self.idle.get(key)
+            return sockets.pop() if sockets else None
+
+    def give(self, key, sock):
+        with self.lock:
+            sockets = self.idle.setdefault(key, [])
+            if len(sockets) < self.max_idle:
+                sockets.append(sock)
+                return
+        sock.close()
+
+    @staticmethod
+    def read(sock, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionResetError("server closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def query(self, server, port, packet):
+        """(response, reused) for one query sent with the 2-byte length prefix"""
+        key = (server, port)
+        while True:
+            sock = self.take(key)
+            reused = sock is not None
+            if sock is None:
+                sock = socket.create_connection(key, timeout=self.timeout)
+            try:
+                sock.sendall(len(packet).to_bytes(2, "big") + packet)
+                length = int.from_bytes(self.read(sock, 2), "big")
+                response = self.read(sock, length)
+            except ConnectionError:
+                sock.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                sock.close()
+                raise
+            self.give(key, sock)
+            return response, reused
+
+    def close(self):
+        with self.lock:
+            for sockets in self.idle.values():
+                for sock in sockets:
+                    sock.close()
+            self.idle.clear()
+
+
+DNS_TCP = TCPConnections()
 
 def test_basic_connectivity():
     """Test basic network connectivity"""
@@ -23,143 +203,112 @@ def test_basic_connectivity():
         print(f"✗ Cannot reach DNS server {dns_server}:53 - {e}")
         return False
 
-def dns_query_raw(domain, dns_server, query_type=1):
+def dns_exchange_udp(packet, dns_server, port, payload, timeout=10, log=None):
+    """Send one query over UDP and return the raw response"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(timeout)
+    try:
+        print(f"Sending query to {dns_server}:{port}...", file=log)
+        sock.sendto(packet, (dns_server, port))
+        print("Waiting for response...", file=log)
+        # Room for everything we said we can take; extra bytes would only be cut off
+        response, addr = sock.recvfrom(max(payload or 0, UDP_LIMIT))
+    finally:
+        sock.close()
+    print(f"Received response from {addr}: {len(response)} bytes", file=log)
+    return response
+
+def dns_query_raw(domain, dns_server, query_type=1, payload=EDNS_PAYLOAD, port=53, log=None):
     """
-    Send raw DNS query using UDP socket
+    Send raw DNS query using UDP socket, over TCP when the answer is truncated
     query_type: 1 = A record, 28 = AAAA record
+    payload: EDNS0 UDP payload size to advertise, None for plain 512-byte DNS
+    Returns the first address, NO_RECORDS for NXDOMAIN/NODATA, None on errors
     """
     try:
-        print(f"Sending raw DNS query for {domain} to {dns_server}")
-
-        # Create DNS query packet
-        transaction_id = random.randint(0, 65535)
-
-        # DNS Header (12 bytes)
-        flags = 0x0100  # Standard query, recursion desired
-        questions = 1
-        answer_rrs = 0
-        authority_rrs = 0
-        additional_rrs = 0
+        cache = dns_cache(dns_server, port)
+        cached, _ = cache.lookup(domain, query_type)
+        if cached is not None:
+            print(f"Cache hit for {domain}: {', '.join(cached.addresses) or 'no records'} "
+                  f"(TTL {cached.ttl_left()}s left)", file=log)
+            return cached.addresses[0] if cached.addresses else NO_RECORDS
 
-        header = struct.pack('!HHHHHH',
-                           transaction_id, flags, questions,
-                           answer_rrs, authority_rrs, additional_rrs)
+        print(f"Sending raw DNS query for {domain} to {dns_server}", file=log)
 
-        # DNS Question
-        question = b''
-        for part in domain.split('.'):
-            if part:  # Skip empty parts
-                question += struct.pack('!B', len(part)) + part.encode()
-        question += b'\x00'  # End of domain name
-        question += struct.pack('!HH', query_type, 1)  # Type A, Class IN
-
-        # Complete DNS packet
-        dns_packet = header + question
-
-        print(f"DNS packet size: {len(dns_packet)} bytes")
-        print(f"Transaction ID: {transaction_id}")
-
-        # Send DNS query
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.settimeout(10)  # Increase timeout
-
-        print(f"Sending query to {dns_server}:53...")
-        sock.sendto(dns_packet, (dns_server, 53))
-
-        # Receive response
-        print("Waiting for response...")
-        response, addr = sock.recvfrom(512)
-        sock.close()
+        # Create DNS query packet: header (standard query, recursion desired), question and EDNS0 OPT
+        transaction_id = random.randint(0, 65535)
+        dns_packet = build_query(domain, query_type, transaction_id, payload=payload)
 
-        print(f"Received response from {addr}: {len(response)} bytes")
+        print(f"DNS packet size: {len(dns_packet)} bytes", file=log)
+        print(f"Transaction ID: {transaction_id}, EDNS0 payload: {payload or 'off'}", file=log)
 
-        # Parse response (simplified)
-        if len(response) < 12:
-            print("Response too short")
+        response = dns_exchange_udp(dns_packet, dns_server, port, payload, log=log)
+        try:
+            message = parse_message(response)
+        except DNSError as e:
+            print(f"Malformed response: {e}", file=log)
             return None
 
-        # Parse header
-        resp_id, resp_flags, resp_questions, resp_answers = struct.unpack('!HHHH', response[:8])
-        print(f"Response ID: {resp_id}, Flags: {hex(resp_flags)}, Answers: {resp_answers}")
-
-        if resp_id != transaction_id:
-            print(f"Transaction ID mismatch: sent {transaction_id}, got {resp_id}")
-            return None
+        if payload and message.rcode == RCODE_FORMERR and message.opt is None:
+            # A server from before EDNS0 (RFC 6891 6.2.2): ask again the old way
+            print("Server does not support EDNS0, retrying without it", file=log)
+            dns_packet = build_query(domain, query_type, transaction_id)
+            response = dns_exchange_udp(dns_packet, dns_server, port, None, log=log)
+            message = parse_message(response)
 
-        if resp_answers == 0:
-            print("No answers in response")
-            return None
+        if message.truncated:
+            print(f"Response truncated at {len(response)} bytes, retrying over TCP", file=log)
+            response, reused = DNS_TCP.query(dns_server, port, dns_packet)
+            print(f"Received {len(response)} bytes over TCP ({'reused' if reused else 'new'} connection)", file=log)
+            message = parse_message(response)
 
-        # Skip header and question sections
-        offset = 12
-
-        # Skip question section
-        while offset < len(response) and response[offset] != 0:
-            length = response[offset]
-            if length > 63:  # Compression pointer
-                offset += 1
-                break
-            offset += length + 1
-        offset += 5  # Skip null terminator and QTYPE/QCLASS
-        # Parse answer section
-        answers = []
-
-        for i in range(resp_answers):
-            if offset >= len(response) - 10:
-                break
-
-            # Skip name (compressed format)
-            if response[offset] & 0xC0:
-                offset += 2
-            else:
-                while offset < len(response) and response[offset] != 0:
-                    length = response[offset]
-                    if length > 63:  # Compression
-                        offset += 1
-                        break
-                    offset += length + 1
-                if offset < len(response) and response[offset] == 0:
-                    offset += 1
+        print(f"Response ID: {message.txid}, Flags: {hex(message.flags)}, Answers: {len(message.answers)}", file=log)
 
-            # Read type, class, ttl, length
-            if offset + 10 > len(response):
-                break
+        if message.txid != transaction_id:
+            print(f"Transaction ID mismatch: sent {transaction_id}, got {message.txid}", file=log)
+            return None
 
-            rtype, rclass, ttl, rdlength = struct.unpack('!HHIH', response[offset:offset+10])
-            offset += 10
+        # Keep the answer (or the negative answer) for as long as its TTL allows
+        cache.store(domain, query_type, message)
 
-            print(f"Answer {i+1}: Type={rtype}, Class={rclass}, TTL={ttl}, Length={rdlength}")
+        if not message.answers:
+            print(f"No answers in response ({RCODE_NAMES.get(message.rcode, message.rcode)})", file=log)
+            return NO_RECORDS if message.rcode in (RCODE_NOERROR, RCODE_NXDOMAIN) else None
 
-            if rtype == 1 and rdlength == 4:  # A record
-                ip_bytes = response[offset:offset+4]
-                ip = '.'.join(str(b) for b in ip_bytes)
-                answers.append(ip)
-                print(f"Found A record: {ip}")
+        for i, record in enumerate(message.answers):
+            print(f"Answer {i+1}: {record}", file=log)
 
-            offset += rdlength
+        answers = message.addresses(query_type)
+        for ip in answers:
+            print(f"Found {TYPE_NAMES[query_type]} record: {ip}", file=log)
 
-        return answers[0] if answers else None
+        if answers:
+            return answers[0]
+        return NO_RECORDS if message.rcode == RCODE_NOERROR else None
 
     except socket.timeout:
-        print("DNS query timed out")
+        print("DNS query timed out", file=log)
+        return None
+    except DNSError as e:
+        print(f"Malformed response: {e}", file=log)
         return None
     except Exception as e:
-        print(f"Raw DNS query failed: {e}")
+        print(f"Raw DNS query failed: {e}", file=log)
         import traceback
-        traceback.print_exc()
+        traceback.print_exc(file=log)
         return None
 
-def dns_query_dig(domain, dns_server):
+def dns_query_dig(domain, dns_server, log=None):
     """Use dig command for DNS resolution"""
     try:
-        print(f"Using dig to query {domain} from {dns_server}")
+        print(f"Using dig to query {domain} from {dns_server}", file=log)
         cmd = ['dig', f'@{dns_server}', domain, 'A', '+short', '+time=10']
         result = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
 
-        print(f"dig command: {' '.join(cmd)}")
-        print(f"dig return code: {result.returncode}")
-        print(f"dig stdout: {result.stdout}")
-        print(f"dig stderr: {result.stderr}")
+        print(f"dig command: {' '.join(cmd)}", file=log)
+        print(f"dig return code: {result.returncode}", file=log)
+        print(f"dig stdout: {result.stdout}", file=log)
+        print(f"dig stderr: {result.stderr}", file=log)
 
         if result.returncode == 0 and result.stdout.strip():
             # Get the first IP from the output
@@ -177,30 +326,30 @@ def dns_query_dig(domain, dns_server):
                             continue
             return None
         else:
-            print(f"dig command failed: {result.stderr}")
+            print(f"dig command failed: {result.stderr}", file=log)
             return None
 
     except subprocess.TimeoutExpired:
-        print("dig command timed out")
+        print("dig command timed out", file=log)
         return None
     except FileNotFoundError:
-        print("dig command not found - please install dnsutils")
+        print("dig command not found - please install dnsutils", file=log)
         return None
     except Exception as e:
-        print(f"dig query failed: {e}")
+        print(f"dig query failed: {e}", file=log)
         return None
 
-def dns_query_nslookup(domain, dns_server):
+def dns_query_nslookup(domain, dns_server, log=None):
     """Use nslookup command for DNS resolution"""
     try:
-        print(f"Using nslookup to query {domain} from {dns_server}")
+        print(f"Using nslookup to query {domain} from {dns_server}", file=log)
         cmd = ['nslookup', domain, dns_server]
         result = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
 
-        print(f"nslookup command: {' '.join(cmd)}")
-        print(f"nslookup return code: {result.returncode}")
-        print(f"nslookup stdout: {result.stdout}")
-        print(f"nslookup stderr: {result.stderr}")
+        print(f"nslookup command: {' '.join(cmd)}", file=log)
+        print(f"nslookup return code: {result.returncode}", file=log)
+        print(f"nslookup stdout: {result.stdout}", file=log)
+        print(f"nslookup stderr: {result.stderr}", file=log)
 
         if result.returncode == 0:
             lines = result.stdout.split('\n')
@@ -216,40 +365,55 @@ def dns_query_nslookup(domain, dns_server):
                         except ValueError:
                             continue
 
-        print(f"nslookup failed: {result.stderr}")
+        print(f"nslookup failed: {result.stderr}", file=log)
         return None
 
     except Exception as e:
-        print(f"nslookup query failed: {e}")
+        print(f"nslookup query failed: {e}", file=log)
         return None
 
-def resolve_dns_custom(domain, dns_server):
-    """Try multiple methods to resolve DNS"""
-    print(f"\n=== Resolving {domain} using DNS server {dns_server} ===")
-
-    # Method 1: Try dig command
-    print("\n--- Method 1: dig command ---")
-    ip = dns_query_dig(domain, dns_server)
-    if ip:
-        print(f"✓ dig resolved: {domain} -> {ip}")
-        return ip
-
-    # Method 2: Try nslookup command
-    print("\n--- Method 2: nslookup command ---")
-    ip = dns_query_nslookup(domain, dns_server)
-    if ip:
-        print(f"✓ nslookup resolved: {domain} -> {ip}")
-        return ip
-
-    # Method 3: Try raw DNS query
-    print("\n--- Method 3: raw DNS query ---")
-    ip = dns_query_raw(domain, dns_server)
-    if ip:
-        print(f"✓ raw query resolved: {domain} -> {ip}")
-        return ip
-
-    print("\n✗ All DNS resolution methods failed")
-    return None
+# Subprocess tools, tried only when the in-process query fails
+FALLBACK_METHODS = {
+    "dig": dns_query_dig,
+    "nslookup": dns_query_nslookup,
+}
+
+def resolve_dns_custom(domain, dns_server, fallbacks=True, log=None):
+    """Resolve in-process, falling back to dig/nslookup in order of past success
+
+    The step-by-step output goes to log (stdout when None), as it does
+    for every dns_query_* function.
+    """
+    print(f"\n=== Resolving {domain} using DNS server {dns_server} ===", file=log)
+
+    methods = [("raw DNS query", "raw", dns_query_raw)]
+    if fallbacks:
+        installed = [name for name in FALLBACK_METHODS if shutil.which(name)]
+        methods += [(f"{name} command", name, FALLBACK_METHODS[name]) for name in METHOD_STATS.order(installed)]
+
+    timings = []
+    ip = None
+    for number, (label, name, method) in enumerate(methods, 1):
+        print(f"\n--- Method {number}: {label} ---", file=log)
+        started = time.perf_counter()
+        ip = method(domain, dns_server, log=log)
+        elapsed = time.perf_counter() - started
+        # A name without records is an answer: the method worked, and the
+        # other tools would only ask the same server the same question
+        answered = ip is not None
+        METHOD_STATS.record(name, elapsed, answered)
+        timings.append(f"{name} {elapsed * 1000:.1f} ms {'✓' if answered else '✗'}")
+        if ip:
+            print(f"✓ {name} resolved: {domain} -> {ip}", file=log)
+            break
+        if answered:
+            print(f"✗ {domain} has no such record", file=log)
+            break
+
+    print(f"⏱ {', '.join(timings)}", file=log)
+    if ip is None:
+        print("\n✗ All DNS resolution methods failed", file=log)
+    return ip
 
 def test_dns_server_connectivity(dns_server):
     """Test if DNS server is reachable"""
@@ -265,57 +429,211 @@ def test_dns_server_connectivity(dns_server):
         print(f"✗ DNS server {dns_server}:53 is not reachable: {e}")
         return False
 
-def test_http_connection(domain, port, ip=None):
-    """Test HTTP connection to the resolved IP"""
+def phase_summary(seconds):
+    """p50/p90/p99/max of a list of durations, in milliseconds"""
+    ordered = sorted(seconds)
+    summary = {name: percentile(ordered, fraction) for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))}
+    summary["max"] = ordered[-1] if ordered else None
+    return {name: round(value * 1000, 3) if value is not None else None for name, value in summary.items()}
+
+def probe_http(ip, port, domain, repeats=1, path="/", timeout=10):
+    """Time every phase of `repeats` GET requests sent over one kept-alive connection
+
+    connect is only paid again when the server closes the connection;
+    ttfb runs from sending the request to having the response head,
+    transfer from there to the last body byte. Raises OSError or
+    http.client.HTTPException when the server cannot be reached.
+    """
+    if repeats < 1:
+        raise ValueError(f"repeats must be at least 1, got {repeats}")
+    conn = http.client.HTTPConnection(ip, port, timeout=timeout)
+    connects, ttfbs, transfers, totals, throughputs = [], [], [], [], []
+    statuses = {}
+    connections = 0
+    try:
+        for _ in range(repeats):
+            started = time.perf_counter()
+            if conn.sock is None:
+                conn.connect()
+                connections += 1
+                connects.append(time.perf_counter() - started)
+            sent = time.perf_counter()
+            conn.request("GET", path, headers={"Host": domain})
+            response = conn.getresponse()
+            first_byte = time.perf_counter()
+            body = response.read()
+            done = time.perf_counter()
+
+            ttfbs.append(first_byte - sent)
+            transfers.append(done - first_byte)
+            totals.append(done - started)
+            # Bytes per second from sending the request to the last byte
+            throughputs.append(len(body) / (done - sent))
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+            # http.client drops the socket itself when the server said Connection: close
+    finally:
+        conn.close()
+
+    ordered = sorted(throughputs)
+    return {
+        "status": response.status,
+        "statuses": statuses,
+        "bytes": len(body),
+        "headers": dict(response.getheaders()),
+        "preview": body[:200].decode("utf-8", "replace"),
+        "requests": repeats,
+        "connections": connections,
+        "connect_ms": phase_summary(connects),
+        "ttfb_ms": phase_summary(ttfbs),
+        "transfer_ms": phase_summary(transfers),
+        "total_ms": phase_summary(totals),
+        "throughput_kib_s": round(percentile(ordered, 0.5) / 1024, 1) if ordered else None,
+    }
+
+def test_http_connection(domain, port, ip=None, repeats=1, dns_seconds=None, path="/"):
+    """Test HTTP connection to the resolved IP, reporting where the time goes"""
     if not ip:
         print(f"No IP provided for {domain}")
         return False
 
     print(f"\n=== Testing HTTP Connection ===")
+    print(f"Making {repeats} HTTP request{'s' if repeats > 1 else ''} to http://{domain}:{port}{path} "
+          f"({ip}, one kept-alive connection)...")
 
-    # Test basic socket connection first
-    print(f"Testing socket connection to {ip}:{port}...")
     try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(5)
-        result = sock.connect_ex((ip, port))
-        sock.close()
-
-        if result == 0:
-            print(f"✓ Socket connection to {ip}:{port} successful")
-        else:
-            print(f"✗ Socket connection to {ip}:{port} failed (error {result})")
-            return False
-    except Exception as e:
-        print(f"✗ Socket connection failed: {e}")
+        result = probe_http(ip, port, domain, repeats, path)
+    except (OSError, http.client.HTTPException) as e:
+        print(f"✗ HTTP connection to {ip}:{port} failed: {e}")
         return False
 
-    # Test HTTP request
+    print(f"✅ HTTP connection successful!")
+    print(f"Status Code: {result['status']}" + (f" (all: {result['statuses']})" if len(result["statuses"]) > 1 else ""))
+    print(f"Content-Length: {result['bytes']} bytes")
+    print(f"Response headers: {result['headers']}")
+    print(f"Response preview: {result['preview']}...")
+
+    print(f"\n⏱ {'phase':<10} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  (ms)")
+    if dns_seconds is not None:
+        print(f"  {'dns':<10} {dns_seconds * 1000:>9.3f}")
+    for phase in ("connect", "ttfb", "transfer", "total"):
+        summary = result[f"{phase}_ms"]
+        if summary["p50"] is not None:
+            print(f"  {phase:<10} " + " ".join(f"{summary[name]:>9.3f}" for name in ("p50", "p90", "p99", "max")))
+    print(f"📦 {result['requests']} requests over {result['connections']} connection"
+          f"{'s' if result['connections'] != 1 else ''}, median throughput "
+          f"{result['throughput_kib_s'] if result['throughput_kib_s'] is not None else '-'} KiB/s")
+
+    return True
+
+def parse_target(line, default_port):
+    """(domain, port, path) from host, host:port, "host port" or http://host:port/path"""
+    fields = line.split()
+    if len(fields) == 2 and fields[1].isdigit():
+        return fields[0], int(fields[1]), "/"
+    url = urllib.parse.urlsplit(line if "//" in line else "//" + line)
+    path = (url.path or "/") + (f"?{url.query}" if url.query else "")
+    return url.hostname, url.port or default_port, path
+
+def probe_target(line, args, log=None):
+    """Resolve and probe one target, returns its result record"""
+    started = time.perf_counter()
+    record = {"target": line, "ok": False}
     try:
-        print(f"Making HTTP request to http://{domain}:{port}...")
-
-        # Use the resolved IP but keep the domain in Host header
-        url = f"http://{ip}:{port}"
-        headers = {'Host': domain}
-
-        response = requests.get(url, headers=headers, timeout=10)
-
-        print(f"✅ HTTP connection successful!")
-        print(f"Status Code: {response.status_code}")
-        print(f"Content-Length: {len(response.text)} chars")
-        print(f"Response headers: {dict(response.headers)}")
-        print(f"Response preview: {response.text[:200]}...")
-
-        return True
-
-    except requests.exceptions.ConnectionError as e:
-        print(f"✗ HTTP connection failed: {e}")
-        return False
-    except Exception as e:
-        print(f"✗ HTTP request failed: {e}")
-        return False
+        domain, port, path = parse_target(line, args.port)
+        record.update(domain=domain, port=port, path=path)
+        resolve_started = time.perf_counter()
+        ip = resolve_dns_custom(domain, args.dns_server, fallbacks=not args.no_fallbacks, log=log)
+        record["dns_ms"] = round((time.perf_counter() - resolve_started) * 1000, 3)
+        record["ip"] = ip
+        if not ip:
+            record["error"] = "no such record" if ip == NO_RECORDS else "dns resolution failed"
+        else:
+            result = probe_http(ip, port, domain, args.repeats, path, args.timeout)
+            for key in ("headers", "preview"):
+                del result[key]
+            record.update(result)
+            record["ok"] = 200 <= result["status"] < 400
+    except (OSError, ValueError, http.client.HTTPException) as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return record
+
+def read_targets(source):
+    for line in source:
+        line = line.split("#", 1)[0].strip()
+        if line:
+            yield line
+
+def run_batch(args, out=sys.stdout):
+    """Probe every target concurrently, one JSON line per target to out as soon as it is done"""
+    with open(os.devnull, "w") as devnull:
+        # The step-by-step prints of the resolver would corrupt the JSON stream
+        log = sys.stderr if args.verbose else devnull
+        source = sys.stdin if args.batch == "-" else open(args.batch)
+        slots = threading.BoundedSemaphore(args.workers * 2)
+        write_lock = threading.Lock()
+        counts = {"ok": 0, "failed": 0}
+        slowest = None
+        started = time.perf_counter()
+
+        def finished(line, future):
+            nonlocal slowest
+            slots.release()
+            try:
+                record = future.result()
+            except Exception as e:
+                # probe_target catches what a probe is expected to raise; anything
+                # else still gets its line, so no target silently goes missing
+                record = {"target": line, "ok": False, "error": f"{type(e).__name__}: {e}"}
+            with write_lock:
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                counts["ok" if record["ok"] else "failed"] += 1
+                if "elapsed_ms" in record and (slowest is None or record["elapsed_ms"] > slowest["elapsed_ms"]):
+                    slowest = record
+
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as pool:
+                for line in read_targets(source):
+                    # Read ahead at most a few targets, so stdin can be an endless stream
+                    slots.acquire()
+                    future = pool.submit(probe_target, line, args, log)
+                    future.add_done_callback(functools.partial(finished, line))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"📊 {counts['ok'] + counts['failed']} targets in {elapsed:.2f}s with {args.workers} workers: "
+          f"{counts['ok']} ok, {counts['failed']} failed"
+          + (f", slowest {slowest['target']} ({slowest['elapsed_ms']:.1f} ms)" if slowest else ""),
+          file=sys.stderr)
+    return 0 if counts["failed"] == 0 else 1
+
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Resolve names with the lab DNS server and probe their web servers")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="probe every target in FILE ('-' for stdin) and print JSON lines instead of asking")
+    parser.add_argument("--dns-server", default="169.254.123.252")
+    parser.add_argument("--port", type=int, default=8080, help="port for targets that do not name one")
+    parser.add_argument("--workers", type=int, default=32, help="targets probed at the same time")
+    parser.add_argument("--repeats", type=positive_int, default=1, help="requests per target over one connection")
+    parser.add_argument("--timeout", type=float, default=10, help="HTTP timeout in seconds")
+    parser.add_argument("--no-fallbacks", action="store_true", help="do not fall back to dig/nslookup")
+    parser.add_argument("--verbose", action="store_true", help="show each step on stderr")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    if args.batch:
+        sys.exit(run_batch(args))
+
     print("=== Enhanced DNS Client (web.deeznutts.local) ===\n")
 
     # Default settings
@@ -330,10 +648,12 @@ def main():
 
     choice = input("\nEnter choice (1/2/3): ").strip()
 
+    repeats = 1
     if choice == "2":
         domain = input("Enter domain: ").strip()
         port = int(input("Enter port: ").strip())
         dns_server = input("Enter DNS server (default: 169.254.123.252): ").strip() or "169.254.123.252"
+        repeats = max(1, int(input("Requests over one connection (default: 1): ").strip() or 1))
     elif choice == "3":
         # Only test DNS connectivity
         print(f"\n{'='*60}")
@@ -345,6 +665,8 @@ def main():
             test_ip = dns_query_raw("test.local", dns_server)
             if test_ip:
                 print(f"DNS server is responding: got {test_ip}")
+            elif test_ip == NO_RECORDS:
+                print("DNS server is responding: test.local has no such record")
             else:
                 print("DNS server is reachable but not responding to queries")
         return
@@ -360,7 +682,9 @@ def main():
         return
 
     # Try to resolve the domain
+    started = time.perf_counter()
     ip = resolve_dns_custom(domain, dns_server)
+    dns_seconds = time.perf_counter() - started
 
     if not ip:
         print(f"\n❌ Failed to resolve {domain}")
@@ -378,7 +702,7 @@ def main():
         return
 
     # Test HTTP connection
-    success = test_http_connection(domain, port, ip)
+    success = test_http_connection(domain, port, ip, repeats, dns_seconds)
 
     if not success:
         print(f"\n❌ HTTP connection failed")
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Microbenchmark for the DNS codec in dns_wire.py
+
+Parses a handful of typical responses (compressed the way bind9 sends
+them) over and over and reports messages per second, then does the same
+for query encoding with and without the precomputed template.
+
+    python3 codec_benchmark.py --seconds 2 --output codec.json
+"""
+import argparse
+import json
+import platform
+import socket
+import struct
+import time
+from datetime import datetime
+
+from dns_wire import (
+    CLASS_IN,
+    FLAG_AA,
+    FLAG_QR,
+    FLAG_RD,
+    HEADER,
+    QUESTION,
+    RCODE_NXDOMAIN,
+    RR_FIXED,
+    SOA_FIXED,
+    TYPE_A,
+    TYPE_AAAA,
+    TYPE_CNAME,
+    TYPE_MX,
+    TYPE_NS,
+    TYPE_SOA,
+    TYPE_TXT,
+    QueryTemplate,
+    encode_name,
+    parse_message,
+)
+
+# Offset of the question name, which every record below points back to
+QNAME = b"\xc0\x0c"
+
+
+def record(name, rtype, ttl, rdata):
+    return name + RR_FIXED.pack(rtype, CLASS_IN, ttl, len(rdata)) + rdata
+
+
+def response(qname, qtype, answers=(), authority=(), additional=(), rcode=0):
+    flags = FLAG_QR | FLAG_AA | FLAG_RD | rcode
+    return (HEADER.pack(0x1234, flags, 1, len(answers), len(authority), len(additional))
+            + encode_name(qname) + QUESTION.pack(qtype, CLASS_IN)
+            + b"".join(answers) + b"".join(authority) + b"".join(additional))
+
+
+def sample_messages():
+    """name -> wire bytes for the shapes a client sees most"""
+    zone = encode_name("deeznutts.local")
+    # "deeznutts.local" starts 4 bytes into the question name "www.deeznutts.local"
+    zone_ptr = b"\xc0\x10"
+    ns1 = b"\x03ns1" + zone_ptr
+    soa = SOA_FIXED.pack(2025081501, 604800, 86400, 2419200, 604800)
+    return {
+        "single A": response("www.deeznutts.local", TYPE_A, [
+            record(QNAME, TYPE_A, 604800, socket.inet_aton("169.254.216.224")),
+        ]),
+        "8 A + NS + glue": response("www.deeznutts.local", TYPE_A, [
+            record(QNAME, TYPE_A, 300, socket.inet_aton(f"10.0.0.{i}")) for i in range(1, 9)
+        ], [
+            record(zone_ptr, TYPE_NS, 604800, ns1),
+        ], [
+            record(b"\x03ns1" + zone_ptr, TYPE_A, 604800, socket.inet_aton("169.254.123.252")),
+        ]),
+        "NXDOMAIN + SOA": response("nope.deeznutts.local", TYPE_A, authority=[
+            # "deeznutts.local" is 5 bytes into "nope.deeznutts.local"
+            record(b"\xc0\x11", TYPE_SOA, 604800, b"\x03ns1\xc0\x11" + b"\x05admin\xc0\x11" + soa),
+        ], rcode=RCODE_NXDOMAIN),
+        "CNAME chain, MX, TXT, AAAA": response("www.deeznutts.local", TYPE_A, [
+            record(QNAME, TYPE_CNAME, 3600, b"\x03web" + zone_ptr),
+            record(b"\x03web" + zone_ptr, TYPE_A, 3600, socket.inet_aton("169.254.216.224")),
+            record(b"\x03web" + zone_ptr, TYPE_AAAA, 3600, socket.inet_pton(socket.AF_INET6, "fe80::216:224")),
+        ], [
+            record(zone_ptr, TYPE_MX, 3600, struct.pack("!H", 10) + b"\x04mail" + zone_ptr),
+        ], [
+            record(zone_ptr, TYPE_TXT, 3600, b"\x0bv=spf1 -all\x0dlab zone, ok?"),
+        ]),
+        "uncompressed": response("www.deeznutts.local", TYPE_A, [
+            record(encode_name("www.deeznutts.local"), TYPE_A, 60, socket.inet_aton("169.254.216.224")),
+        ], [
+            record(zone, TYPE_NS, 60, encode_name("ns1.deeznutts.local")),
+        ]),
+    }
+
+
+def rate(function, seconds):
+    """Calls per second of function(), measured in batches for about `seconds`"""
+    batch = 1000
+    calls = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while True:
+        for _ in range(batch):
+            function()
+        calls += batch
+        now = time.perf_counter()
+        if now >= deadline:
+            return calls / (now - started)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure DNS message parse and query encode rates")
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent on each measurement")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "parse": {},
+        "encode": {},
+    }
+
+    print("📦 Parse rate")
+    for name, wire in sample_messages().items():
+        message = parse_message(wire)  # also checks the sample is well formed
+        # Parse out of a reused receive buffer, as recvfrom_into() would leave it
+        buffer = bytearray(wire)
+        view = memoryview(buffer)
+        per_second = rate(lambda: parse_message(view), args.seconds)
+        records = len(message.answers) + len(message.authority) + len(message.additional)
+        report["parse"][name] = {"bytes": len(wire), "records": records,
+                                 "messages_per_second": round(per_second)}
+        print(f"  {name:<28} {len(wire):>4} bytes {records:>2} records  {per_second:>10,.0f} msg/s")
+
+    print("📦 Query encode rate")
+    template = QueryTemplate("www.deeznutts.local", TYPE_A)
+    for name, function in (
+        ("template", lambda: template.packet(0x1234)),
+        ("from scratch", lambda: QueryTemplate("www.deeznutts.local", TYPE_A).packet(0x1234)),
+    ):
+        per_second = rate(function, args.seconds)
+        report["encode"][name] = {"queries_per_second": round(per_second)}
+        print(f"  {name:<28} {per_second:>10,.0f} queries/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
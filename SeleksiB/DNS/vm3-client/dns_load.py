@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""Query-load generator for the deeznutts.local DNS server (in the spirit of dnsperf)
+
+Replays a query mix read from a file, one "name TYPE" per line, over a
+few UDP sockets. With --qps the queries are sent on a fixed schedule
+whether or not earlier ones were answered; without it, --max-outstanding
+queries are kept in flight and a new one goes out as soon as an answer
+comes back (as fast as the server allows). Every query is sent once: an
+answer that does not arrive within --timeout counts as lost.
+
+    python3 dns_load.py --server 169.254.123.252 --queries deeznutts_queries.txt --qps 5000 --duration 30
+    python3 dns_load.py --stand-in --duration 5
+"""
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import platform
+import random
+import time
+from datetime import datetime
+
+from dns_wire import FLAG_QR, RCODE_NAMES, TYPE_NAMES, DNSError, parse_header, query_template
+from latency_stats import latency_summary
+from stand_in_dns import StandInDNS
+
+TYPE_CODES = {name: code for code, name in TYPE_NAMES.items()}
+
+# Used when no query file is given: what clients ask the lab zones for
+DEFAULT_MIX = [
+    ("www.deeznutts.local", "A"),
+    ("ns1.deeznutts.local", "A"),
+    ("deeznutts.local", "NS"),
+    ("deeznutts.local", "SOA"),
+    ("252.123.254.169.in-addr.arpa", "PTR"),
+    ("224.216.254.169.in-addr.arpa", "PTR"),
+    ("missing.deeznutts.local", "A"),
+]
+
+
+def load_queries(path):
+    """[(name, qtype)] from a dnsperf-style file: "name TYPE" per line, # comments"""
+    queries = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            fields = line.split("#", 1)[0].split()
+            if not fields:
+                continue
+            name = fields[0]
+            rtype = fields[1].upper() if len(fields) > 1 else "A"
+            if rtype in TYPE_CODES:
+                qtype = TYPE_CODES[rtype]
+            elif rtype.startswith("TYPE") and rtype[4:].isdigit():
+                qtype = int(rtype[4:])
+            else:
+                raise ValueError(f"{path}:{number}: unknown record type {rtype}")
+            queries.append((name, qtype))
+    if not queries:
+        raise ValueError(f"{path}: no queries")
+    return queries
+
+
+class LoadProtocol(asyncio.DatagramProtocol):
+    def __init__(self, generator, index):
+        self.generator = generator
+        self.index = index
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.generator.received(self.index, data)
+
+    def error_received(self, exc):
+        self.generator.errors += 1
+
+
+class LoadGenerator:
+    """Sends the query mix and keeps the numbers dnsperf reports"""
+
+    def __init__(self, server, port, queries, qps=None, duration=10.0, max_outstanding=100,
+                 timeout=2.0, sockets=4):
+        self.server = server
+        self.port = port
+        self.templates = [query_template(name, qtype) for name, qtype in queries]
+        self.qps = qps
+        self.duration = duration
+        self.max_outstanding = max_outstanding
+        self.timeout = timeout
+        self.socket_count = sockets
+        self.protocols = []
+        self.pending = {}  # (socket index, txid) -> send time
+        self.sent_order = collections.deque()  # (send time, key), oldest first
+        self.window = None
+
+        # Results
+        self.sent = 0
+        self.completed = 0
+        self.lost = 0
+        self.unexpected = 0
+        self.errors = 0
+        self.throttled = 0  # sends that waited because max_outstanding was reached
+        self.latencies = []
+        self.rcodes = collections.Counter()
+
+    def received(self, index, data):
+        now = time.perf_counter()
+        try:
+            txid, flags = parse_header(data)[:2]
+        except DNSError:
+            self.unexpected += 1
+            return
+        sent_at = self.pending.pop((index, txid), None)
+        if sent_at is None or not flags & FLAG_QR:
+            # Late (already counted as lost) or not ours
+            self.unexpected += 1
+            return
+        self.completed += 1
+        self.latencies.append(now - sent_at)
+        self.rcodes[flags & 0x000F] += 1
+        self.window.release()
+
+    def send(self):
+        index = self.sent % len(self.protocols)
+        txid = random.getrandbits(16)
+        while (index, txid) in self.pending:
+            txid = random.getrandbits(16)
+        template = self.templates[self.sent % len(self.templates)]
+        now = time.perf_counter()
+        key = (index, txid)
+        self.pending[key] = now
+        self.sent_order.append((now, key))
+        self.protocols[index].transport.sendto(template.packet(txid))
+        self.sent += 1
+
+    def expire(self, now):
+        """Count queries older than the timeout as lost and free their slots"""
+        deadline = now - self.timeout
+        order = self.sent_order
+        while order and order[0][0] <= deadline:
+            sent_at, key = order.popleft()
+            if self.pending.get(key) == sent_at:
+                del self.pending[key]
+                self.lost += 1
+                self.window.release()
+
+    async def sweep(self):
+        while True:
+            await asyncio.sleep(min(0.05, self.timeout / 4))
+            self.expire(time.perf_counter())
+
+    async def acquire(self):
+        if self.window.locked():
+            self.throttled += 1
+        await self.window.acquire()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.window = asyncio.Semaphore(self.max_outstanding)
+        for index in range(self.socket_count):
+            _, protocol = await loop.create_datagram_endpoint(
+                lambda index=index: LoadProtocol(self, index),
+                remote_addr=(self.server, self.port)
+            )
+            self.protocols.append(protocol)
+        sweeper = asyncio.ensure_future(self.sweep())
+        started = time.perf_counter()
+        end = started + self.duration
+        try:
+            while True:
+                now = time.perf_counter()
+                if now >= end:
+                    break
+                if self.qps:
+                    # Send everything that is due by now, then sleep until the next one
+                    due = int((now - started) * self.qps) + 1
+                    while self.sent < due:
+                        await self.acquire()
+                        self.send()
+                    await asyncio.sleep(max(0.0, started + self.sent / self.qps - time.perf_counter()))
+                else:
+                    await self.acquire()
+                    self.send()
+            sending = time.perf_counter() - started
+            # Give the last queries their full timeout
+            while self.pending and time.perf_counter() < end + self.timeout:
+                await asyncio.sleep(0.01)
+            self.expire(float("inf"))
+        finally:
+            sweeper.cancel()
+            for protocol in self.protocols:
+                protocol.transport.close()
+        return self.report(sending)
+
+    def report(self, sending):
+        return {
+            "sent": self.sent,
+            "completed": self.completed,
+            "lost": self.lost,
+            "loss_rate": round(self.lost / self.sent, 6) if self.sent else 0.0,
+            "unexpected": self.unexpected,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "send_seconds": round(sending, 3),
+            "target_qps": self.qps,
+            "achieved_qps": round(self.completed / sending, 1) if sending else 0.0,
+            "latency_ms": latency_summary(self.latencies),
+            "rcodes": {RCODE_NAMES.get(rcode, str(rcode)): count for rcode, count in sorted(self.rcodes.items())},
+        }
+
+
+def run_stand_in(host, port, ready):
+    StandInDNS(host, port, quiet=True).run(ready)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay a DNS query mix and measure what the server can take")
+    parser.add_argument("--server", default="169.254.123.252")
+    parser.add_argument("--port", type=int, default=53)
+    parser.add_argument("--queries", default=None,
+                        help="query file, one 'name TYPE' per line (default: a built-in deeznutts.local mix)")
+    parser.add_argument("--qps", type=float, default=None,
+                        help="target queries per second (default: as fast as answers come back)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to send for")
+    parser.add_argument("--max-outstanding", type=int, default=100, help="queries in flight at most")
+    parser.add_argument("--timeout", type=float, default=2.0, help="seconds before a query counts as lost")
+    parser.add_argument("--sockets", type=int, default=4)
+    parser.add_argument("--stand-in", action="store_true",
+                        help="serve the vm1-dns zones from stand_in_dns.py on 127.0.0.1 and load that instead")
+    parser.add_argument("--output", default=None, help="write the report as JSON to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    queries = load_queries(args.queries) if args.queries else [
+        (name, TYPE_CODES[rtype]) for name, rtype in DEFAULT_MIX
+    ]
+
+    stand_in = None
+    if args.stand_in:
+        args.server = "127.0.0.1"
+        args.port = args.port if args.port != 53 else 15353
+        ready = multiprocessing.Event()
+        stand_in = multiprocessing.Process(target=run_stand_in, args=(args.server, args.port, ready), daemon=True)
+        stand_in.start()
+        ready.wait(5)
+        print(f"🧪 Stand-in authoritative server on {args.server}:{args.port}")
+
+    mode = f"{args.qps:g} qps target" if args.qps else f"as fast as possible, {args.max_outstanding} outstanding"
+    print(f"🚀 {len(queries)} distinct queries to {args.server}:{args.port} for {args.duration:g}s ({mode})")
+    generator = LoadGenerator(args.server, args.port, queries, args.qps, args.duration,
+                              args.max_outstanding, args.timeout, args.sockets)
+    try:
+        result = asyncio.run(generator.run())
+    finally:
+        if stand_in is not None:
+            stand_in.terminate()
+            stand_in.join(2)
+
+    latency = result["latency_ms"]
+    print(f"📊 Sent {result['sent']}, completed {result['completed']}, lost {result['lost']} "
+          f"({result['loss_rate']:.2%}), {result['unexpected']} unexpected")
+    print(f"📊 Achieved {result['achieved_qps']:,.1f} qps"
+          + (f" of {args.qps:g} targeted ({result['throttled']} sends held back)" if args.qps else ""))
+    print(f"⏱ Latency ms: mean {latency['mean']}  p50 {latency['p50']}  p90 {latency['p90']}  "
+          f"p99 {latency['p99']}  p999 {latency['p999']}  max {latency['max']}")
+    print("📋 RCODEs: " + (", ".join(f"{name} {count}" for name, count in result["rcodes"].items()) or "none"))
+
+    if args.output:
+        report = {
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "host": {"python": platform.python_version(), "platform": platform.platform(),
+                     "cpus": os.cpu_count()},
+            "config": vars(args),
+            "result": result,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+import functools
+import random
+import socket
+import struct
+
+# Record types and classes used by the client
+TYPE_A = 1
+TYPE_NS = 2
+TYPE_CNAME = 5
+TYPE_SOA = 6
+TYPE_PTR = 12
+TYPE_MX = 15
+TYPE_TXT = 16
+TYPE_AAAA = 28
+TYPE_OPT = 41
+CLASS_IN = 1
+
+TYPE_NAMES = {TYPE_A: "A", TYPE_NS: "NS", TYPE_CNAME: "CNAME", TYPE_SOA: "SOA", TYPE_PTR: "PTR",
+              TYPE_MX: "MX", TYPE_TXT: "TXT", TYPE_AAAA: "AAAA", TYPE_OPT: "OPT"}
+
+# Header flags
+FLAG_QR = 0x8000  # response
+FLAG_AA = 0x0400  # authoritative answer
+FLAG_TC = 0x0200  # truncated
+FLAG_RD = 0x0100  # recursion desired
+
+RCODE_NOERROR = 0
+RCODE_FORMERR = 1
+RCODE_NXDOMAIN = 3
+RCODE_NAMES = {0: "NOERROR", 1: "FORMERR", 2: "SERVFAIL", 3: "NXDOMAIN", 4: "NOTIMP", 5: "REFUSED",
+               16: "BADVERS"}
+
+HEADER = struct.Struct("!HHHHHH")
+QUESTION = struct.Struct("!HH")
+RR_FIXED = struct.Struct("!HHIH")
+SOA_FIXED = struct.Struct("!IIIII")
+UINT16 = struct.Struct("!H")
+
+# Compression pointers a name may follow before we call it a loop
+MAX_POINTERS = 32
+MAX_NAME_LENGTH = 255
+
+# Largest answer a plain (non-EDNS) UDP message may carry
+UDP_LIMIT = 512
+
+
+def opt_record(payload):
+    """EDNS0 OPT pseudo-record: root name, UDP payload size in the class field, no options"""
+    return b"\x00" + RR_FIXED.pack(TYPE_OPT, payload, 0, 0)
+
+
+class DNSError(ValueError):
+    """The server sent something that is not a valid DNS message"""
+
+
+def encode_name(name):
+    """Domain name in wire format (length-prefixed labels)"""
+    out = b""
+    for label in name.strip(".").split("."):
+        if label:
+            raw = label.encode("idna") if not label.isascii() else label.encode()
+            if len(raw) > 63:
+                raise ValueError(f"label too long: {label[:20]}...")
+            out += bytes((len(raw),)) + raw
+    return out + b"\x00"
+
+
+class QueryTemplate:
+    """A query with everything but the transaction ID encoded once
+
+    Sending the same question again (retries, load tests, polling) only
+    prepends two bytes to the stored body.
+    """
+
+    __slots__ = ("name", "qtype", "body")
+
+    def __init__(self, name, qtype=TYPE_A, recursion=True, payload=None):
+        self.name = name
+        self.qtype = qtype
+        flags = FLAG_RD if recursion else 0
+        # With a payload size the query carries an EDNS0 OPT record in the additional section
+        self.body = (HEADER.pack(0, flags, 1, 0, 0, 1 if payload else 0)[2:]
+                     + encode_name(name) + QUESTION.pack(qtype, CLASS_IN)
+                     + (opt_record(payload) if payload else b""))
+
+    def packet(self, txid):
+        return txid.to_bytes(2, "big") + self.body
+
+
+@functools.lru_cache(maxsize=4096)
+def query_template(name, qtype=TYPE_A, recursion=True, payload=None):
+    return QueryTemplate(name, qtype, recursion, payload)
+
+
+def build_query(name, qtype=TYPE_A, txid=None, recursion=True, payload=None):
+    """A one-question query packet, EDNS0 when a UDP payload size is given"""
+    if txid is None:
+        txid = random.getrandbits(16)
+    return query_template(name, qtype, recursion, payload).packet(txid)
+
+
+def read_name(view, offset, names=None):
+    """Decode the name at offset, following compression pointers
+
+    Returns the name (lowercase, no trailing dot) and the offset just
+    after it in the original position. With a names dict (one per
+    message) every decoded name and pointer target is remembered by
+    offset, so a suffix that many records point to is decoded once.
+    """
+    labels = []
+    marks = [(offset, 0)] if names is not None else ()
+    size = len(view)
+    end = None
+    jumps = 0
+    length_total = 0
+    while True:
+        if offset >= size:
+            raise DNSError("name runs past the end of the message")
+        length = view[offset]
+        if length >= 0xC0:
+            if offset + 1 >= size:
+                raise DNSError("truncated compression pointer")
+            if end is None:
+                end = offset + 2
+            jumps += 1
+            if jumps > MAX_POINTERS:
+                raise DNSError("compression pointer loop")
+            offset = ((length & 0x3F) << 8) | view[offset + 1]
+            if names is not None:
+                known = names.get(offset)
+                if known is not None:
+                    if known:
+                        labels.append(known)
+                    break
+                marks.append((offset, len(labels)))
+            continue
+        if length > 63:
+            raise DNSError(f"unsupported label type {length:#x}")
+        offset += 1
+        if length == 0:
+            break
+        length_total += length + 1
+        if length_total > MAX_NAME_LENGTH or offset + length > size:
+            raise DNSError("name too long")
+        labels.append(str(view[offset:offset + length], "latin-1").lower())
+        offset += length
+    name = ".".join(labels)
+    for mark, index in marks:
+        names[mark] = ".".join(labels[index:]) if index else name
+    return name, end if end is not None else offset
+
+
+# Record data, one small class per type
+
+class A:
+    __slots__ = ("address",)
+
+    def __init__(self, address):
+        self.address = address
+
+    def __str__(self):
+        return self.address
+
+    def to_wire(self, writer):
+        writer.buf += socket.inet_aton(self.address)
+
+
+class AAAA(A):
+    __slots__ = ()
+
+    def to_wire(self, writer):
+        writer.buf += socket.inet_pton(socket.AF_INET6, self.address)
+
+
+class CNAME:
+    __slots__ = ("target",)
+
+    def __init__(self, target):
+        self.target = target
+
+    def __str__(self):
+        return self.target + "."
+
+    def to_wire(self, writer):
+        writer.name(self.target)
+
+
+class NS(CNAME):
+    __slots__ = ()
+
+
+class PTR(CNAME):
+    __slots__ = ()
+
+
+class MX:
+    __slots__ = ("preference", "exchange")
+
+    def __init__(self, preference, exchange):
+        self.preference = preference
+        self.exchange = exchange
+
+    def __str__(self):
+        return f"{self.preference} {self.exchange}."
+
+    def to_wire(self, writer):
+        writer.buf += UINT16.pack(self.preference)
+        writer.name(self.exchange)
+
+
+class TXT:
+    __slots__ = ("strings",)
+
+    def __init__(self, strings):
+        self.strings = strings
+
+    def __str__(self):
+        return " ".join('"' + s.decode("latin-1").replace('"', '\\"') + '"' for s in self.strings)
+
+    def to_wire(self, writer):
+        for string in self.strings:
+            writer.buf += bytes((len(string),)) + string
+
+
+class SOA:
+    __slots__ = ("mname", "rname", "serial", "refresh", "retry", "expire", "minimum")
+
+    def __init__(self, mname, rname, serial, refresh, retry, expire, minimum):
+        self.mname = mname
+        self.rname = rname
+        self.serial = serial
+        self.refresh = refresh
+        self.retry = retry
+        self.expire = expire
+        self.minimum = minimum
+
+    def __str__(self):
+        return (f"{self.mname}. {self.rname}. {self.serial} {self.refresh} "
+                f"{self.retry} {self.expire} {self.minimum}")
+
+    def to_wire(self, writer):
+        writer.name(self.mname)
+        writer.name(self.rname)
+        writer.buf += SOA_FIXED.pack(self.serial, self.refresh, self.retry, self.expire, self.minimum)
+
+
+class Unknown:
+    """Record data of a type we do not decode, kept as bytes"""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return f"\\# {len(self.data)} {self.data.hex()}"
+
+    def to_wire(self, writer):
+        writer.buf += self.data
+
+
+def decode_a(view, offset, rdlength, names):
+    if rdlength != 4:
+        raise DNSError("A record is not 4 bytes")
+    return A(f"{view[offset]}.{view[offset + 1]}.{view[offset + 2]}.{view[offset + 3]}")
+
+
+def decode_aaaa(view, offset, rdlength, names):
+    if rdlength != 16:
+        raise DNSError("AAAA record is not 16 bytes")
+    return AAAA(socket.inet_ntop(socket.AF_INET6, view[offset:offset + 16]))
+
+
+def decode_name_rdata(cls):
+    def decode(view, offset, rdlength, names):
+        return cls(read_name(view, offset, names)[0])
+    return decode
+
+
+def decode_mx(view, offset, rdlength, names):
+    if rdlength < 3:
+        raise DNSError("truncated MX record")
+    return MX(UINT16.unpack_from(view, offset)[0], read_name(view, offset + 2, names)[0])
+
+
+def decode_txt(view, offset, rdlength, names):
+    strings = []
+    end = offset + rdlength
+    while offset < end:
+        length = view[offset]
+        offset += 1
+        if offset + length > end:
+            raise DNSError("TXT string runs past its record")
+        strings.append(bytes(view[offset:offset + length]))
+        offset += length
+    return TXT(tuple(strings))
+
+
+def decode_soa(view, offset, rdlength, names):
+    mname, pos = read_name(view, offset, names)
+    rname, pos = read_name(view, pos, names)
+    if pos + SOA_FIXED.size > offset + rdlength:
+        raise DNSError("truncated SOA record")
+    return SOA(mname, rname, *SOA_FIXED.unpack_from(view, pos))
+
+
+RDATA_DECODERS = {
+    TYPE_A: decode_a,
+    TYPE_AAAA: decode_aaaa,
+    TYPE_CNAME: decode_name_rdata(CNAME),
+    TYPE_NS: decode_name_rdata(NS),
+    TYPE_PTR: decode_name_rdata(PTR),
+    TYPE_MX: decode_mx,
+    TYPE_TXT: decode_txt,
+    TYPE_SOA: decode_soa,
+}
+
+
+class ResourceRecord:
+    __slots__ = ("name", "rtype", "rclass", "ttl", "rdata")
+
+    def __init__(self, name, rtype, rclass, ttl, rdata):
+        self.name = name
+        self.rtype = rtype
+        self.rclass = rclass
+        self.ttl = ttl
+        self.rdata = rdata
+
+    def __str__(self):
+        rtype = TYPE_NAMES.get(self.rtype, f"TYPE{self.rtype}")
+        return f"{self.name}. {self.ttl} IN {rtype} {self.rdata}"
+
+
+class DNSMessage:
+    """A parsed DNS message: header fields, the question and the records"""
+
+    __slots__ = ("txid", "flags", "question", "answers", "authority", "additional")
+
+    def __init__(self, txid, flags, question, answers, authority, additional):
+        self.txid = txid
+        self.flags = flags
+        self.question = question      # (name, qtype, qclass) or None
+        self.answers = answers        # [ResourceRecord]
+        self.authority = authority
+        self.additional = additional
+
+    @property
+    def opt(self):
+        """The EDNS0 OPT record, None when the sender did not use EDNS"""
+        for record in self.additional:
+            if record.rtype == TYPE_OPT:
+                return record
+        return None
+
+    @property
+    def rcode(self):
+        opt = self.opt
+        # EDNS0 keeps the upper 8 bits of a 12-bit RCODE in the OPT TTL
+        extended = (opt.ttl >> 24) << 4 if opt is not None else 0
+        return extended | self.flags & 0x000F
+
+    @property
+    def payload(self):
+        """UDP payload size the sender can receive"""
+        opt = self.opt
+        return max(UDP_LIMIT, opt.rclass) if opt is not None else UDP_LIMIT
+
+    @property
+    def truncated(self):
+        return bool(self.flags & FLAG_TC)
+
+    def addresses(self, rtype=TYPE_A):
+        return [record.rdata.address for record in self.answers if record.rtype == rtype]
+
+
+def parse_header(data):
+    """(txid, flags, qdcount, ancount, nscount, arcount)"""
+    if len(data) < HEADER.size:
+        raise DNSError("message shorter than a DNS header")
+    return HEADER.unpack_from(data, 0)
+
+
+def parse_message(data):
+    """Decode a whole message straight from the buffer it arrived in
+
+    data may be bytes, a bytearray or a memoryview; nothing is copied
+    except the decoded field values themselves.
+    """
+    view = memoryview(data)
+    txid, flags, qdcount, ancount, nscount, arcount = parse_header(view)
+    size = len(view)
+    names = {}
+    offset = HEADER.size
+    question = None
+    for _ in range(qdcount):
+        name, offset = read_name(view, offset, names)
+        if offset + QUESTION.size > size:
+            raise DNSError("truncated question")
+        qtype, qclass = QUESTION.unpack_from(view, offset)
+        offset += QUESTION.size
+        if question is None:
+            question = (name, qtype, qclass)
+
+    decoders = RDATA_DECODERS
+    sections = []
+    for count in (ancount, nscount, arcount):
+        records = []
+        for _ in range(count):
+            name, offset = read_name(view, offset, names)
+            if offset + RR_FIXED.size > size:
+                raise DNSError("truncated resource record")
+            rtype, rclass, ttl, rdlength = RR_FIXED.unpack_from(view, offset)
+            offset += RR_FIXED.size
+            if offset + rdlength > size:
+                raise DNSError("record data runs past the end of the message")
+            decode = decoders.get(rtype)
+            if decode is None:
+                rdata = Unknown(bytes(view[offset:offset + rdlength]))
+            else:
+                rdata = decode(view, offset, rdlength, names)
+            records.append(ResourceRecord(name, rtype, rclass, ttl, rdata))
+            offset += rdlength
+        sections.append(records)
+    return DNSMessage(txid, flags, question, *sections)
+
+
+class MessageWriter:
+    """Builds a message, compressing each name against those already written
+
+    Used by servers; records go in with record() after the question and
+    the header counts are filled in by finish().
+    """
+
+    def __init__(self, txid, flags):
+        self.txid = txid
+        self.flags = flags
+        self.buf = bytearray(HEADER.size)
+        self.names = {}  # lowercase suffix -> offset
+        self.counts = [0, 0, 0, 0]
+
+    def name(self, name):
+        labels = name.strip(".").split(".") if name.strip(".") else []
+        for index, label in enumerate(labels):
+            suffix = ".".join(labels[index:]).lower()
+            offset = self.names.get(suffix)
+            if offset is not None:
+                self.buf += UINT16.pack(0xC000 | offset)
+                return
+            if len(self.buf) < 0x4000:
+                self.names[suffix] = len(self.buf)
+            raw = label.encode()
+            if len(raw) > 63:
+                raise ValueError(f"label too long: {label[:20]}...")
+            self.buf += bytes((len(raw),)) + raw
+        self.buf += b"\x00"
+
+    def question(self, name, qtype, qclass=CLASS_IN):
+        self.name(name)
+        self.buf += QUESTION.pack(qtype, qclass)
+        self.counts[0] += 1
+
+    def record(self, section, record):
+        """Append a ResourceRecord to section 1 (answer), 2 (authority) or 3 (additional)"""
+        self.name(record.name)
+        fixed = len(self.buf)
+        self.buf += RR_FIXED.pack(record.rtype, record.rclass, record.ttl, 0)
+        record.rdata.to_wire(self)
+        RR_FIXED.pack_into(self.buf, fixed, record.rtype, record.rclass, record.ttl,
+                           len(self.buf) - fixed - RR_FIXED.size)
+        self.counts[section] += 1
+
+    def finish(self):
+        HEADER.pack_into(self.buf, 0, self.txid, self.flags, *self.counts)
+        return bytes(self.buf)
@@ -0,0 +1,20 @@
+# Percentiles reported by latency_summary, by name
+SUMMARY_PERCENTILES = (("p50", 0.50), ("p90", 0.90), ("p99", 0.99), ("p999", 0.999))
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def latency_summary(latencies):
+    """Mean, percentiles and max of latencies in seconds, reported in milliseconds"""
+    ordered = sorted(latencies)
+    summary = {"mean": sum(ordered) / len(ordered) if ordered else None}
+    for name, fraction in SUMMARY_PERCENTILES:
+        summary[name] = percentile(ordered, fraction)
+    summary["max"] = ordered[-1] if ordered else None
+    return {name: round(value * 1000, 3) if value is not None else None for name, value in summary.items()}
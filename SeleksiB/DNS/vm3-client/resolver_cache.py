@@ -0,0 +1,148 @@
+import collections
+import threading
+import time
+
+from dns_wire import RCODE_NOERROR, RCODE_NXDOMAIN, TYPE_SOA
+
+# Upper bounds on how long anything is kept, whatever the server says.
+# The deeznutts.local zone asks for a week of negative caching; like
+# bind9's max-ncache-ttl we stop at three hours.
+MAX_TTL = 86400
+MAX_NEGATIVE_TTL = 3 * 3600
+
+
+def negative_ttl(message):
+    """How long an NXDOMAIN/NODATA answer may be cached (RFC 2308)
+
+    The lower of the authority SOA record's TTL and its MINIMUM field,
+    None when the answer carries no SOA and so must not be cached.
+    """
+    for record in message.authority:
+        if record.rtype == TYPE_SOA:
+            return min(record.ttl, record.rdata.minimum)
+    return None
+
+
+class CacheEntry:
+    __slots__ = ("addresses", "rcode", "stored_at", "expires_at", "hits", "prefetching")
+
+    def __init__(self, addresses, rcode, ttl, now):
+        self.addresses = addresses
+        self.rcode = rcode
+        self.stored_at = now
+        self.expires_at = now + ttl
+        self.hits = 0
+        self.prefetching = False
+
+    @property
+    def negative(self):
+        return not self.addresses
+
+    def ttl_left(self, now=None):
+        return max(0, int(self.expires_at - (time.monotonic() if now is None else now)))
+
+
+class ResolverCache:
+    """Answers kept until their TTL runs out, at most max_entries in LRU order
+
+    Positive answers live for the lowest TTL in the answer section, the
+    CNAMEs that led to the addresses included; NXDOMAIN and NODATA for
+    the SOA minimum. An entry that was used at least prefetch_hits times
+    and has less than prefetch_fraction of its lifetime left is reported
+    by lookup() as due for a prefetch, so the resolver can refresh it in
+    the background before clients miss.
+    """
+
+    def __init__(self, max_entries=10000, max_ttl=MAX_TTL, max_negative_ttl=MAX_NEGATIVE_TTL,
+                 prefetch_fraction=0.1, prefetch_hits=3):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self.max_negative_ttl = max_negative_ttl
+        self.prefetch_fraction = prefetch_fraction
+        self.prefetch_hits = prefetch_hits
+        self.entries = collections.OrderedDict()  # (name, qtype) -> CacheEntry
+        self.lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.prefetches = 0
+
+    def lookup(self, name, qtype, now=None):
+        """(entry, prefetch) for a fresh entry, (None, False) on a miss
+
+        prefetch is True at most once per entry lifetime, for the caller
+        that should refresh it.
+        """
+        now = time.monotonic() if now is None else now
+        key = (name.strip(".").lower(), qtype)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, False
+            if entry.expires_at <= now:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None, False
+            self.entries.move_to_end(key)
+            entry.hits += 1
+            self.hits += 1
+            if entry.negative:
+                self.negative_hits += 1
+            lifetime = entry.expires_at - entry.stored_at
+            prefetch = (not entry.prefetching and entry.hits >= self.prefetch_hits
+                        and entry.expires_at - now <= lifetime * self.prefetch_fraction)
+            if prefetch:
+                entry.prefetching = True
+                self.prefetches += 1
+            return entry, prefetch
+
+    def store(self, name, qtype, message, now=None):
+        """Cache a response message, returns the entry (None if it may not be kept)"""
+        addresses = message.addresses(qtype)
+        if message.rcode == RCODE_NOERROR and addresses:
+            # The addresses are only valid while every CNAME on the way to them is
+            ttl = min(min(record.ttl for record in message.answers), self.max_ttl)
+        elif message.rcode == RCODE_NXDOMAIN or message.rcode == RCODE_NOERROR:
+            ttl = negative_ttl(message)
+            if ttl is None:
+                return None
+            ttl = min(ttl, self.max_negative_ttl)
+        else:
+            # SERVFAIL, REFUSED, ...: ask again next time
+            return None
+        if ttl <= 0:
+            return None
+
+        now = time.monotonic() if now is None else now
+        key = (name.strip(".").lower(), qtype)
+        entry = CacheEntry(addresses, message.rcode, ttl, now)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "prefetches": self.prefetches,
+            }
@@ -0,0 +1,640 @@
+#!/usr/bin/env python3
+"""Authoritative DNS server that stands in for bind9 on VM1
+
+Serves the zones named in vm1-dns/named.conf.local from the zone files
+next to it, so the client tools can be tried and load-tested on
+loopback. Every answer the zones can give is built into wire format when
+they are loaded; a query is answered by one dictionary lookup on its raw
+question bytes plus copying its ID and question into the reply. Each
+worker process owns a SO_REUSEPORT socket and drains every queued
+datagram per wakeup. SIGHUP, or a zone file changing on disk, reloads
+the zones in the background while the old answers keep being served.
+
+    python3 stand_in_dns.py --port 15353 --workers 2
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import selectors
+import signal
+import socket
+import struct
+import threading
+import time
+
+from dns_wire import (
+    AAAA,
+    CLASS_IN,
+    CNAME,
+    FLAG_AA,
+    FLAG_QR,
+    FLAG_RD,
+    FLAG_TC,
+    MX,
+    NS,
+    PTR,
+    QUESTION,
+    RCODE_FORMERR,
+    RCODE_NXDOMAIN,
+    SOA,
+    TXT,
+    TYPE_A,
+    TYPE_AAAA,
+    TYPE_CNAME,
+    TYPE_MX,
+    TYPE_NAMES,
+    TYPE_NS,
+    TYPE_PTR,
+    TYPE_SOA,
+    TYPE_TXT,
+    UDP_LIMIT,
+    A,
+    DNSError,
+    MessageWriter,
+    ResourceRecord,
+    encode_name,
+    opt_record,
+    parse_message,
+)
+
+ZONE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vm1-dns")
+NAMED_CONF = os.path.join(ZONE_DIR, "named.conf.local")
+
+RCODE_NOTIMP = 4
+RCODE_REFUSED = 5
+
+# Largest UDP answer we send to EDNS0 clients, whatever they offer (DNS flag day 2020)
+SERVER_PAYLOAD = 1232
+SERVER_OPT = opt_record(SERVER_PAYLOAD)
+
+# Datagrams handled per wakeup before checking for reloads again
+BATCH = 256
+
+# Dynamically built answers (NXDOMAIN, odd types) kept per worker
+MAX_DYNAMIC = 10000
+
+# Types answered from the precompiled table even when the name has none
+COMMON_TYPES = (TYPE_A, TYPE_AAAA, TYPE_NS, TYPE_CNAME, TYPE_SOA, TYPE_PTR, TYPE_MX, TYPE_TXT)
+
+TYPE_CODES = {name: code for code, name in TYPE_NAMES.items()}
+TTL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+class ZoneError(ValueError):
+    """A zone file we cannot load"""
+
+
+def parse_ttl(text):
+    """Seconds from "3600" or bind's "1h30m" form"""
+    if text.isdigit():
+        return int(text)
+    parts = re.fullmatch(r"(?:\d+[smhdwSMHDW])+", text)
+    if not parts:
+        raise ZoneError(f"bad TTL {text!r}")
+    return sum(int(value) * TTL_UNITS[unit.lower()] for value, unit in re.findall(r"(\d+)([a-zA-Z])", text))
+
+
+def zone_files(named_conf):
+    """[(origin, path)] for every zone in a named.conf, paths looked up next to it if absent"""
+    with open(named_conf) as f:
+        conf = f.read()
+    zones = []
+    for origin, path in re.findall(r'zone\s+"([^"]+)"\s*\{[^}]*?file\s+"([^"]+)"', conf):
+        if not os.path.exists(path):
+            path = os.path.join(os.path.dirname(named_conf), os.path.basename(path))
+        zones.append((origin.strip(".").lower(), path))
+    return zones
+
+
+def zone_lines(text):
+    """Logical lines of a master file: comments dropped, ( ... ) joined"""
+    pending = []
+    depth = 0
+    starts_blank = False
+    for raw in text.splitlines():
+        line = []
+        quoted = False
+        for char in raw:
+            if char == '"':
+                quoted = not quoted
+            elif char == ";" and not quoted:
+                break
+            elif char in "()" and not quoted:
+                depth += 1 if char == "(" else -1
+                char = " "
+            line.append(char)
+        line = "".join(line)
+        if not pending:
+            starts_blank = line[:1] in (" ", "\t")
+        pending.append(line)
+        if depth == 0:
+            joined = " ".join(pending)
+            pending = []
+            if joined.strip():
+                yield starts_blank, joined
+    if depth:
+        raise ZoneError("unbalanced parentheses")
+
+
+class Zone:
+    """Records of one zone: {name: {type: (ttl, [rdata])}}"""
+
+    def __init__(self, origin, path):
+        self.origin = origin
+        self.path = path
+        self.nodes = {}
+        self.soa = None
+        self.soa_ttl = 0
+        self.load()
+
+    def absolute(self, name, current):
+        if name == "@":
+            return current
+        if name.endswith("."):
+            return name[:-1].lower()
+        return f"{name}.{current}".lower() if current else name.lower()
+
+    def load(self):
+        with open(self.path) as f:
+            text = f.read()
+        origin = self.origin
+        default_ttl = None
+        owner = None
+        for starts_blank, line in zone_lines(text):
+            fields = re.findall(r'"(?:[^"\\]|\\.)*"|\S+', line)
+            if fields[0].upper() == "$TTL":
+                default_ttl = parse_ttl(fields[1])
+                continue
+            if fields[0].upper() == "$ORIGIN":
+                origin = self.absolute(fields[1], self.origin)
+                continue
+            if fields[0].startswith("$"):
+                raise ZoneError(f"{self.path}: {fields[0]} is not supported")
+            if not starts_blank:
+                owner = self.absolute(fields.pop(0), origin)
+            if owner is None:
+                raise ZoneError(f"{self.path}: record without an owner")
+            ttl = default_ttl
+            while fields and (fields[0].upper() in ("IN", "CH", "HS") or fields[0][:1].isdigit()):
+                field = fields.pop(0)
+                if field.upper() != "IN" and not field[:1].isdigit():
+                    raise ZoneError(f"{self.path}: class {field} is not supported")
+                if field[:1].isdigit():
+                    ttl = parse_ttl(field)
+            if not fields:
+                raise ZoneError(f"{self.path}: record for {owner} has no type")
+            rtype = fields.pop(0).upper()
+            rdata = self.rdata(rtype, fields, origin)
+            if rtype == "SOA":
+                self.soa = rdata
+                if ttl is None:
+                    # RFC 2308: the SOA minimum is the default TTL when $TTL is missing
+                    ttl = default_ttl = rdata.minimum
+                self.soa_ttl = ttl
+            if ttl is None:
+                raise ZoneError(f"{self.path}: no TTL for {owner} {rtype}")
+            code = TYPE_CODES[rtype]
+            rrset = self.nodes.setdefault(owner, {}).setdefault(code, (ttl, []))
+            rrset[1].append(rdata)
+        if self.soa is None or self.origin not in self.nodes:
+            raise ZoneError(f"{self.path}: no SOA at {self.origin}")
+
+    def rdata(self, rtype, fields, origin):
+        try:
+            if rtype == "A":
+                socket.inet_aton(fields[0])
+                return A(fields[0])
+            if rtype == "AAAA":
+                return AAAA(socket.inet_ntop(socket.AF_INET6, socket.inet_pton(socket.AF_INET6, fields[0])))
+            if rtype in ("NS", "CNAME", "PTR"):
+                return {"NS": NS, "CNAME": CNAME, "PTR": PTR}[rtype](self.absolute(fields[0], origin))
+            if rtype == "MX":
+                return MX(int(fields[0]), self.absolute(fields[1], origin))
+            if rtype == "TXT":
+                return TXT(tuple(field.strip('"').encode() for field in fields))
+            if rtype == "SOA":
+                mname, rname = (self.absolute(name, origin) for name in fields[:2])
+                return SOA(mname, rname, int(fields[2]), *(parse_ttl(field) for field in fields[3:7]))
+        except (IndexError, ValueError, OSError) as e:
+            raise ZoneError(f"{self.path}: bad {rtype} record {' '.join(fields)!r}: {e}")
+        raise ZoneError(f"{self.path}: type {rtype} is not supported")
+
+    def contains(self, name):
+        return name == self.origin or name.endswith("." + self.origin)
+
+    def exists(self, name):
+        """True for names with records and for empty non-terminals above them"""
+        if name in self.nodes:
+            return True
+        suffix = "." + name
+        return any(node.endswith(suffix) for node in self.nodes)
+
+    def rrset(self, name, rtype):
+        ttl, rdatas = self.nodes.get(name, {}).get(rtype, (0, []))
+        return [ResourceRecord(name, rtype, CLASS_IN, ttl, rdata) for rdata in rdatas]
+
+    def negative_soa(self):
+        # RFC 2308: negative answers carry the SOA with TTL min(SOA TTL, MINIMUM)
+        return ResourceRecord(self.origin, TYPE_SOA, CLASS_IN, min(self.soa_ttl, self.soa.minimum), self.soa)
+
+    def resolve(self, name, qtype):
+        """(rcode, answers, authority, additional) as bind would give them"""
+        if not self.exists(name):
+            return RCODE_NXDOMAIN, [], [self.negative_soa()], []
+        answers = []
+        target = name
+        for _ in range(8):
+            records = self.rrset(target, qtype)
+            if records or qtype == TYPE_CNAME:
+                answers += records
+                break
+            alias = self.rrset(target, TYPE_CNAME)
+            if not alias:
+                break
+            answers += alias
+            target = alias[0].rdata.target
+            if not self.contains(target):
+                break
+        if not answers:
+            return 0, [], [self.negative_soa()], []
+        additional = []
+        for record in answers:
+            # Glue for name servers and mail exchangers inside the zone
+            host = getattr(record.rdata, "exchange", None) or (
+                record.rdata.target if record.rtype == TYPE_NS else None)
+            if host and host in self.nodes:
+                additional += self.rrset(host, TYPE_A) + self.rrset(host, TYPE_AAAA)
+        return 0, answers, [], additional
+
+
+def encode_response(name, qtype, rcode, answers=(), authority=(), additional=()):
+    """Full response with ID 0 and RD clear; the caller patches both in"""
+    writer = MessageWriter(0, FLAG_QR | FLAG_AA | rcode)
+    writer.question(name, qtype)
+    for section, records in ((1, answers), (2, authority), (3, additional)):
+        for record in records:
+            writer.record(section, record)
+    return writer.finish()
+
+
+class Answer:
+    """One precompiled response, split around the question it echoes
+
+    Each heads pair holds header bytes 2..12 (flags and counts) with the
+    query's RD bit clear and set; tail is everything after the question.
+    The truncated forms (TC set, nothing after the question) and the EDNS
+    forms (one more additional record, the OPT appended) are ready too.
+    """
+
+    __slots__ = ("full", "full_edns", "truncated", "truncated_edns", "tail", "size", "rcode")
+
+    def __init__(self, wire, question_end, rcode):
+        flags, qdcount, ancount, nscount, arcount = struct.unpack_from("!HHHHH", wire, 2)
+        self.rcode = rcode
+        self.size = len(wire)
+        self.tail = wire[question_end:]
+        self.full = self.heads(flags, qdcount, ancount, nscount, arcount)
+        self.full_edns = self.heads(flags, qdcount, ancount, nscount, arcount + 1)
+        self.truncated = self.heads(flags | FLAG_TC, qdcount, 0, 0, 0)
+        self.truncated_edns = self.heads(flags | FLAG_TC, qdcount, 0, 0, 1)
+
+    @staticmethod
+    def heads(flags, *counts):
+        return tuple(struct.pack("!HHHHH", flags | rd, *counts) for rd in (0, FLAG_RD))
+
+    def reply(self, data, question, payload, tcp):
+        """The response to query data; payload is its EDNS0 size, None without EDNS"""
+        rd = data[2] & 0x01
+        if payload is None:
+            if tcp or self.size <= UDP_LIMIT:
+                return data[:2] + self.full[rd] + question + self.tail
+            return data[:2] + self.truncated[rd] + question
+        if tcp or self.size + len(SERVER_OPT) <= min(payload, SERVER_PAYLOAD):
+            return data[:2] + self.full_edns[rd] + question + self.tail + SERVER_OPT
+        return data[:2] + self.truncated_edns[rd] + question + SERVER_OPT
+
+
+def question_key(name, qtype):
+    """The lookup key: the question as it appears on the wire, lowercased"""
+    return (encode_name(name) + QUESTION.pack(qtype, CLASS_IN)).lower()
+
+
+def compile_answer(name, qtype, rcode, *sections):
+    wire = encode_response(name, qtype, rcode, *sections)
+    return Answer(wire, 12 + len(encode_name(name)) + QUESTION.size, rcode)
+
+
+class ZoneSet:
+    """Every zone from named.conf plus the answer table compiled from them"""
+
+    def __init__(self, named_conf):
+        self.named_conf = named_conf
+        self.zones = [Zone(origin, path) for origin, path in zone_files(named_conf)]
+        if not self.zones:
+            raise ZoneError(f"{named_conf}: no zones")
+        self.mtimes = self.file_mtimes()
+        self.answers = {}
+        for zone in self.zones:
+            names = set(zone.nodes)
+            for node in zone.nodes:
+                # Empty non-terminals answer NODATA, not NXDOMAIN
+                labels = node.split(".")
+                for index in range(1, len(labels)):
+                    parent = ".".join(labels[index:])
+                    if zone.contains(parent):
+                        names.add(parent)
+            for name in names:
+                types = set(COMMON_TYPES) | set(zone.nodes.get(name, {}))
+                for qtype in types:
+                    self.answers[question_key(name, qtype)] = compile_answer(name, qtype, *zone.resolve(name, qtype))
+
+    def file_mtimes(self):
+        paths = [self.named_conf] + [zone.path for zone in self.zones]
+        return {path: os.stat(path).st_mtime for path in paths}
+
+    def changed(self):
+        try:
+            paths = [self.named_conf] + [zone.path for zone in self.zones]
+            return any(os.stat(path).st_mtime != self.mtimes.get(path) for path in paths)
+        except OSError:
+            return False
+
+    def zone_for(self, name):
+        best = None
+        for zone in self.zones:
+            if zone.contains(name) and (best is None or len(zone.origin) > len(best.origin)):
+                best = zone
+        return best
+
+    def describe(self):
+        return ", ".join(f"{zone.origin} (serial {zone.soa.serial}, {sum(len(rrsets) for rrsets in zone.nodes.values())} "
+                         f"rrsets)" for zone in self.zones)
+
+
+class StandInDNS:
+    """Answers from a ZoneSet over UDP and TCP, reloading it when asked"""
+
+    def __init__(self, host="127.0.0.1", port=53, named_conf=NAMED_CONF, workers=1, watch=1.0, quiet=False):
+        self.host = host
+        self.port = port
+        self.named_conf = named_conf
+        self.workers = workers
+        self.watch = watch
+        self.quiet = quiet
+        self.zoneset = ZoneSet(named_conf)
+        self.answers = self.zoneset.answers
+        self.dynamic = {}
+        self.reload_requested = False
+        self.reloading = False
+        self.running = True
+        self.last_check = time.monotonic()
+
+        # Counters
+        self.queries = 0
+        self.precompiled = 0
+        self.built = 0
+        self.dropped = 0
+        self.reloads = 0
+        self.rcodes = {}
+
+    def log(self, message):
+        if not self.quiet:
+            print(message, flush=True)
+
+    # Answering
+
+    def answer(self, data, tcp=False):
+        """Reply for one query message, None when it should be ignored"""
+        self.queries += 1
+        # Fast path: standard query with one question; the name ends at the first zero byte
+        if len(data) >= 17 and not data[2] & 0xF8 and data[4:6] == b"\x00\x01":
+            end = data.find(b"\x00", 12) + 5
+            if 16 < end <= len(data):
+                payload = None
+                if end < len(data):
+                    # Only a lone EDNS0 OPT record may follow the question here
+                    if data[6:12] != b"\x00\x00\x00\x00\x00\x01" or data[end:end + 3] != b"\x00\x00\x29":
+                        return self.build(data, tcp)
+                    payload = max(UDP_LIMIT, int.from_bytes(data[end + 3:end + 5], "big"))
+                question = data[12:end]
+                entry = self.answers.get(question.lower()) or self.dynamic.get(question.lower())
+                if entry is not None:
+                    self.precompiled += 1
+                    return entry.reply(data, question, payload, tcp)
+        return self.build(data, tcp)
+
+    def build(self, data, tcp):
+        """Slow path: parse the query and make the answer, keeping it for next time"""
+        self.built += 1
+        try:
+            query = parse_message(data)
+        except DNSError:
+            if len(data) < 12:
+                return None
+            return data[:2] + struct.pack("!HHHHH", FLAG_QR | RCODE_FORMERR, 0, 0, 0, 0)
+        if query.flags & FLAG_QR:
+            return None
+        rd = query.flags & 0x0100
+        if (query.flags >> 11) & 0x0F or query.question is None:
+            return data[:2] + struct.pack("!HHHHH", FLAG_QR | rd | RCODE_NOTIMP, 0, 0, 0, 0)
+        name, qtype, qclass = query.question
+        zone = self.zoneset.zone_for(name)
+        if zone is None or qclass != CLASS_IN:
+            sections = (RCODE_REFUSED,)
+        else:
+            sections = zone.resolve(name, qtype)
+        entry = compile_answer(name, qtype, *sections)
+        if qclass == CLASS_IN:
+            if len(self.dynamic) >= MAX_DYNAMIC:
+                self.dynamic.clear()
+            self.dynamic[question_key(name, qtype)] = entry
+        opt = query.opt
+        question = encode_name(name) + QUESTION.pack(qtype, qclass)
+        return entry.reply(data, question, query.payload if opt is not None else None, tcp)
+
+    # Reloading
+
+    def request_reload(self, *_):
+        self.reload_requested = True
+
+    def reload(self):
+        try:
+            zoneset = ZoneSet(self.named_conf)
+        except (OSError, ZoneError, KeyError) as e:
+            self.log(f"⚠️ Reload failed, still serving the old zones: {e}")
+            self.zoneset.mtimes = self.zoneset.file_mtimes()
+        else:
+            # One assignment each: a query sees either the old table or the new one
+            self.zoneset = zoneset
+            self.answers = zoneset.answers
+            self.dynamic = {}
+            self.reloads += 1
+            self.log(f"🔄 [{os.getpid()}] Reloaded {zoneset.describe()}, {len(zoneset.answers)} answers")
+        finally:
+            self.reloading = False
+
+    def housekeeping(self):
+        now = time.monotonic()
+        if not self.reload_requested and self.watch and now - self.last_check >= self.watch:
+            self.last_check = now
+            self.reload_requested = self.zoneset.changed()
+        if self.reload_requested and not self.reloading:
+            self.reload_requested = False
+            self.reloading = True
+            # Compile in the background, the loop keeps answering from the old table
+            threading.Thread(target=self.reload, daemon=True).start()
+
+    # Serving
+
+    def bind(self, kind):
+        sock = socket.socket(socket.AF_INET, kind)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.workers > 1:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if kind == socket.SOCK_DGRAM:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.bind((self.host, self.port))
+        sock.setblocking(False)
+        return sock
+
+    def serve_udp(self, sock):
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        recvfrom = sock.recvfrom
+        sendto = sock.sendto
+        answer = self.answer
+        while self.running:
+            if selector.select(timeout=0.2):
+                # Drain what is queued instead of going back to select per datagram
+                for _ in range(BATCH):
+                    try:
+                        data, addr = recvfrom(UDP_LIMIT * 8)
+                    except BlockingIOError:
+                        break
+                    except OSError:
+                        continue
+                    reply = answer(data)
+                    if reply is not None:
+                        try:
+                            sendto(reply, addr)
+                        except (BlockingIOError, OSError):
+                            self.dropped += 1
+            self.housekeeping()
+        selector.close()
+
+    def serve_tcp_connection(self, conn):
+        conn.settimeout(10)
+        buffer = b""
+        try:
+            while self.running:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    return
+                buffer += chunk
+                while len(buffer) >= 2:
+                    length = struct.unpack_from("!H", buffer)[0]
+                    if len(buffer) < 2 + length:
+                        break
+                    reply = self.answer(buffer[2:2 + length], tcp=True)
+                    buffer = buffer[2 + length:]
+                    if reply is not None:
+                        conn.sendall(struct.pack("!H", len(reply)) + reply)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def serve_tcp(self, sock):
+        sock.setblocking(True)
+        sock.settimeout(0.5)
+        sock.listen(128)
+        while self.running:
+            try:
+                conn, _ = sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self.serve_tcp_connection, args=(conn,), daemon=True).start()
+
+    def stop(self, *_):
+        self.running = False
+
+    def run_worker(self, ready=None):
+        udp = self.bind(socket.SOCK_DGRAM)
+        tcp = self.bind(socket.SOCK_STREAM)
+        signal.signal(signal.SIGHUP, self.request_reload)
+        signal.signal(signal.SIGTERM, self.stop)
+        threading.Thread(target=self.serve_tcp, args=(tcp,), daemon=True).start()
+        if ready is not None:
+            ready.set()
+        try:
+            self.serve_udp(udp)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            udp.close()
+            tcp.close()
+            self.print_stats()
+
+    def run(self, ready=None):
+        self.log(f"🧪 Serving {self.zoneset.describe()} on {self.host}:{self.port} "
+                 f"(UDP+TCP, {self.workers} worker{'s' if self.workers > 1 else ''}, "
+                 f"{len(self.answers)} precompiled answers)")
+        if self.workers <= 1:
+            self.run_worker(ready)
+            return
+        children = []
+        for _ in range(self.workers):
+            started = multiprocessing.Event()
+            child = multiprocessing.Process(target=self.run_worker, args=(started,), daemon=True)
+            child.start()
+            started.wait(5)
+            children.append(child)
+        if ready is not None:
+            ready.set()
+
+        def forward(signum, _):
+            for child in children:
+                if child.pid:
+                    os.kill(child.pid, signum)
+
+        signal.signal(signal.SIGHUP, forward)
+        signal.signal(signal.SIGTERM, forward)
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            for child in children:
+                child.join(2)
+
+    def print_stats(self):
+        if self.quiet or not self.queries:
+            return
+        rate = self.precompiled / self.queries
+        print(f"📊 [{os.getpid()}] {self.queries} queries, {rate:.1%} from the precompiled table, "
+              f"{self.built} built, {self.dropped} replies dropped, {self.reloads} reloads", flush=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the VM1 zone files from a local authoritative stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=15353)
+    parser.add_argument("--named-conf", default=NAMED_CONF,
+                        help="named.conf listing the zones (zone files are looked up next to it)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes sharing the port with SO_REUSEPORT")
+    parser.add_argument("--watch", type=float, default=1.0,
+                        help="seconds between zone file change checks, 0 to reload on SIGHUP only")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = StandInDNS(args.host, args.port, args.named_conf, args.workers, args.watch)
+    server.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import collections
+import ipaddress
+import socket
+import threading
+import time
+
+# Why a connection was turned away
+BLOCKED = "blocked"
+RATE_LIMITED = "rate_limited"
+OVERLOADED = "overloaded"
+
+
+def address_key(ip):
+    """(version, integer) of an address string, IPv4-mapped IPv6 counts as IPv4"""
+    try:
+        return 4, int.from_bytes(socket.inet_aton(ip), "big")
+    except OSError:
+        address = ipaddress.ip_address(ip.split("%", 1)[0])
+        if address.version == 6 and address.ipv4_mapped is not None:
+            return 4, int(address.ipv4_mapped)
+        return address.version, int(address)
+
+
+class PrefixTrie:
+    """Binary trie of CIDR prefixes with longest-prefix-match lookup
+
+    Nodes are [child0, child1, value] lists, so a lookup is at most one
+    step per address bit (32 for IPv4, 128 for IPv6) whatever the number
+    of stored prefixes.
+    """
+
+    def __init__(self, bits):
+        self.bits = bits
+        self.root = [None, None, None]
+        self.size = 0
+
+    def insert(self, network, prefix_length, value):
+        node = self.root
+        for shift in range(self.bits - 1, self.bits - 1 - prefix_length, -1):
+            bit = (network >> shift) & 1
+            child = node[bit]
+            if child is None:
+                child = node[bit] = [None, None, None]
+            node = child
+        if node[2] is None:
+            self.size += 1
+        node[2] = value
+
+    def lookup(self, address):
+        """Value of the longest stored prefix containing address, or None"""
+        node = self.root
+        found = node[2]
+        shift = self.bits - 1
+        while shift >= 0:
+            node = node[(address >> shift) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                found = node[2]
+            shift -= 1
+        return found
+
+
+class IPFilter:
+    """Allow/block decisions for client addresses
+
+    Every listed CIDR carries an action; the most specific prefix that
+    contains the address decides, so a /24 allow can punch a hole in a /8
+    block. Addresses matching nothing get the default action.
+    """
+
+    def __init__(self, block=(), allow=(), default_allow=True):
+        self.tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        self.default_allow = default_allow
+        for cidr in block:
+            self.add(cidr, False)
+        for cidr in allow:
+            self.add(cidr, True)
+
+    def add(self, cidr, allowed):
+        network = ipaddress.ip_network(cidr.strip(), strict=False)
+        self.tries[network.version].insert(int(network.network_address), network.prefixlen, allowed)
+
+    def allowed(self, ip):
+        try:
+            version, address = address_key(ip)
+        except ValueError:
+            return self.default_allow
+        decision = self.tries[version].lookup(address)
+        return self.default_allow if decision is None else decision
+
+    def __len__(self):
+        return sum(trie.size for trie in self.tries.values())
+
+
+def load_cidr_file(path):
+    """CIDRs from a file, one per line, '#' starts a comment"""
+    with open(path) as f:
+        return [line.split("#", 1)[0].strip() for line in f if line.split("#", 1)[0].strip()]
+
+
+class TokenBucketLimiter:
+    """Per-client token buckets, at most max_clients remembered at a time
+
+    Each client may open `rate` connections per second with bursts up to
+    `burst`. Buckets live in an LRU; when it is full the least recently
+    seen client is forgotten, which only makes the limiter more lenient
+    for that client and keeps memory bounded under address floods.
+    """
+
+    def __init__(self, rate, burst=None, max_clients=65536):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.max_clients = max_clients
+        self.buckets = collections.OrderedDict()  # ip -> [tokens, last refill]
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def allow(self, ip, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            bucket = self.buckets.get(ip)
+            if bucket is None:
+                if len(self.buckets) >= self.max_clients:
+                    self.buckets.popitem(last=False)
+                    self.evictions += 1
+                bucket = self.buckets[ip] = [self.burst, now]
+            else:
+                self.buckets.move_to_end(ip)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1.0:
+                return False
+            bucket[0] -= 1.0
+            return True
+
+    def __len__(self):
+        return len(self.buckets)
+
+
+class Admission:
+    """Decides on every accepted connection before any byte of it is read
+
+    Checks, cheapest first: the IP filter, the per-client rate limit and
+    the global number of open connections. admit() returns None and takes
+    a connection slot (give it back with release()), or the reason for
+    turning the client away.
+    """
+
+    def __init__(self, ip_filter=None, limiter=None, max_connections=0):
+        self.ip_filter = ip_filter
+        self.limiter = limiter
+        self.max_connections = max_connections
+        self.open_connections = 0
+        self.lock = threading.Lock()
+        self.rejected = collections.Counter()
+
+    def admit(self, ip):
+        if self.ip_filter is not None and not self.ip_filter.allowed(ip):
+            return self._reject(BLOCKED)
+        if self.limiter is not None and not self.limiter.allow(ip):
+            return self._reject(RATE_LIMITED)
+        with self.lock:
+            if self.max_connections and self.open_connections >= self.max_connections:
+                self.rejected[OVERLOADED] += 1
+                return OVERLOADED
+            self.open_connections += 1
+        return None
+
+    def _reject(self, reason):
+        with self.lock:
+            self.rejected[reason] += 1
+        return reason
+
+    def release(self):
+        with self.lock:
+            self.open_connections -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "open_connections": self.open_connections,
+                "max_connections": self.max_connections,
+                "blocked": self.rejected[BLOCKED],
+                "rate_limited": self.rejected[RATE_LIMITED],
+                "overloaded": self.rejected[OVERLOADED],
+                "filter_prefixes": len(self.ip_filter) if self.ip_filter is not None else 0,
+                "tracked_clients": len(self.limiter) if self.limiter is not None else 0,
+            }
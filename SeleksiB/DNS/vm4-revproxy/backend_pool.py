@@ -0,0 +1,214 @@
+import asyncio
+import collections
+import socket
+import threading
+import time
+
+# Methods that can safely be sent again if a pooled connection turns out dead
+IDEMPOTENT_METHODS = frozenset({b"GET", b"HEAD", b"OPTIONS", b"PUT", b"DELETE", b"TRACE"})
+
+# Headers that only describe the client <-> proxy hop
+HOP_BY_HOP_HEADERS = frozenset({b"connection", b"keep-alive", b"proxy-connection"})
+
+
+def keep_alive_request(request):
+    """Bytes to send to the backend so that it keeps the connection open
+
+    An HTTP/1.1 request without hop-by-hop headers is already keep-alive
+    and is forwarded as received; anything else gets its head rewritten.
+    """
+    headers = request.headers
+    if request.version == b"HTTP/1.1" and not any(name in headers for name in HOP_BY_HOP_HEADERS):
+        return request.raw
+    lines = request.head[:-4].split(b"\r\n")
+    kept = [lines[0]]
+    for line in lines[1:]:
+        name = line.split(b":", 1)[0].lower()
+        if name not in HOP_BY_HOP_HEADERS:
+            kept.append(line)
+    kept.append(b"Connection: keep-alive")
+    return b"\r\n".join(kept) + b"\r\n\r\n" + request.body
+
+
+class PooledConnection:
+    __slots__ = ("sock", "last_used", "reused")
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.last_used = time.monotonic()
+        self.reused = False
+
+
+def connection_dropped(sock):
+    """Check an idle socket without blocking: EOF or stray bytes mean it is stale"""
+    timeout = sock.gettimeout()
+    try:
+        sock.setblocking(False)
+        sock.recv(1, socket.MSG_PEEK)
+    except BlockingIOError:
+        return False
+    except OSError:
+        return True
+    finally:
+        try:
+            sock.settimeout(timeout)
+        except OSError:
+            pass
+    # b"" means the backend closed it, any data means an unread response
+    return True
+
+
+class BackendPool:
+    """Persistent HTTP/1.1 connections to one backend, shared by all client threads"""
+
+    def __init__(self, host, port, max_size=32, idle_timeout=30.0,
+                 connect_timeout=10, io_timeout=10):
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.io_timeout = io_timeout
+
+        self.lock = threading.Lock()
+        self.idle = collections.deque()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.expired = 0
+        self.retries = 0
+
+    def connect(self):
+        """Open a new backend connection (counted as a pool miss)"""
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.io_timeout)
+        with self.lock:
+            self.misses += 1
+        return PooledConnection(sock)
+
+    def acquire(self):
+        """Return a live idle connection if there is one, otherwise connect"""
+        while True:
+            with self.lock:
+                self._expire_idle()
+                if not self.idle:
+                    break
+                # Most recently used first, it is the least likely to be stale
+                conn = self.idle.pop()
+            if connection_dropped(conn.sock):
+                with self.lock:
+                    self.stale += 1
+                self._close(conn)
+                continue
+            with self.lock:
+                self.hits += 1
+            conn.reused = True
+            return conn
+        return self.connect()
+
+    def release(self, conn, reusable=True):
+        """Give a connection back after a complete response"""
+        if not reusable:
+            self._close(conn)
+            return
+        conn.last_used = time.monotonic()
+        with self.lock:
+            if len(self.idle) < self.max_size:
+                self.idle.append(conn)
+                return
+        self._close(conn)
+
+    def discard(self, conn):
+        self._close(conn)
+
+    def note_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def _expire_idle(self):
+        # Oldest connections sit at the left end of the deque
+        cutoff = time.monotonic() - self.idle_timeout
+        while self.idle and self.idle[0].last_used < cutoff:
+            self._close(self.idle.popleft())
+            self.expired += 1
+
+    def _close(self, conn):
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
+
+    def close(self):
+        with self.lock:
+            while self.idle:
+                self._close(self.idle.popleft())
+
+    def stats(self):
+        with self.lock:
+            return {
+                "backend": f"{self.host}:{self.port}",
+                "idle": len(self.idle),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "expired": self.expired,
+                "retries": self.retries,
+            }
+
+
+class AsyncPooledConnection:
+    __slots__ = ("reader", "writer", "last_used", "reused")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+        self.reused = False
+
+    def dropped(self):
+        # The event loop has already fed any EOF from the backend into the reader
+        return self.writer.is_closing() or self.reader.at_eof()
+
+
+class AsyncBackendPool(BackendPool):
+    """Same pool for the asyncio serving mode, holding (reader, writer) pairs"""
+
+    async def connect(self):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port),
+            timeout=self.connect_timeout
+        )
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.misses += 1
+        return AsyncPooledConnection(reader, writer)
+
+    async def acquire(self):
+        self._expire_idle()
+        while self.idle:
+            conn = self.idle.pop()
+            if conn.dropped():
+                self.stale += 1
+                self._close(conn)
+                continue
+            self.hits += 1
+            conn.reused = True
+            return conn
+        return await self.connect()
+
+    def release(self, conn, reusable=True):
+        if not reusable or len(self.idle) >= self.max_size:
+            self._close(conn)
+            return
+        conn.last_used = time.monotonic()
+        self.idle.append(conn)
+
+    def _close(self, conn):
+        try:
+            conn.writer.close()
+        except Exception:
+            pass
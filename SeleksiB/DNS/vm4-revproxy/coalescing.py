@@ -0,0 +1,152 @@
+import asyncio
+import threading
+
+from response_cache import CACHEABLE_STATUSES, cache_directives
+
+# Longest a follower waits for the leader before asking the backend itself
+FOLLOWER_TIMEOUT = 30.0
+
+# Biggest response body that is collected to hand to followers
+MAX_SHARED_SIZE = 1024 * 1024
+
+# Request headers that make the answer fit only the request that sent them
+PERSONAL_REQUEST_HEADERS = (b"cookie", b"range", b"if-none-match", b"if-modified-since",
+                            b"if-match", b"if-unmodified-since")
+
+
+def request_shareable(request):
+    """Whether a GET may lead or follow a flight
+
+    A 304 or a 206 answers only the conditional or Range request that
+    asked for it, and a response to cookies may be per user.
+    """
+    return not any(name in request.headers for name in PERSONAL_REQUEST_HEADERS)
+
+
+def response_shareable(status, headers):
+    """Whether a complete response meant for one client may be replayed to others
+
+    Bodies the backend content-encoded or varied on a request header were
+    picked for the leader's headers, which followers need not share.
+    """
+    if status not in CACHEABLE_STATUSES or b"set-cookie" in headers:
+        return False
+    if headers.get(b"content-encoding", b"identity").strip().lower() != b"identity":
+        return False
+    if headers.get(b"vary", b"").strip():
+        return False
+    directives = cache_directives(headers.get(b"cache-control", b""))
+    return b"private" not in directives and b"no-store" not in directives
+
+
+class Flight:
+    """A backend request in progress that identical requests can wait for"""
+
+    __slots__ = ("key", "done", "future", "result", "followers")
+
+    def __init__(self, key, future=None):
+        self.key = key
+        self.done = threading.Event()
+        self.future = future  # set in asyncio mode, resolved together with done
+        self.result = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Collapses identical concurrent GETs into a single backend request
+
+    The first request for a key becomes the leader and goes to the backend;
+    requests for the same key that arrive while it is in flight wait for it
+    and are answered from its response. When the leader cannot share its
+    response (error, too big, private) the followers go to the backend
+    themselves.
+    """
+
+    def __init__(self, max_object_size=MAX_SHARED_SIZE, timeout=FOLLOWER_TIMEOUT):
+        self.max_object_size = max_object_size
+        self.timeout = timeout
+        self.flights = {}
+        self.lock = threading.Lock()
+
+        # Counters
+        self.leaders = 0
+        self.coalesced = 0  # followers answered without a backend call
+        self.fallbacks = 0  # followers that had to ask the backend anyway
+
+    def join(self, key, loop=None):
+        """Return (flight, leader); the first caller for a key is the leader"""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                return flight, False
+            flight = Flight(key, loop.create_future() if loop is not None else None)
+            self.flights[key] = flight
+            self.leaders += 1
+            return flight, True
+
+    def finish(self, flight, result=None):
+        """Leader side: hand the response (None if unusable) to the followers
+
+        Only the first call per flight counts, so it is safe to call again
+        on the way out after a successful publish.
+        """
+        with self.lock:
+            if not self._close(flight, result):
+                return
+        self._resolve(flight, result)
+
+    def abandon(self, flight):
+        """Leader side: end the flight if nobody has joined it yet, True if it was ended
+
+        Saves collecting a body no one is waiting for; requests arriving
+        later lead a flight of their own.
+        """
+        with self.lock:
+            if flight.followers or not self._close(flight, None):
+                return False
+        self._resolve(flight, None)
+        return True
+
+    def _close(self, flight, result):
+        # Called with the lock held, False if the flight was already finished
+        if self.flights.get(flight.key) is flight:
+            del self.flights[flight.key]
+        if flight.done.is_set():
+            return False
+        flight.result = result
+        flight.done.set()
+        return True
+
+    def _resolve(self, flight, result):
+        if flight.future is not None and not flight.future.done():
+            flight.future.set_result(result)
+
+    def wait(self, flight):
+        """Follower side: block until the leader finishes, None means go to the backend"""
+        flight.done.wait(self.timeout)
+        return self._outcome(flight.result)
+
+    async def wait_async(self, flight):
+        try:
+            result = await asyncio.wait_for(asyncio.shield(flight.future), self.timeout)
+        except asyncio.TimeoutError:
+            result = None
+        return self._outcome(result)
+
+    def _outcome(self, result):
+        with self.lock:
+            if result is None:
+                self.fallbacks += 1
+            else:
+                self.coalesced += 1
+        return result
+
+    def stats(self):
+        with self.lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "fallbacks": self.fallbacks,
+                "in_flight": len(self.flights),
+            }
@@ -0,0 +1,237 @@
+import collections
+import hashlib
+import threading
+import zlib
+
+from response_cache import cache_directives
+
+ENCODINGS = (b"gzip", b"deflate")  # in order of preference
+
+# zlib wbits: gzip container, zlib container (what HTTP calls "deflate")
+WBITS = {b"gzip": 16 + zlib.MAX_WBITS, b"deflate": zlib.MAX_WBITS}
+
+# Content types worth compressing
+COMPRESSIBLE_TYPES = (
+    b"text/",
+    b"application/json",
+    b"application/javascript",
+    b"application/xml",
+    b"application/xhtml+xml",
+    b"application/rss+xml",
+    b"application/atom+xml",
+    b"image/svg+xml",
+)
+
+COMPRESSIBLE_STATUSES = frozenset({200, 203, 404, 410})
+
+# Bodies smaller than this are sent as they are
+MIN_COMPRESS_SIZE = 1024
+
+
+def negotiate(accept_encoding):
+    """Pick the coding to use from an Accept-Encoding value, None for identity"""
+    qualities = {}
+    for part in accept_encoding.lower().split(b","):
+        coding, _, params = part.strip().partition(b";")
+        quality = 1.0
+        name, _, value = params.strip().partition(b"=")
+        if name.strip() == b"q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip()] = quality
+    best = None
+    best_quality = 0.0
+    for coding in ENCODINGS:
+        quality = qualities.get(coding, qualities.get(b"x-gzip") if coding == b"gzip" else None)
+        if quality is None:
+            quality = qualities.get(b"*", 0.0)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compressible(status, headers, method=b"GET", min_size=MIN_COMPRESS_SIZE):
+    """Whether a response may be compressed on the way to the client"""
+    if method == b"HEAD" or status not in COMPRESSIBLE_STATUSES:
+        return False
+    if headers.get(b"content-encoding", b"identity").lower() != b"identity" or b"content-range" in headers:
+        return False
+    if not headers.get(b"content-type", b"").lower().startswith(COMPRESSIBLE_TYPES):
+        return False
+    if b"no-transform" in cache_directives(headers.get(b"cache-control", b"")):
+        return False
+    if b"content-length" in headers:
+        try:
+            return int(headers[b"content-length"]) >= min_size
+        except ValueError:
+            return False
+    return True
+
+
+def compressed_head(raw_head, encoding, length=None):
+    """Response head for a compressed body of the given length (None = chunked)
+
+    The ETag is made weak because the compressed bytes differ from the
+    representation the backend tagged.
+    """
+    lines = raw_head.split(b"\r\n")
+    kept = [lines[0]]
+    vary = None
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        name = name.lower()
+        if name in (b"content-length", b"transfer-encoding", b"content-encoding"):
+            continue
+        if name == b"vary":
+            vary = value.strip()
+            continue
+        if name == b"etag" and not value.strip().startswith(b"W/"):
+            line = b"ETag: W/" + value.strip()
+        kept.append(line)
+    kept.append(b"Content-Encoding: " + encoding)
+    if vary and b"accept-encoding" not in vary.lower():
+        kept.append(b"Vary: " + vary + b", Accept-Encoding")
+    else:
+        kept.append(b"Vary: " + (vary or b"Accept-Encoding"))
+    if length is None:
+        kept.append(b"Transfer-Encoding: chunked")
+    else:
+        kept.append(b"Content-Length: %d" % length)
+    return b"\r\n".join(kept)
+
+
+def compress_body(body, encoding, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, WBITS[encoding])
+    return compressor.compress(body) + compressor.flush()
+
+
+def strong_etag(headers):
+    etag = headers.get(b"etag")
+    if etag is None or etag.startswith(b"W/"):
+        return None
+    return etag
+
+
+class StreamCompressor:
+    """Compresses a response body piece by piece into chunked framing
+
+    The relay hands over the payload pieces the ResponseParser found
+    (already de-chunked); each batch goes out as one HTTP chunk, so the
+    client starts receiving before the backend has finished. Up to
+    collect_limit bytes of output are also kept for the variant cache.
+    """
+
+    def __init__(self, encoding, level=6, collect_limit=0, hash_body=False):
+        self.encoding = encoding
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, WBITS[encoding])
+        self.collected = bytearray() if collect_limit else None
+        self.collect_limit = collect_limit
+        self.digest = hashlib.sha1() if hash_body else None
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _frame(self, data):
+        self.bytes_out += len(data)
+        if self.collected is not None:
+            self.collected += data
+            if len(self.collected) > self.collect_limit:
+                self.collected = None
+        if not data:
+            return b""
+        return b"%x\r\n%s\r\n" % (len(data), data)
+
+    def take(self, pieces):
+        """Compress and frame the pending payload pieces, then forget them"""
+        compress = self.compressor.compress
+        out = []
+        for piece in pieces:
+            self.bytes_in += len(piece)
+            if self.digest is not None:
+                self.digest.update(piece)
+            out.append(compress(piece))
+        pieces.clear()
+        # Flush so what was received so far reaches the client now
+        out.append(self.compressor.flush(zlib.Z_SYNC_FLUSH))
+        return self._frame(b"".join(out))
+
+    def finish(self):
+        """Last compressed bytes and the terminating zero-length chunk"""
+        return self._frame(self.compressor.flush()) + b"0\r\n\r\n"
+
+
+class VariantCache:
+    """Byte-bounded LRU of compressed bodies, so a page is compressed only once
+
+    Keys are ("etag", coding, host, path, etag) when the backend gave a
+    strong ETag and ("sha1", coding, digest of the plain body) otherwise.
+    """
+
+    def __init__(self, max_bytes, max_object_size=None):
+        self.max_bytes = max_bytes
+        self.max_object_size = max_object_size or max(1, max_bytes // 8)
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_in = 0   # plain bytes compressed
+        self.bytes_out = 0  # compressed bytes produced
+
+    @staticmethod
+    def etag_key(encoding, request, etag):
+        return b"etag", encoding, request.headers.get(b"host", b"").lower(), request.target, etag
+
+    @staticmethod
+    def digest_key(encoding, digest):
+        return b"sha1", encoding, digest
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_object_size:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = body
+            self.size += len(body)
+            self.stores += 1
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def count(self, plain, compressed):
+        with self.lock:
+            self.bytes_in += plain
+            self.bytes_out += compressed
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+            }
@@ -0,0 +1,52 @@
+import subprocess
+
+
+def blocked_range_for(current_ip):
+    """The .100-.115 block of the proxy's own subnet, None if the IP is unknown"""
+    parts = current_ip.split('.')
+    if len(parts) != 4 or not all(part.isdigit() for part in parts):
+        return None
+    return f"{'.'.join(parts[:3])}.100/28"
+
+
+def build_ruleset(listen_port, backends, blocked_range=None, ssh_port=22):
+    """The whole filter table in iptables-restore format
+
+    Same rules, in the same order, as the old one-command-per-rule setup:
+    restoring the table replaces every existing rule and chain at once,
+    which is what the -F/-X/-P commands used to do.
+    """
+    rules = [
+        "*filter",
+        ":INPUT ACCEPT [0:0]",
+        ":FORWARD ACCEPT [0:0]",
+        ":OUTPUT ACCEPT [0:0]",
+        # Allow loopback
+        "-A INPUT -i lo -j ACCEPT",
+        # Allow established connections
+        "-A INPUT -m state --state ESTABLISHED,RELATED -j ACCEPT",
+        # Allow HTTP traffic to the proxy
+        f"-A INPUT -p tcp --dport {listen_port} -j ACCEPT",
+    ]
+    if blocked_range:
+        rules.append(f"-A INPUT -s {blocked_range} -j DROP")
+    # Allow outbound traffic to backend servers
+    for host, port in backends:
+        rules.append(f"-A OUTPUT -p tcp -d {host} --dport {port} -j ACCEPT")
+    # Allow SSH to maintain connection
+    rules.append(f"-A INPUT -p tcp --dport {ssh_port} -j ACCEPT")
+    rules.append("COMMIT")
+    return "\n".join(rules) + "\n"
+
+
+def apply_ruleset(ruleset, timeout=10):
+    """Load a ruleset with a single iptables-restore call, all rules or none"""
+    result = subprocess.run(
+        ["sudo", "iptables-restore"],
+        input=ruleset,
+        text=True,
+        capture_output=True,
+        timeout=timeout
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"iptables-restore exited with {result.returncode}")
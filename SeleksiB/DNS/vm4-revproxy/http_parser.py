@@ -0,0 +1,364 @@
+# Limits on what a client or backend may send
+MAX_HEAD_SIZE = 64 * 1024
+MAX_LINE = 8192
+
+
+class HTTPParseError(ValueError):
+    """The peer sent something that is not valid HTTP/1.x framing"""
+
+
+def parse_head(head):
+    """Split a header block into its start line and a dict of lowercased headers
+
+    Repeated headers are joined with ", " as allowed by RFC 9110.
+    """
+    lines = head.split(b"\r\n")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(b":")
+        if not sep or not name or name != name.strip():
+            raise HTTPParseError(f"malformed header line: {line[:64]!r}")
+        name = name.lower()
+        value = value.strip()
+        if name in headers:
+            headers[name] += b", " + value
+        else:
+            headers[name] = value
+    return lines[0], headers
+
+
+def wants_keep_alive(version, headers):
+    connection = headers.get(b"connection", b"").lower()
+    if version == b"HTTP/1.1":
+        return b"close" not in connection
+    return b"keep-alive" in connection
+
+
+def content_length(headers):
+    try:
+        length = int(headers[b"content-length"])
+    except ValueError:
+        raise HTTPParseError("invalid Content-Length") from None
+    if length < 0:
+        raise HTTPParseError("negative Content-Length")
+    return length
+
+
+def chunk_size(line):
+    try:
+        return int(line.split(b";", 1)[0].strip(), 16)
+    except ValueError:
+        raise HTTPParseError(f"invalid chunk size: {line[:32]!r}") from None
+
+
+def dechunk(body):
+    """Payload of a complete chunked body, trailers dropped"""
+    payload = bytearray()
+    pos = 0
+    while True:
+        nl = body.find(b"\r\n", pos)
+        if nl < 0:
+            raise HTTPParseError("truncated chunked body")
+        size = chunk_size(bytes(body[pos:nl]))
+        if size == 0:
+            return bytes(payload)
+        start = nl + 2
+        if len(body) < start + size + 2:
+            raise HTTPParseError("truncated chunked body")
+        payload += body[start:start + size]
+        pos = start + size + 2
+
+
+class HTTPRequest:
+    """One complete request as received from the client
+
+    raw holds the exact bytes of the message (head and body) so it can be
+    forwarded as-is.
+    """
+
+    __slots__ = ("method", "target", "version", "headers", "raw", "head_length", "keep_alive")
+
+    def __init__(self, method, target, version, headers, raw, head_length):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers
+        self.raw = raw
+        self.head_length = head_length
+        self.keep_alive = wants_keep_alive(version, headers)
+
+    @property
+    def head(self):
+        return self.raw[:self.head_length]
+
+    @property
+    def body(self):
+        return self.raw[self.head_length:]
+
+    @property
+    def request_line(self):
+        return self.raw[:self.raw.find(b"\r\n")]
+
+    def __repr__(self):
+        return f"<HTTPRequest {self.method.decode('latin-1')} {self.target.decode('latin-1')}>"
+
+
+class RequestParser:
+    """Turns a stream of client bytes into complete HTTPRequest objects
+
+    feed() may be called with any slicing of the stream; it returns every
+    request completed by the new bytes, in order, which is what pipelining
+    needs.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self._reset()
+
+    def _reset(self):
+        self.scan_from = 0
+        self.head_length = 0
+        self.start_line = None
+        self.headers = None
+        self.body_mode = None
+        self.body_end = 0
+        self.chunk_pos = 0
+
+    @property
+    def pending(self):
+        """True while part of a request is buffered"""
+        return bool(self.buffer)
+
+    def feed(self, data):
+        self.buffer += data
+        requests = []
+        while True:
+            request = self._next_request()
+            if request is None:
+                return requests
+            requests.append(request)
+
+    def _next_request(self):
+        buf = self.buffer
+        if self.start_line is None:
+            if not buf:
+                return None
+            # Tolerate blank lines between pipelined requests (RFC 9112 2.2)
+            while buf[:2] == b"\r\n":
+                del buf[:2]
+            idx = buf.find(b"\r\n\r\n", self.scan_from)
+            if idx < 0:
+                if len(buf) > MAX_HEAD_SIZE:
+                    raise HTTPParseError("request head too large")
+                self.scan_from = max(0, len(buf) - 3)
+                return None
+            self.head_length = idx + 4
+            self.start_line, self.headers = parse_head(bytes(buf[:idx]))
+            self._start_body()
+
+        if self.body_mode == "chunked":
+            if not self._scan_chunks():
+                return None
+        elif len(buf) < self.body_end:
+            return None
+
+        parts = self.start_line.split(b" ")
+        if len(parts) != 3 or not parts[2].startswith(b"HTTP/"):
+            raise HTTPParseError(f"invalid request line: {self.start_line[:64]!r}")
+        method, target, version = parts
+        raw = bytes(buf[:self.body_end])
+        del buf[:self.body_end]
+        request = HTTPRequest(method.upper(), target, version.upper(),
+                              self.headers, raw, self.head_length)
+        self._reset()
+        return request
+
+    def _start_body(self):
+        headers = self.headers
+        if b"transfer-encoding" in headers:
+            if b"content-length" in headers:
+                # Both framings at once is the classic request smuggling vector
+                raise HTTPParseError("both Transfer-Encoding and Content-Length")
+            if not headers[b"transfer-encoding"].lower().endswith(b"chunked"):
+                raise HTTPParseError("unsupported Transfer-Encoding")
+            self.body_mode = "chunked"
+            self.chunk_pos = self.head_length
+        elif b"content-length" in headers:
+            self.body_mode = "length"
+            self.body_end = self.head_length + content_length(headers)
+        else:
+            self.body_mode = "none"
+            self.body_end = self.head_length
+
+    def _scan_chunks(self):
+        """Walk chunk headers from where the last call stopped, True at the end"""
+        buf = self.buffer
+        pos = self.chunk_pos
+        while True:
+            nl = buf.find(b"\r\n", pos, pos + MAX_LINE)
+            if nl < 0:
+                if len(buf) - pos > MAX_LINE:
+                    raise HTTPParseError("chunk size line too long")
+                self.chunk_pos = pos
+                return False
+            size = chunk_size(bytes(buf[pos:nl]))
+            if size == 0:
+                # Last chunk, then optional trailers and an empty line
+                if buf[nl + 2:nl + 4] == b"\r\n":
+                    self.body_end = nl + 4
+                    return True
+                end = buf.find(b"\r\n\r\n", nl + 2)
+                if end < 0:
+                    self.chunk_pos = pos
+                    return False
+                self.body_end = end + 4
+                return True
+            next_pos = nl + 2 + size + 2
+            if len(buf) < next_pos:
+                self.chunk_pos = pos
+                return False
+            pos = next_pos
+
+
+class ResponseParser:
+    """Follows a backend response as it streams past to find where it ends
+
+    Unlike RequestParser it does not keep the body: the relay forwards the
+    bytes itself and only feeds them here (bytes or memoryview) for framing.
+    If body_sink is set it is called with every slice of body payload, chunk
+    framing removed, for whoever needs the decoded body (e.g. compression).
+    Slices may be views into the caller's buffer, so use them right away.
+    """
+
+    def __init__(self, method=b"GET", body_sink=None):
+        self.method = method
+        self.body_sink = body_sink
+        self.state = "head"
+        self.head = b""
+        self.raw_head = b""
+        self.status_line = b""
+        self.version = b""
+        self.status = 0
+        self.headers = {}
+        self.remaining = 0
+        self.line = b""
+        self.keep_alive = False
+        self.complete = False
+
+        # Stream offsets of the final head and of the body behind it
+        # (interim 1xx responses come before head_start)
+        self.head_start = 0
+        self.body_start = 0
+
+    @property
+    def head_complete(self):
+        return self.state != "head" or self.complete
+
+    def feed(self, data):
+        """Consume bytes from the backend, return True once the response is complete"""
+        pos = 0
+        end = len(data)
+        while pos < end and not self.complete:
+            if self.state == "head":
+                self.head += bytes(data[pos:end])
+                idx = self.head.find(b"\r\n\r\n")
+                if idx < 0:
+                    if len(self.head) > MAX_HEAD_SIZE:
+                        raise HTTPParseError("response head too large")
+                    return False
+                leftover = len(self.head) - (idx + 4)
+                pos = end - leftover
+                self.head_start = self.body_start
+                self.body_start += idx + 4
+                self._parse_head(self.head[:idx])
+                self.head = b""
+            elif self.state == "length":
+                take = min(self.remaining, end - pos)
+                if self.body_sink is not None:
+                    self.body_sink(data[pos:pos + take])
+                self.remaining -= take
+                pos += take
+                if self.remaining == 0:
+                    self.complete = True
+            elif self.state == "chunk-size" or self.state == "trailer":
+                # Size and trailer lines are short, only copy a small window
+                window = bytes(data[pos:min(end, pos + MAX_LINE)])
+                idx = window.find(b"\n")
+                if idx < 0:
+                    self.line += window
+                    if len(self.line) > MAX_LINE:
+                        raise HTTPParseError("chunk size line too long")
+                    pos += len(window)
+                    continue
+                line = (self.line + window[:idx]).strip()
+                self.line = b""
+                pos += idx + 1
+                if self.state == "trailer":
+                    if not line:
+                        self.complete = True
+                    continue
+                size = chunk_size(line)
+                if size == 0:
+                    self.state = "trailer"
+                else:
+                    self.remaining = size + 2  # chunk data plus its CRLF
+                    self.state = "chunk-data"
+            elif self.state == "chunk-data":
+                take = min(self.remaining, end - pos)
+                # The last two bytes of remaining are the CRLF after the data
+                payload = min(take, self.remaining - 2)
+                if payload > 0 and self.body_sink is not None:
+                    self.body_sink(data[pos:pos + payload])
+                self.remaining -= take
+                pos += take
+                if self.remaining == 0:
+                    self.state = "chunk-size"
+            else:  # "close": body runs until the backend closes
+                if self.body_sink is not None:
+                    self.body_sink(data[pos:end])
+                return False
+
+        if pos < end:
+            # Bytes after the end of the response: the connection is out of sync
+            self.keep_alive = False
+        return self.complete
+
+    def consumed(self, count):
+        """Account for body bytes that were relayed without going through feed()"""
+        if self.state == "length":
+            self.remaining -= count
+            if self.remaining <= 0:
+                self.complete = True
+
+    def _parse_head(self, head):
+        self.raw_head = head
+        self.status_line, self.headers = parse_head(head)
+        parts = self.status_line.split(None, 2)
+        self.version = parts[0].upper() if parts else b""
+        try:
+            self.status = int(parts[1])
+        except (IndexError, ValueError):
+            raise HTTPParseError(f"invalid status line: {self.status_line[:64]!r}") from None
+
+        headers = self.headers
+        status = self.status
+        self.keep_alive = wants_keep_alive(self.version, headers)
+
+        if 100 <= status < 200 and status != 101:
+            # Interim response (e.g. 100 Continue), the real one follows
+            self.state = "head"
+        elif self.method == b"HEAD" or status in (204, 304) or status == 101:
+            self.complete = True
+            if status == 101:
+                self.keep_alive = False
+        elif b"chunked" in headers.get(b"transfer-encoding", b"").lower():
+            self.state = "chunk-size"
+        elif b"content-length" in headers:
+            self.remaining = content_length(headers)
+            if self.remaining == 0:
+                self.complete = True
+            else:
+                self.state = "length"
+        else:
+            self.state = "close"
+            self.keep_alive = False
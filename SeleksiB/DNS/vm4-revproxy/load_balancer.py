@@ -0,0 +1,242 @@
+import bisect
+import hashlib
+import socket
+import threading
+import time
+
+STRATEGIES = ("round-robin", "least-outstanding", "consistent-hash")
+
+# Virtual nodes per backend on the consistent-hash ring
+RING_REPLICAS = 100
+
+# Weight of the newest sample in the latency moving average
+LATENCY_ALPHA = 0.2
+
+
+def parse_backend(spec):
+    """Turn 'host:port' into a (host, port) tuple"""
+    host, sep, port = spec.rpartition(":")
+    if not sep or not host:
+        raise ValueError(f"Backend must look like host:port, got {spec!r}")
+    return host, int(port)
+
+
+class Backend:
+    """One upstream server and what the balancer knows about it"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.latency = None  # moving average of time to first byte, seconds
+
+        # Health checker state
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+
+        # Smooth weighted round-robin state
+        self.current_weight = 0
+
+    @property
+    def name(self):
+        return f"{self.host}:{self.port}"
+
+    def __repr__(self):
+        return f"<Backend {self.name} {'up' if self.healthy else 'down'}>"
+
+
+class LoadBalancer:
+    """Picks a backend for every request and keeps per-backend statistics
+
+    round-robin       smooth weighted round-robin, weights follow latency
+    least-outstanding fewest in-flight requests, scaled by latency
+    consistent-hash   same path goes to the same backend while it is up
+    """
+
+    def __init__(self, backends, strategy="round-robin"):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown balancing strategy: {strategy}")
+        if not backends:
+            raise ValueError("At least one backend is required")
+        self.backends = [Backend(host, port) for host, port in backends]
+        self.strategy = strategy
+        self.lock = threading.Lock()
+        self.rotation = 0
+
+        ring = []
+        for backend in self.backends:
+            for replica in range(RING_REPLICAS):
+                ring.append((self._hash(f"{backend.name}#{replica}".encode()), backend))
+        ring.sort(key=lambda item: item[0])
+        self.ring_keys = [key for key, _ in ring]
+        self.ring_backends = [backend for _, backend in ring]
+
+    @staticmethod
+    def _hash(data):
+        return int.from_bytes(hashlib.md5(data).digest()[:8], "big")
+
+    def choose(self, path=b"/", exclude=None):
+        """Return the backend for a request path
+
+        When every backend is down the balancer fails open and picks among
+        all of them, so a lone backend is still tried. Returns None only when
+        exclude was the last option.
+        """
+        with self.lock:
+            candidates = [b for b in self.backends if b.healthy and b is not exclude]
+            if not candidates:
+                candidates = [b for b in self.backends if b is not exclude]
+                if not candidates:
+                    return None
+            if self.strategy == "consistent-hash":
+                backend = self._choose_hashed(path, candidates)
+            elif self.strategy == "least-outstanding":
+                # Rotate the starting point so ties do not always hit the first backend
+                self.rotation = (self.rotation + 1) % len(candidates)
+                rotated = candidates[self.rotation:] + candidates[:self.rotation]
+                backend = min(rotated, key=self._load_score)
+            else:
+                backend = self._choose_weighted(candidates)
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def _load_score(self, backend):
+        # A backend without samples yet looks fast so that it gets measured
+        return (backend.outstanding + 1) * (backend.latency or 0.0)
+
+    def _choose_weighted(self, candidates):
+        # Weight is the speed relative to the fastest backend, 1..10
+        latencies = [b.latency for b in candidates if b.latency]
+        fastest = min(latencies) if latencies else None
+        total = 0
+        best = None
+        for backend in candidates:
+            if fastest and backend.latency:
+                weight = max(1, round(10 * fastest / backend.latency))
+            else:
+                weight = 10
+            backend.current_weight += weight
+            total += weight
+            if best is None or backend.current_weight > best.current_weight:
+                best = backend
+        best.current_weight -= total
+        return best
+
+    def _choose_hashed(self, path, candidates):
+        # Walk clockwise from the path's point to the first usable backend
+        key = self._hash(path.split(b"?", 1)[0])
+        start = bisect.bisect(self.ring_keys, key)
+        count = len(self.ring_backends)
+        for i in range(count):
+            backend = self.ring_backends[(start + i) % count]
+            if backend in candidates:
+                return backend
+        return candidates[0]
+
+    def finish(self, backend, first_byte=None, ok=True):
+        """Record the end of a request sent to backend"""
+        with self.lock:
+            backend.outstanding -= 1
+            if not ok:
+                backend.failures += 1
+            if first_byte is not None:
+                self._observe(backend, first_byte)
+
+    def observe_latency(self, backend, seconds):
+        with self.lock:
+            self._observe(backend, seconds)
+
+    def _observe(self, backend, seconds):
+        if backend.latency is None:
+            backend.latency = seconds
+        else:
+            backend.latency += LATENCY_ALPHA * (seconds - backend.latency)
+
+    def connect_failed(self, backend):
+        """A refused or timed-out connect ejects the backend until health checks pass"""
+        with self.lock:
+            backend.consecutive_successes = 0
+            was_healthy = backend.healthy
+            backend.healthy = False
+        return was_healthy
+
+    def mark(self, backend, healthy):
+        with self.lock:
+            changed = backend.healthy != healthy
+            backend.healthy = healthy
+            if healthy:
+                backend.current_weight = 0
+        return changed
+
+    def stats(self):
+        with self.lock:
+            return [{
+                "backend": b.name,
+                "healthy": b.healthy,
+                "outstanding": b.outstanding,
+                "requests": b.requests,
+                "failures": b.failures,
+                "latency_ms": round(b.latency * 1000, 2) if b.latency is not None else None,
+            } for b in self.backends]
+
+
+def probe_backend(host, port, path="/", timeout=2):
+    """Send a HEAD request, healthy means any status below 500"""
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            sock.sendall(f"HEAD {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+            status_line = sock.recv(1024).split(b"\r\n", 1)[0]
+        parts = status_line.split()
+        return len(parts) >= 2 and parts[0].startswith(b"HTTP/") and int(parts[1]) < 500
+    except (OSError, ValueError):
+        return False
+
+
+class HealthChecker(threading.Thread):
+    """Background thread that ejects failing backends and restores recovered ones
+
+    A backend goes down after `fall` failed probes in a row and comes back
+    after `rise` successful ones.
+    """
+
+    def __init__(self, balancer, interval=5.0, path="/", timeout=2, rise=2, fall=3):
+        super().__init__(daemon=True)
+        self.balancer = balancer
+        self.interval = interval
+        self.path = path
+        self.timeout = timeout
+        self.rise = rise
+        self.fall = fall
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            for backend in self.balancer.backends:
+                self.check(backend)
+            self.stopped.wait(self.interval)
+
+    def check(self, backend):
+        started = time.monotonic()
+        ok = probe_backend(backend.host, backend.port, self.path, self.timeout)
+        elapsed = time.monotonic() - started
+        if ok:
+            # Probe round trips keep the latency of idle backends up to date
+            self.balancer.observe_latency(backend, elapsed)
+            backend.consecutive_failures = 0
+            backend.consecutive_successes += 1
+            if not backend.healthy and backend.consecutive_successes >= self.rise:
+                self.balancer.mark(backend, True)
+                print(f"💚 Backend {backend.name} is back up ({elapsed * 1000:.1f} ms)")
+        else:
+            backend.consecutive_successes = 0
+            backend.consecutive_failures += 1
+            if backend.healthy and backend.consecutive_failures >= self.fall:
+                self.balancer.mark(backend, False)
+                print(f"💔 Backend {backend.name} failed {self.fall} health checks, ejected")
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,71 @@
+import collections
+import sys
+import threading
+
+LOG_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+
+class LogWriter(threading.Thread):
+    """Buffered log output written by a background thread
+
+    Request handlers only append a line to a deque; this thread writes
+    whatever has piled up in one go every flush_interval. When more than
+    max_pending lines are waiting, new ones are dropped (and counted)
+    instead of making the request path wait for stdout.
+    """
+
+    def __init__(self, level="info", stream=None, flush_interval=0.2, max_pending=10000):
+        super().__init__(daemon=True, name="log-writer")
+        if level not in LOG_LEVELS:
+            raise ValueError(f"Unknown log level: {level}")
+        self.level = LOG_LEVELS[level]
+        self.stream = stream or sys.stdout
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = collections.deque()
+        self.write_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.dropped = 0
+
+    def log(self, level, message):
+        if level < self.level:
+            return
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self.pending.append(message)
+
+    def debug(self, message):
+        self.log(10, message)
+
+    def info(self, message):
+        self.log(20, message)
+
+    def warning(self, message):
+        self.log(30, message)
+
+    def error(self, message):
+        self.log(40, message)
+
+    def run(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write every pending line; also called on shutdown before final output"""
+        with self.write_lock:
+            lines = []
+            pending = self.pending
+            while pending:
+                lines.append(pending.popleft())
+            if not lines:
+                return
+            try:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+            except (OSError, ValueError):
+                pass
+
+    def stop(self):
+        self.stopped.set()
+        self.flush()
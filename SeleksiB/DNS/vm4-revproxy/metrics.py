@@ -0,0 +1,175 @@
+import bisect
+import threading
+
+# Upper bounds of the latency buckets, seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds of the response size buckets, bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+COUNTERS = {
+    "proxy_connections_total": "Client connections accepted",
+    "proxy_rejected_total": "Client connections turned away on accept, by reason",
+    "proxy_requests_total": "Requests answered, by where the answer came from",
+    "proxy_responses_total": "Responses sent to clients, by status class",
+    "proxy_backend_errors_total": "Backend exchanges that failed, by kind",
+    "proxy_compressed_responses_total": "Responses compressed for the client, by content coding",
+    "proxy_tls_handshakes_total": "Completed TLS handshakes, by whether a session was resumed",
+    "proxy_tls_handshake_failures_total": "TLS handshakes that failed or timed out",
+    "proxy_client_bytes_received_total": "Request bytes read from clients",
+    "proxy_client_bytes_sent_total": "Response bytes written to clients",
+}
+
+GAUGES = {
+    "proxy_open_connections": "Client connections currently open",
+}
+
+HISTOGRAMS = {
+    "proxy_first_byte_seconds": ("Request arrival to first response byte sent to the client", LATENCY_BUCKETS),
+    "proxy_tls_handshake_seconds": ("Time to complete the TLS handshake with a client", LATENCY_BUCKETS),
+    "proxy_backend_connect_seconds": ("Time to open a new backend connection", LATENCY_BUCKETS),
+    "proxy_backend_ttfb_seconds": ("Request sent to first byte back from the backend", LATENCY_BUCKETS),
+    "proxy_request_duration_seconds": ("Request arrival to last response byte sent", LATENCY_BUCKETS),
+    "proxy_response_size_bytes": ("Bytes sent to the client per response", SIZE_BUCKETS),
+}
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Histogram:
+    """Fixed-bucket histogram, observe() is a bisect and two additions"""
+
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def render(self, name):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum {total:.6f}")
+        lines.append(f"{name}_count {cumulative}")
+        return lines
+
+
+class Metrics:
+    """Counters and histograms of one proxy process
+
+    Updates only take a short lock; the text is built when /__metrics is
+    requested. Statistics the other components already keep (balancer,
+    pools, cache, coalescing) are exported from their stats() at that point
+    instead of being counted twice.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}  # (name, labels) -> value, for counters and gauges
+        self.histograms = {name: Histogram(bounds) for name, (_, bounds) in HISTOGRAMS.items()}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def observe(self, name, value):
+        self.histograms[name].observe(value)
+
+    def render(self, stats=None):
+        """All metrics in the Prometheus text exposition format"""
+        with self.lock:
+            values = dict(self.values)
+        lines = []
+        for kind, table in (("counter", COUNTERS), ("gauge", GAUGES)):
+            for name, help_text in table.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                samples = sorted((labels, value) for (n, labels), value in values.items() if n == name)
+                for labels, value in samples or [((), 0)]:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+        for name, (help_text, _) in HISTOGRAMS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            lines.extend(self.histograms[name].render(name))
+        if stats:
+            lines.extend(render_component_stats(stats))
+        return "\n".join(lines) + "\n"
+
+
+def render_component_stats(stats):
+    """Export the stats() dicts of the balancer, pools, cache and coalescer"""
+    families = {}  # name -> (type, sample lines), one TYPE line per family
+
+    def sample(name, kind, value, **labels):
+        family = families.setdefault(name, (kind, []))
+        family[1].append(f"{name}{format_labels(sorted(labels.items()))} {value}")
+
+    for backend in stats.get("backends") or ():
+        name = backend["backend"]
+        sample("proxy_backend_up", "gauge", int(backend["healthy"]), backend=name)
+        sample("proxy_backend_outstanding", "gauge", backend["outstanding"], backend=name)
+        sample("proxy_backend_requests_total", "counter", backend["requests"], backend=name)
+        sample("proxy_backend_failures_total", "counter", backend["failures"], backend=name)
+        if backend["latency_ms"] is not None:
+            sample("proxy_backend_latency_seconds", "gauge", backend["latency_ms"] / 1000, backend=name)
+    for pool in stats.get("pools") or ():
+        name = pool["backend"]
+        for field in ("hits", "misses", "stale", "retries"):
+            sample(f"proxy_pool_{field}_total", "counter", pool[field], backend=name)
+        sample("proxy_pool_idle_connections", "gauge", pool["idle"], backend=name)
+    cache = stats.get("cache")
+    if cache:
+        for field in ("hits", "misses", "not_modified", "stores", "evictions", "expirations"):
+            sample(f"proxy_cache_{field}_total", "counter", cache[field])
+        sample("proxy_cache_entries", "gauge", cache["entries"])
+        sample("proxy_cache_bytes", "gauge", cache["bytes"])
+    coalescing = stats.get("coalescing")
+    if coalescing:
+        sample("proxy_coalesced_total", "counter", coalescing["coalesced"])
+        sample("proxy_coalesce_fallbacks_total", "counter", coalescing["fallbacks"])
+    compression = stats.get("compression")
+    if compression:
+        for field in ("hits", "misses", "stores", "evictions"):
+            sample(f"proxy_compression_variant_{field}_total", "counter", compression[field])
+        sample("proxy_compression_bytes_in_total", "counter", compression["bytes_in"])
+        sample("proxy_compression_bytes_out_total", "counter", compression["bytes_out"])
+        sample("proxy_compression_variant_bytes", "gauge", compression["bytes"])
+    tls = stats.get("tls")
+    if tls:
+        sample("proxy_tls_resumption_ratio", "gauge", tls["resumption_rate"])
+        sample("proxy_tls_cached_sessions", "gauge", tls["cached_sessions"])
+        for field in ("cache_hits", "cache_misses", "cache_timeouts", "cache_full"):
+            sample(f"proxy_tls_session_{field}_total", "counter", tls[field])
+    admission = stats.get("admission")
+    if admission:
+        sample("proxy_admission_open_connections", "gauge", admission["open_connections"])
+        sample("proxy_admission_tracked_clients", "gauge", admission["tracked_clients"])
+        sample("proxy_admission_filter_prefixes", "gauge", admission["filter_prefixes"])
+    if "log_dropped" in stats:
+        sample("proxy_log_dropped_total", "counter", stats["log_dropped"])
+
+    lines = []
+    for name, (kind, samples) in families.items():
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return lines
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""Benchmark rev_proxy.py against a local stand-in backend
+
+The proxy runs in this process (firewall off, its own port per mode), the
+stand-in backend and the load generator run in child processes so they do
+not compete with the proxy for the GIL. The generator is open-loop:
+requests are scheduled at a fixed rate whether or not earlier ones have
+finished, and latency is measured from the scheduled time, so a stalled
+proxy shows up as latency instead of silently lowering the request rate.
+
+    python3 proxy_benchmark.py --modes threaded,asyncio --concurrency 1,10,50 --rate 2000
+"""
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+
+from http_parser import HTTPParseError, ResponseParser
+from rev_proxy import SERVE_MODES, ReverseProxy
+from stand_in_backend import StandInBackend
+
+# The latency statistics are shared with the DNS tools next door in vm3-client
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "vm3-client"))
+from latency_stats import latency_summary
+
+# Seconds to wait for requests still in flight when the schedule ends
+DRAIN_TIMEOUT = 5.0
+
+
+def rss_kb(pid="self"):
+    """Resident set size of a process in KiB (Linux /proc)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler(threading.Thread):
+    """Samples this process's RSS while a run is going to find the peak"""
+
+    def __init__(self, interval=0.1):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = rss_kb() or 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, rss_kb() or 0)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+
+async def read_response(reader, method=b"GET"):
+    response = ResponseParser(method)
+    received = 0
+    while not response.complete:
+        chunk = await reader.read(64 * 1024)
+        if not chunk:
+            if response.state == "close" and response.head_complete:
+                break
+            raise ConnectionError("connection closed mid-response")
+        received += len(chunk)
+        response.feed(chunk)
+    return response, received
+
+
+async def open_loop(host, port, rate, connections, duration, path, unique_paths, timeout):
+    """Send rate requests per second over `connections` keep-alive connections"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    latencies = []
+    errors = collections.Counter()
+    statuses = collections.Counter()
+    counters = {"sent": 0, "bytes": 0}
+    total = max(1, int(rate * duration))
+    start = loop.time() + 0.05
+
+    async def schedule():
+        interval = 1.0 / rate
+        for i in range(total):
+            delay = start + i * interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            queue.put_nowait((i, start + i * interval))
+        for _ in range(connections):
+            queue.put_nowait(None)
+
+    async def worker():
+        reader = writer = None
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            i, scheduled = item
+            target = f"{path}/{i}" if unique_paths else path
+            request = (f"GET {target} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                       f"User-Agent: proxy-benchmark\r\n\r\n").encode()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+                writer.write(request)
+                counters["sent"] += 1
+                response, received = await asyncio.wait_for(read_response(reader), timeout)
+                latencies.append(loop.time() - scheduled)
+                counters["bytes"] += received
+                statuses[response.status] += 1
+                if response.status >= 400:
+                    errors[f"http_{response.status}"] += 1
+                if not response.keep_alive:
+                    writer.close()
+                    reader = writer = None
+            except asyncio.TimeoutError:
+                errors["timeout"] += 1
+            except (OSError, ConnectionError, HTTPParseError) as e:
+                errors[type(e).__name__] += 1
+            else:
+                continue
+            # After a failure the connection is in an unknown state
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    scheduler = asyncio.ensure_future(schedule())
+    workers = [asyncio.ensure_future(worker()) for _ in range(connections)]
+    await scheduler
+    done, pending = await asyncio.wait(workers, timeout=DRAIN_TIMEOUT + timeout)
+    for task in pending:
+        task.cancel()
+    elapsed = loop.time() - start
+
+    # HTTP error statuses are also completed requests, the rest never finished
+    failed = sum(count for name, count in errors.items() if not name.startswith("http_"))
+    unfinished = total - len(latencies) - failed
+    if unfinished > 0:
+        errors["unfinished"] += unfinished
+    return {
+        "scheduled": total,
+        "sent": counters["sent"],
+        "completed": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "bytes_received": counters["bytes"],
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "errors": dict(errors),
+        "error_rate": round(sum(errors.values()) / total, 5),
+        "latency_ms": latency_summary(latencies),
+    }
+
+
+def run_generator(results, host, port, rate, connections, duration, path, unique_paths, timeout):
+    """Child process entry point of the load generator"""
+    results.put(asyncio.run(open_loop(host, port, rate, connections, duration,
+                                      path, unique_paths, timeout)))
+
+
+def run_backend(host, port, size, delay, ready):
+    StandInBackend(host, port, size, delay).run(ready)
+
+
+def wait_for_port(host, port, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.02)
+    return False
+
+
+def start_proxy(mode, port, backend_port, args):
+    proxy = ReverseProxy(
+        proxy_host="127.0.0.1",
+        proxy_port=port,
+        backends=[("127.0.0.1", backend_port)],
+        mode=mode,
+        cache_size=int(args.cache_mb * 1024 * 1024),
+        coalesce=not args.no_coalesce,
+        log_level="warning",
+        firewall=False,
+        autostart=False
+    )
+    threading.Thread(target=proxy.serve, daemon=True, name=f"proxy-{mode}").start()
+    if not wait_for_port("127.0.0.1", port):
+        raise RuntimeError(f"Proxy ({mode}) did not start listening on port {port}")
+    return proxy
+
+
+def measure(context, port, rate, connections, args):
+    results = context.Queue()
+    generator = context.Process(
+        target=run_generator,
+        args=(results, "127.0.0.1", port, rate, connections, args.duration,
+              args.path, not args.same_path, args.timeout),
+        daemon=True
+    )
+    sampler = MemorySampler()
+    rss_before = rss_kb()
+    sampler.start()
+    generator.start()
+    result = results.get(timeout=args.duration + DRAIN_TIMEOUT + args.timeout + 30)
+    generator.join(5)
+    result["memory_kb"] = {"before": rss_before, "peak": sampler.stop(), "after": rss_kb()}
+    return result
+
+
+def parse_list(value, cast):
+    return [cast(part) for part in value.split(",") if part.strip()]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the reverse proxy against a stand-in backend")
+    parser.add_argument("--modes", default=",".join(SERVE_MODES),
+                        help="comma separated proxy modes to compare")
+    parser.add_argument("--concurrency", default="1,10,50,100",
+                        help="comma separated numbers of client connections")
+    parser.add_argument("--rate", type=float, default=1000,
+                        help="requests per second offered by the open-loop generator")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds per measurement")
+    parser.add_argument("--warmup", type=float, default=1,
+                        help="seconds of load before each mode's measurements (not reported)")
+    parser.add_argument("--timeout", type=float, default=10,
+                        help="per-request timeout in seconds")
+    parser.add_argument("--proxy-port", type=int, default=18080,
+                        help="first proxy port, each mode uses the next one")
+    parser.add_argument("--backend-port", type=int, default=18001)
+    parser.add_argument("--response-size", type=int, default=1024,
+                        help="stand-in backend response body in bytes")
+    parser.add_argument("--backend-delay", type=float, default=0.0,
+                        help="stand-in backend think time in seconds")
+    parser.add_argument("--path", default="/bench")
+    parser.add_argument("--same-path", action="store_true",
+                        help="request one path only (exercises cache and coalescing)")
+    parser.add_argument("--cache-mb", type=float, default=0)
+    parser.add_argument("--no-coalesce", action="store_true")
+    parser.add_argument("--output", default=None,
+                        help="JSON result file (default proxy_bench_<timestamp>.json)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    modes = parse_list(args.modes, str)
+    for mode in modes:
+        if mode not in SERVE_MODES:
+            raise SystemExit(f"Unknown mode: {mode}")
+    levels = parse_list(args.concurrency, int)
+    output = args.output or f"proxy_bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    # spawn: the children must not inherit the proxy's threads and locks
+    context = multiprocessing.get_context("spawn")
+
+    print("🏁 Reverse proxy benchmark")
+    print("=" * 60)
+    ready = context.Event()
+    backend = context.Process(
+        target=run_backend,
+        args=("127.0.0.1", args.backend_port, args.response_size, args.backend_delay, ready),
+        daemon=True
+    )
+    backend.start()
+    if not ready.wait(5):
+        raise SystemExit("Stand-in backend did not start")
+    print(f"🧪 Stand-in backend on port {args.backend_port}: "
+          f"{args.response_size} bytes, {args.backend_delay * 1000:.1f} ms delay")
+
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(),
+                 "cpus": os.cpu_count()},
+        "config": vars(args),
+        "startup_ms": {},
+        "runs": [],
+    }
+    try:
+        for index, mode in enumerate(modes):
+            port = args.proxy_port + index
+            proxy = start_proxy(mode, port, args.backend_port, args)
+            report["startup_ms"][mode] = round(proxy.startup_seconds * 1000, 3)
+            print(f"⏱ {mode} proxy listening {report['startup_ms'][mode]} ms after construction")
+            if args.warmup > 0:
+                warmup = argparse.Namespace(**{**vars(args), "duration": args.warmup})
+                measure(context, port, args.rate, max(levels), warmup)
+            for connections in levels:
+                result = measure(context, port, args.rate, connections, args)
+                result.update({"mode": mode, "concurrency": connections, "target_rps": args.rate})
+                report["runs"].append(result)
+                latency = result["latency_ms"]
+                print(f"📊 {mode:>8} c={connections:<4} {result['rps']:>8.1f} rps  "
+                      f"p50 {latency['p50']} ms  p99 {latency['p99']} ms  p999 {latency['p999']} ms  "
+                      f"errors {result['error_rate']:.2%}  rss peak {result['memory_kb']['peak']} KiB")
+            proxy.stop()
+    finally:
+        backend.terminate()
+        backend.join(2)
+
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
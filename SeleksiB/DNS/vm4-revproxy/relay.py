@@ -0,0 +1,83 @@
+import os
+import select
+import socket
+import threading
+
+# Size of the reusable relay buffer and of each splice() call
+RELAY_BUFFER_SIZE = 64 * 1024
+
+# Bodies shorter than this are cheaper to copy through the relay buffer
+SPLICE_THRESHOLD = 128 * 1024
+
+SPLICE_SUPPORTED = hasattr(os, "splice")
+
+
+class RelayBuffers(threading.local):
+    """Per-thread buffer and pipe, allocated once and reused for every response"""
+
+    def __init__(self):
+        self.buffer = bytearray(RELAY_BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.pipe = None
+
+    def get_pipe(self):
+        if self.pipe is None:
+            self.pipe = os.pipe()
+        return self.pipe
+
+    def reset_pipe(self):
+        # A pipe left holding bytes after an error cannot be reused
+        self.close()
+
+    def close(self):
+        """Close this thread's pipe; threads serve one connection, so call it when that ends"""
+        if self.pipe is not None:
+            for fd in self.pipe:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+            self.pipe = None
+
+
+def wait_ready(sock, event, timeout):
+    """Block until a (non-blocking) socket is readable/writable or time out"""
+    poller = select.poll()
+    poller.register(sock.fileno(), event)
+    if not poller.poll(None if timeout is None else timeout * 1000):
+        raise socket.timeout("timed out")
+
+
+def splice_stream(src, dst, buffers, count=None, timeout=10):
+    """Move bytes from one socket to another without copying them into Python
+
+    Data goes src -> pipe -> dst inside the kernel. When dst is slow the
+    pipe stays full and nothing more is read from src, so the backend is
+    throttled to the speed of the client. count=None relays until EOF.
+    Returns the number of bytes moved.
+    """
+    pipe_r, pipe_w = buffers.get_pipe()
+    flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+    moved = 0
+    try:
+        while count is None or moved < count:
+            want = RELAY_BUFFER_SIZE if count is None else min(RELAY_BUFFER_SIZE, count - moved)
+            try:
+                n = os.splice(src.fileno(), pipe_w, want, flags=flags)
+            except BlockingIOError:
+                wait_ready(src, select.POLLIN, timeout)
+                continue
+            if n == 0:
+                break
+
+            left = n
+            while left:
+                try:
+                    left -= os.splice(pipe_r, dst.fileno(), left, flags=flags)
+                except BlockingIOError:
+                    wait_ready(dst, select.POLLOUT, timeout)
+            moved += n
+    except BaseException:
+        buffers.reset_pipe()
+        raise
+    return moved
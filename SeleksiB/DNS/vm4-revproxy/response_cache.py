@@ -0,0 +1,294 @@
+import collections
+import email.utils
+import hashlib
+import threading
+import time
+
+from http_parser import dechunk
+
+# Responses the cache is allowed to store when they carry freshness info
+CACHEABLE_STATUSES = frozenset({200, 203, 301, 404, 410})
+
+# Headers that make a stored response specific to one client
+PRIVATE_RESPONSE_HEADERS = (b"set-cookie",)
+
+
+def cache_directives(value):
+    """Parse a Cache-Control header into {directive: argument or None}"""
+    directives = {}
+    for part in value.split(b","):
+        name, _, arg = part.strip().partition(b"=")
+        if name:
+            directives[name.lower()] = arg.strip(b'"') or None
+    return directives
+
+
+def parse_http_date(value):
+    try:
+        return email.utils.parsedate_to_datetime(value.decode("latin-1")).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def cache_key(request):
+    """Cache entries are keyed by method, host and path; HEAD reuses GET entries
+
+    Accept-Encoding is not part of the key: only identity bodies are
+    stored (see response_ttl), which suit every client, and the proxy
+    compresses them per client on the way out.
+    """
+    method = b"GET" if request.method == b"HEAD" else request.method
+    return method, request.headers.get(b"host", b"").lower(), request.target
+
+
+def request_cacheable(request):
+    """Whether a request may be answered from (or fill) the cache"""
+    if request.method not in (b"GET", b"HEAD") or b"authorization" in request.headers:
+        return False
+    directives = cache_directives(request.headers.get(b"cache-control", b""))
+    return b"no-store" not in directives
+
+
+def request_wants_revalidation(request):
+    """no-cache from the client: skip the lookup but let the fresh answer refill"""
+    directives = cache_directives(request.headers.get(b"cache-control", b""))
+    return b"no-cache" in directives or b"no-cache" in request.headers.get(b"pragma", b"")
+
+
+def response_ttl(response):
+    """Freshness lifetime in seconds from Cache-Control or Expires, None if not storable"""
+    if response.status not in CACHEABLE_STATUSES:
+        return None
+    headers = response.headers
+    if any(name in headers for name in PRIVATE_RESPONSE_HEADERS):
+        return None
+    if headers.get(b"vary", b"").strip().lower() not in (b"", b"accept-encoding"):
+        return None
+    # A gzip body the backend picked for this client's Accept-Encoding
+    # would reach clients that cannot decode it
+    if headers.get(b"content-encoding", b"identity").strip().lower() != b"identity":
+        return None
+
+    directives = cache_directives(headers.get(b"cache-control", b""))
+    if b"no-store" in directives or b"private" in directives or b"no-cache" in directives:
+        return None
+    for name in (b"s-maxage", b"max-age"):
+        if name in directives:
+            try:
+                ttl = int(directives[name])
+            except (TypeError, ValueError):
+                return None
+            return ttl if ttl > 0 else None
+
+    if b"expires" in headers:
+        expires = parse_http_date(headers[b"expires"])
+        if expires is None:
+            return None
+        date = parse_http_date(headers.get(b"date", b"")) or time.time()
+        ttl = expires - date
+        return ttl if ttl > 0 else None
+    return None
+
+
+class CachedResponse:
+    __slots__ = ("raw_head", "body", "headers", "status", "etag", "last_modified",
+                 "stored_at", "expires_at", "size", "_digest")
+
+    def __init__(self, raw_head, body, headers, ttl):
+        self.raw_head = raw_head
+        self.body = body
+        self.headers = headers
+        self.status = int(raw_head[9:12])
+        self.etag = headers.get(b"etag")
+        self.last_modified = headers.get(b"last-modified")
+        self.stored_at = time.monotonic()
+        self.expires_at = self.stored_at + ttl
+        self.size = len(raw_head) + len(body)
+        self._digest = None
+
+    @property
+    def digest(self):
+        """SHA-1 of the body, computed on first use"""
+        if self._digest is None:
+            self._digest = hashlib.sha1(self.body).digest()
+        return self._digest
+
+    def not_modified_by(self, request):
+        """Does a conditional request already hold this version?"""
+        headers = request.headers
+        if b"if-none-match" in headers:
+            if self.etag is None:
+                return False
+            tags = [tag.strip() for tag in headers[b"if-none-match"].split(b",")]
+            # Weak comparison, as RFC 9110 requires for If-None-Match
+            etag = self.etag[2:] if self.etag.startswith(b"W/") else self.etag
+            return b"*" in tags or any((t[2:] if t.startswith(b"W/") else t) == etag for t in tags)
+        if b"if-modified-since" in headers and self.last_modified:
+            since = parse_http_date(headers[b"if-modified-since"])
+            modified = parse_http_date(self.last_modified)
+            return since is not None and modified is not None and modified <= since
+        return False
+
+    def answer(self, request, keep_open, raw_head=None, body=None):
+        """Bytes that answer request from this response (a 304 when possible)
+
+        raw_head and body replace the stored ones, e.g. with a compressed
+        variant of the body.
+        """
+        age = int(time.monotonic() - self.stored_at)
+        connection = b"Connection: keep-alive" if keep_open else b"Connection: close"
+        if self.not_modified_by(request):
+            return self.not_modified_head() + b"\r\nAge: %d\r\n%s\r\n\r\n" % (age, connection)
+
+        if raw_head is None:
+            raw_head, body = self.raw_head, self.body
+        lines = [line for line in raw_head.split(b"\r\n")
+                 if line.split(b":", 1)[0].lower() not in (b"connection", b"keep-alive", b"age")]
+        head = b"\r\n".join(lines) + b"\r\nAge: %d\r\n%s\r\n\r\n" % (age, connection)
+        if request.method == b"HEAD":
+            return head
+        return head + body
+
+    def not_modified_head(self):
+        """Head of the 304 answer, carrying the validators of the stored response"""
+        lines = [b"HTTP/1.1 304 Not Modified"]
+        for line in self.raw_head.split(b"\r\n")[1:]:
+            name = line.split(b":", 1)[0].lower()
+            if name in (b"etag", b"last-modified", b"cache-control", b"expires", b"vary", b"date"):
+                lines.append(line)
+        return b"\r\n".join(lines)
+
+
+class CacheFill:
+    """Collects a cacheable response while the relay streams it to the client"""
+
+    __slots__ = ("key", "raw_head", "headers", "ttl", "body", "limit")
+
+    def __init__(self, key, response, ttl, limit):
+        self.key = key
+        self.raw_head = response.raw_head
+        self.headers = response.headers
+        self.ttl = ttl
+        self.body = bytearray()
+        self.limit = limit
+
+    def add(self, chunk):
+        """Append relayed body bytes, False once the response is too big to keep"""
+        self.body += chunk
+        return len(self.body) <= self.limit
+
+    def complete(self):
+        """(raw_head, body, headers) to store once the response is complete
+
+        A chunked body is stored de-chunked with a Content-Length, so that
+        it is answered and compressed like any fixed-length one.
+        """
+        if b"transfer-encoding" not in self.headers:
+            return self.raw_head, bytes(self.body), self.headers
+        body = dechunk(self.body)
+        lines = [line for line in self.raw_head.split(b"\r\n")
+                 if line.split(b":", 1)[0].lower() not in (b"transfer-encoding", b"trailer", b"content-length")]
+        lines.append(b"Content-Length: %d" % len(body))
+        headers = {name: value for name, value in self.headers.items()
+                   if name not in (b"transfer-encoding", b"trailer")}
+        headers[b"content-length"] = b"%d" % len(body)
+        return b"\r\n".join(lines), body, headers
+
+
+class ResponseCache:
+    """Byte-bounded LRU of complete backend responses with TTL expiry"""
+
+    def __init__(self, max_bytes, max_object_size=None):
+        self.max_bytes = max_bytes
+        self.max_object_size = max_object_size or max(1, max_bytes // 8)
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.bytes_served = 0
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def answer(self, request, entry, keep_open, raw_head=None, body=None):
+        """Bytes that answer request from a cached entry (a 304 when possible)"""
+        not_modified = entry.not_modified_by(request)
+        with self.lock:
+            if not_modified:
+                self.not_modified += 1
+            elif request.method != b"HEAD":
+                self.bytes_served += len(entry.body if body is None else body)
+        return entry.answer(request, keep_open, raw_head, body)
+
+    def begin_fill(self, key, response):
+        """Start collecting a response if it may be stored, otherwise None"""
+        ttl = response_ttl(response)
+        if ttl is None:
+            return None
+        if response.state == "length" and response.remaining > self.max_object_size:
+            return None
+        if response.state == "close":
+            return None
+        return CacheFill(key, response, ttl, self.max_object_size)
+
+    def finish_fill(self, fill):
+        """Store a completed fill, returns the new entry (None if it was too big)"""
+        entry = CachedResponse(*fill.complete(), fill.ttl)
+        if entry.size > self.max_object_size:
+            return None
+        with self.lock:
+            if fill.key in self.entries:
+                self._remove(fill.key)
+            self.entries[fill.key] = entry
+            self.size += entry.size
+            self.stores += 1
+            while self.size > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, host, target):
+        """Drop the stored GET after an unsafe method changed the resource"""
+        with self.lock:
+            self._remove((b"GET", host.lower(), target))
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "bytes_served": self.bytes_served,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
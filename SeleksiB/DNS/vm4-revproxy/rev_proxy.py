@@ -1,34 +1,367 @@
+import argparse
+import asyncio
+import collections
 import socket
+import ssl
 import threading
 import re
-import subprocess
 import os
 import netifaces
+import tempfile
 import time
 
+from admission import (
+    OVERLOADED,
+    RATE_LIMITED,
+    Admission,
+    IPFilter,
+    TokenBucketLimiter,
+    load_cidr_file,
+)
+from backend_pool import (
+    HOP_BY_HOP_HEADERS,
+    IDEMPOTENT_METHODS,
+    AsyncBackendPool,
+    BackendPool,
+    keep_alive_request,
+)
+from http_parser import HTTPParseError, RequestParser, ResponseParser
+from load_balancer import STRATEGIES, HealthChecker, LoadBalancer, parse_backend
+from workers import WorkerMaster
+from coalescing import SingleFlight, request_shareable, response_shareable
+from compression import (
+    MIN_COMPRESS_SIZE,
+    StreamCompressor,
+    VariantCache,
+    compress_body,
+    compressed_head,
+    compressible,
+    negotiate,
+    strong_etag,
+)
+from firewall import apply_ruleset, blocked_range_for, build_ruleset
+from log_writer import LOG_LEVELS, LogWriter
+from metrics import Metrics
+from response_cache import (
+    CacheFill,
+    CachedResponse,
+    ResponseCache,
+    cache_key,
+    request_cacheable,
+    request_wants_revalidation,
+)
+from tls import HANDSHAKE_TIMEOUT, TLSStats, self_signed_certificate, server_context
+from relay import (
+    RELAY_BUFFER_SIZE,
+    SPLICE_SUPPORTED,
+    SPLICE_THRESHOLD,
+    RelayBuffers,
+    splice_stream,
+)
+
+SERVE_MODES = ("threaded", "asyncio")
+
+# Read size for client requests
+RECV_SIZE = 16 * 1024
+
+# Pending connections the kernel queues for accept()
+LISTEN_BACKLOG = 1024
+
+# Served by the proxy itself to clients on the same machine
+METRICS_PATH = b"/__metrics"
+
+def response_status(data):
+    """Status code at the start of a response we built ourselves"""
+    try:
+        return int(data[9:12])
+    except ValueError:
+        return 0
+
+class AdmittingProtocol(asyncio.StreamReaderProtocol):
+    """Stream protocol that admits or refuses a client before its bytes are read
+
+    The transport only starts reading after connection_made, and not at
+    all once it is closed, so a refused client is never buffered and no
+    coroutine is started for it.
+    """
+
+    def __init__(self, proxy):
+        super().__init__(asyncio.StreamReader(), proxy.handle_client_async)
+        self.proxy = proxy
+
+    def connection_made(self, transport):
+        addr = transport.get_extra_info("peername")
+        rejected = self.proxy.admission.admit(addr[0] if addr else "")
+        if rejected:
+            self.proxy.reject_transport(transport, addr, rejected)
+            return
+        super().connection_made(transport)
+
+
+class ClientSession:
+    """Requests of one client connection in arrival order, without the I/O
+
+    handle_client() and handle_client_async() read from the client and
+    hand the bytes to received(); next_request() then gives the parsed
+    requests one at a time, pipelined ones included. The session counts
+    the connection as open until close().
+    """
+
+    def __init__(self, proxy, addr):
+        self.proxy = proxy
+        self.addr = addr
+        self.parser = RequestParser()
+        self.pending = collections.deque()
+        self.served = 0
+        # The first request is timed from the accept, later ones from their read
+        self.arrived = time.monotonic()
+        proxy.metrics.inc("proxy_connections_total")
+        proxy.metrics.inc("proxy_open_connections")
+
+    def read_timeout(self):
+        """A partial request gets the full read timeout, an idle connection less"""
+        return 30 if self.parser.pending else self.proxy.client_idle_timeout
+
+    def received(self, chunk):
+        """Parse bytes read from the client, returns a 400 answer if they are not HTTP"""
+        if self.served and not self.parser.pending:
+            self.arrived = time.monotonic()
+        try:
+            self.pending.extend((request, self.arrived) for request in self.parser.feed(chunk))
+        except HTTPParseError as e:
+            self.proxy.log.warning(f"⚠ Invalid HTTP request from {self.addr}: {e}")
+            return self.proxy.bad_request_response()
+        return None
+
+    def next_request(self):
+        """(request, keep_open, arrived) for the next request to answer, None to read more"""
+        if not self.pending:
+            return None
+        request, arrived = self.pending.popleft()
+        self.served += 1
+        keep_open = request.keep_alive and self.served < self.proxy.max_requests_per_connection
+        return request, keep_open, arrived
+
+    def timed_out(self):
+        if self.parser.pending or self.served == 0:
+            self.proxy.log.warning(f"⚠ Timeout receiving request from {self.addr}")
+
+    def ended(self):
+        """The client closed its side"""
+        if self.parser.pending:
+            self.proxy.log.warning(f"⚠ Incomplete request from {self.addr}")
+        elif self.served == 0:
+            self.proxy.log.warning(f"⚠ No data received from {self.addr}")
+
+    def close(self):
+        self.proxy.metrics.inc("proxy_open_connections", -1)
+        self.proxy.admission.release()
+
+
+class ResponseRelay:
+    """One backend response on its way to the client, without the I/O
+
+    relay() and relay_async() read from the backend and write to the
+    client; feed() turns each backend chunk into the bytes for the client.
+    The head is held back until it is complete so its Connection header
+    can be replaced with the client-side one, and the body is compressed
+    on the way when the client accepts an encoding. With a fill_key a
+    cacheable response is also collected for the response cache, and
+    with a flight for the requests waiting on this one.
+    """
+
+    def __init__(self, proxy, request, keep_open, fill_key=None, flight=None, encoding=None):
+        self.proxy = proxy
+        self.request = request
+        self.keep_open = keep_open
+        self.fill_key = fill_key
+        self.flight = flight
+        self.encoding = encoding
+        # The parser hands the de-chunked body to the compressor through payload
+        self.payload = [] if encoding else None
+        self.response = ResponseParser(request.method, self.payload.append if encoding else None)
+        self.head_data = b""
+        self.fill = None
+        self.compressor = None
+        self.draining = False  # the client already has the body from the variant cache
+        self.started = time.monotonic()
+
+        # What forward_request reports
+        self.forwarded = 0
+        self.first_byte = None
+        self.head_sent = None
+
+    def feed(self, chunk):
+        """Bytes to send to the client for one chunk from the backend (maybe none)"""
+        if self.first_byte is None:
+            self.first_byte = time.monotonic() - self.started
+        self.response.feed(chunk)
+        self.forwarded += len(chunk)
+        if self.head_data is not None:
+            self.head_data += chunk
+            return self._head() if self.response.head_complete else b""
+        if self.fill is not None and not self.fill.add(chunk):
+            self.fill = None
+        if self.compressor is not None:
+            return self.compressor.take(self.payload)
+        return b"" if self.draining else chunk
+
+    def _head(self):
+        proxy = self.proxy
+        response = self.response
+        encoding = self.encoding
+        body = self.head_data[response.body_start:]
+        interim = self.head_data[:response.head_start]
+        self.head_data = None
+        variant = None
+        if encoding:
+            self.compressor, variant = proxy.start_compression(self.request, response, encoding)
+        if self.compressor is not None:
+            data = (interim + proxy.client_head(compressed_head(response.raw_head, encoding), self.keep_open)
+                    + self.compressor.take(self.payload))
+        elif variant is not None:
+            data = (interim
+                    + proxy.client_head(compressed_head(response.raw_head, encoding, len(variant)), self.keep_open)
+                    + variant)
+            self.draining = True
+        else:
+            data = (interim + proxy.client_head(response.raw_head, self.keep_open and response.state != "close")
+                    + body)
+        if self.compressor is None and self.payload is not None:
+            response.body_sink = None
+            self.payload.clear()
+        self.head_sent = time.monotonic()
+        if self.fill_key is not None:
+            self.fill = proxy.begin_fill(self.fill_key, response, self.flight)
+            if self.fill is not None and not self.fill.add(body):
+                self.fill = None
+        return data
+
+    def can_splice(self):
+        """Whether the rest of the body may go socket to socket without passing through feed()"""
+        response = self.response
+        return (self.head_data is None and self.fill is None and self.compressor is None
+                and not self.draining and not response.complete
+                and (response.state == "close"
+                     or (response.state == "length" and response.remaining >= SPLICE_THRESHOLD)))
+
+    def spliced(self, moved):
+        self.forwarded += moved
+        self.response.consumed(moved)
+
+    def finish(self):
+        """Bytes still owed to the client once the backend is done (maybe none)"""
+        data = b""
+        if self.head_data:
+            # The backend stopped in the middle of the head, pass on what came
+            data = self.head_data
+            self.head_data = None
+            self.head_sent = time.monotonic()
+        elif self.compressor is not None and self.response.complete:
+            data = self.compressor.finish()
+            self.proxy.finish_compression(self.request, self.response, self.compressor)
+        if self.fill is not None and self.response.complete:
+            self.proxy.finish_fill(self.fill, self.flight)
+        return data
+
+
 class ReverseProxy:
-    def __init__(self):
-        self.proxy_host = "0.0.0.0"  # Listen on all interfaces
-        self.proxy_port = 8080  # Match client.py's port
-        self.target_host = "169.254.187.117"  # VM2's IP (confirm this matches)
-        self.target_port = 8080  # VM2's HTTP server port
+    def __init__(self, proxy_host="0.0.0.0", proxy_port=8080,
+                 target_host="169.254.187.117", target_port=8080, mode="threaded",
+                 pool_size=32, pool_idle_timeout=30.0, use_splice=True,
+                 client_idle_timeout=15.0, max_requests_per_connection=100,
+                 backends=None, strategy="round-robin", health_interval=5.0, health_path="/",
+                 cache_size=0, workers=1, coalesce=True, log_level="info",
+                 firewall=True, autostart=True, block=(), allow=(), allow_only=False,
+                 rate_limit=0, rate_burst=None, max_connections=1024, firewall_dry_run=False,
+                 compress=True, compress_level=6, compress_min_size=MIN_COMPRESS_SIZE,
+                 compress_cache_size=8 * 1024 * 1024, tls_cert=None, tls_key=None,
+                 tls_session_tickets=True, tls_handshake_timeout=HANDSHAKE_TIMEOUT):
+        # Startup time is measured from here to the bound listening socket
+        self.created_at = time.monotonic()
+        self.startup_seconds = None
+        self.proxy_host = proxy_host  # Listen on all interfaces
+        self.proxy_port = proxy_port  # Match client.py's port
+
+        # Backend servers as (host, port); a single target is VM2's HTTP server
+        self.backends = list(backends) if backends else [(target_host, target_port)]
+        self.target_host, self.target_port = self.backends[0]
+        self.balancer = LoadBalancer(self.backends, strategy)
+        self.health_checker = HealthChecker(self.balancer, interval=health_interval, path=health_path)
+
+        # "threaded" = one thread per connection, "asyncio" = single event loop
+        if mode not in SERVE_MODES:
+            raise ValueError(f"Unknown serve mode: {mode}")
+        self.mode = mode
+
+        # workers > 1 = pre-fork master with that many SO_REUSEPORT workers
+        self.workers = workers
+        self.reuse_port = workers > 1
+
+        # Keep-alive connections to the backend, one pool per host:port
+        self.pool_size = pool_size
+        self.pool_idle_timeout = pool_idle_timeout
+        self.backend_pools = {}
+        self.backend_pools_lock = threading.Lock()
+
+        # Optional TLS termination. The context, and with it the session ticket
+        # key, is created before workers fork, so a ticket resumes on any worker
+        self.tls = server_context(tls_cert, tls_key, tls_session_tickets) if tls_cert else None
+        self.tls_stats = TLSStats(self.tls) if self.tls else None
+        self.tls_handshake_timeout = tls_handshake_timeout
+        if self.tls is not None and mode == "asyncio" and not hasattr(asyncio.StreamWriter, "start_tls"):
+            raise ValueError("TLS in asyncio mode needs Python 3.11 or newer")
+
+        # Response streaming: reusable per-thread buffers, kernel splice for big
+        # bodies (not through TLS, the bytes have to be encrypted in user space)
+        self.relay_buffers = RelayBuffers()
+        self.use_splice = use_splice and SPLICE_SUPPORTED and self.tls is None
+
+        # Client-side keep-alive
+        self.client_idle_timeout = client_idle_timeout
+        self.max_requests_per_connection = max_requests_per_connection
+
+        # Optional in-memory response cache (cache_size in bytes, 0 = off)
+        self.cache = ResponseCache(cache_size) if cache_size > 0 else None
+
+        # Identical concurrent GETs share one backend request
+        self.coalescer = SingleFlight() if coalesce else None
+
+        # gzip/deflate for clients that accept it; compressed bodies are kept
+        # in a variant cache (compress_cache_size in bytes) to compress once
+        self.compress = compress
+        self.compress_level = compress_level
+        self.compress_min_size = compress_min_size
+        self.variants = VariantCache(compress_cache_size) if compress else None
+
+        # Request path logging goes through a background writer, numbers to /__metrics
+        self.log = LogWriter(log_level)
+        self.metrics = Metrics()
+
+        # Admission on accept: CIDR block/allow lists, per-IP connection rate
+        # (connections per second, 0 = off) and a cap on open connections (0 = none)
+        ip_filter = IPFilter(block, allow, default_allow=not allow_only) \
+            if block or allow or allow_only else None
+        limiter = TokenBucketLimiter(rate_limit, rate_burst) if rate_limit > 0 else None
+        self.admission = Admission(ip_filter, limiter, max_connections)
+
+        # Set by stop(), also used by the benchmark to end an in-process proxy
+        self.stopping = threading.Event()
+        self.server = None
+        self.loop = None
 
         # Auto-detect current IP for logging
         self.current_ip = self.get_current_ip()
         print(f"Reverse Proxy running on: {self.current_ip}")
 
-        # Test connection to backend server first
-        if self.test_backend_connection():
-            print(f"✓ Backend server {self.target_host}:{self.target_port} is reachable")
-        else:
-            print(f"⚠ WARNING: Backend server {self.target_host}:{self.target_port} may not be reachable")
-            print("Make sure VM2 is running and serving HTTP on port 8080")
-
-        # Set up firewall
-        self.setup_firewall()
+        # Firewall rules are applied once the port is bound (off when testing
+        # on a machine we do not own, dry run only prints them)
+        self.firewall = firewall
+        self.firewall_dry_run = firewall_dry_run
 
-        # Start the proxy server
-        self.start()
+        # Start the proxy server; autostart=False leaves it to start()/serve()
+        if autostart:
+            self.start()
 
     def get_current_ip(self):
         """Auto-detect current IP address"""
@@ -47,219 +380,993 @@ class ReverseProxy:
             print(f"Error detecting IP: {e}")
         return "unknown"
 
-    def test_backend_connection(self):
+    def test_backend_connection(self, host, port):
         """Test if backend server is reachable"""
         try:
             test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             test_socket.settimeout(3)
-            result = test_socket.connect_ex((self.target_host, self.target_port))
+            result = test_socket.connect_ex((host, port))
             test_socket.close()
             return result == 0
         except Exception as e:
             print(f"Backend connection test failed: {e}")
             return False
 
+    def probe_backends(self):
+        """Check every backend once, run in the background so startup never waits"""
+        for host, port in self.backends:
+            if self.test_backend_connection(host, port):
+                print(f"✓ Backend server {host}:{port} is reachable")
+            else:
+                print(f"⚠ WARNING: Backend server {host}:{port} may not be reachable")
+                print("Make sure VM2 is running and serving HTTP on port 8080")
+
     def setup_firewall(self):
-        """Setup iptables firewall rules for bonus points"""
+        """Setup iptables firewall rules for bonus points
+
+        The whole rule set is built in memory and loaded with a single
+        iptables-restore, so it is applied atomically and costs one
+        subprocess instead of one per rule.
+        """
+        if not self.firewall:
+            return
+        blocked_range = blocked_range_for(self.current_ip)
+        ruleset = build_ruleset(self.proxy_port, self.backends, blocked_range)
+        if self.firewall_dry_run:
+            print("🧱 Firewall dry run, this ruleset would be loaded with iptables-restore:")
+            print(ruleset, end="")
+            return
+
         print("Setting up firewall rules...")
+        started = time.monotonic()
         try:
-            # Clear existing rules (be careful in production!)
-            subprocess.run(["sudo", "iptables", "-F"], check=False)
-            subprocess.run(["sudo", "iptables", "-X"], check=False)
+            apply_ruleset(ruleset)
+        except Exception as e:
+            print(f"⚠ Firewall setup failed: {e}")
+            print("Continuing without firewall rules...")
+            return
+        print(f"✓ Allowing HTTP traffic on port {self.proxy_port}")
+        if blocked_range:
+            print(f"✓ Blocked IP range: {blocked_range}")
+        for host, port in self.backends:
+            print(f"✓ Allowing outbound traffic to backend {host}:{port}")
+        print(f"✅ Firewall rules applied successfully! ({(time.monotonic() - started) * 1000:.1f} ms)")
 
-            # Set default policies
-            subprocess.run(["sudo", "iptables", "-P", "INPUT", "ACCEPT"], check=False)
-            subprocess.run(["sudo", "iptables", "-P", "FORWARD", "ACCEPT"], check=False)
-            subprocess.run(["sudo", "iptables", "-P", "OUTPUT", "ACCEPT"], check=False)
+    def bad_gateway_response(self, backend=None):
+        """Build the 502 page sent when the backend cannot be reached"""
+        backend_name = backend.name if backend else f"{self.target_host}:{self.target_port}"
+        error_response = (
+            "HTTP/1.1 502 Bad Gateway\r\n"
+            "Content-Type: text/html\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+            "<html><body><h1>502 Bad Gateway</h1>"
+            "<p>The reverse proxy cannot connect to the backend server.</p>"
+            f"<p>Backend: {backend_name}</p>"
+            "</body></html>\r\n"
+        )
+        return error_response.encode('utf-8')
 
-            # Allow loopback
-            subprocess.run(["sudo", "iptables", "-A", "INPUT", "-i", "lo", "-j", "ACCEPT"], check=False)
+    def bad_request_response(self):
+        """Build the 400 page sent when the client request cannot be framed"""
+        error_response = (
+            "HTTP/1.1 400 Bad Request\r\n"
+            "Content-Type: text/html\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+            "<html><body><h1>400 Bad Request</h1>"
+            "<p>The reverse proxy could not parse the request.</p>"
+            "</body></html>\r\n"
+        )
+        return error_response.encode('utf-8')
 
-            # Allow established connections
-            subprocess.run(["sudo", "iptables", "-A", "INPUT", "-m", "state", "--state", "ESTABLISHED,RELATED", "-j", "ACCEPT"], check=False)
+    def gateway_timeout_response(self):
+        """Build the 504 page sent when the backend returns nothing"""
+        error_response = (
+            "HTTP/1.1 504 Gateway Timeout\r\n"
+            "Content-Type: text/html\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+            "<html><body><h1>504 Gateway Timeout</h1>"
+            "<p>The backend server did not respond in time.</p>"
+            "</body></html>\r\n"
+        )
+        return error_response.encode('utf-8')
 
-            # Allow only HTTP traffic on port 8080
-            subprocess.run(["sudo", "iptables", "-A", "INPUT", "-p", "tcp", "--dport", "8080", "-j", "ACCEPT"], check=False)
-            print("✓ Allowing HTTP traffic on port 8080")
+    def rejection_response(self, reason):
+        """Answer for a connection turned away on accept, None means just close it"""
+        if reason == RATE_LIMITED:
+            status, text = "429 Too Many Requests", "Too many connections from your address, slow down."
+        elif reason == OVERLOADED:
+            status, text = "503 Service Unavailable", "The reverse proxy is at its connection limit."
+        else:
+            # Blocked addresses are dropped silently, like the iptables DROP rule
+            return None
+        error_response = (
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/html\r\n"
+            "Retry-After: 1\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+            f"<html><body><h1>{status}</h1><p>{text}</p></body></html>\r\n"
+        )
+        return error_response.encode('utf-8')
 
-            # Block specific IP range (example: .100-.115)
-            network_base = ".".join(self.current_ip.split('.')[:-1])
-            blocked_range = f"{network_base}.100/28"  # Blocks .100-.115
-            subprocess.run(["sudo", "iptables", "-A", "INPUT", "-s", blocked_range, "-j", "DROP"], check=False)
-            print(f"✓ Blocked IP range: {blocked_range}")
+    def note_rejection(self, addr, reason):
+        self.metrics.inc("proxy_rejected_total", reason=reason)
+        self.log.debug(f"⛔ Rejected connection from {addr}: {reason}")
+        return self.rejection_response(reason)
 
-            # Allow outbound traffic to backend server
-            subprocess.run(["sudo", "iptables", "-A", "OUTPUT", "-p", "tcp", "-d", self.target_host, "--dport", str(self.target_port), "-j", "ACCEPT"], check=False)
-            print(f"✓ Allowing outbound traffic to backend {self.target_host}:{self.target_port}")
+    def reject_connection(self, client_socket, addr, reason):
+        """Answer a refused connection without reading from it or starting a thread"""
+        answer = self.note_rejection(addr, reason)
+        try:
+            # A TLS client could not read a plain HTTP answer
+            if answer and self.tls is None:
+                # Never wait for a client we are refusing
+                client_socket.setblocking(False)
+                client_socket.send(answer)
+        except OSError:
+            pass
+        finally:
+            client_socket.close()
 
-            # Allow SSH (port 22) to maintain connection
-            subprocess.run(["sudo", "iptables", "-A", "INPUT", "-p", "tcp", "--dport", "22", "-j", "ACCEPT"], check=False)
+    def reject_transport(self, transport, addr, reason):
+        """reject_connection for the asyncio mode, before the transport reads anything"""
+        answer = self.note_rejection(addr, reason)
+        if answer and self.tls is None:
+            # Buffered by the transport and sent before it closes, never awaited
+            transport.write(answer)
+            transport.close()
+        else:
+            transport.abort()
 
-            print("✅ Firewall rules applied successfully!")
+    def tls_accept(self, client_socket, addr):
+        """TLS handshake on an accepted client socket, returns the SSLSocket or None"""
+        started = time.monotonic()
+        client_socket.settimeout(self.tls_handshake_timeout)
+        try:
+            tls_socket = self.tls.wrap_socket(client_socket, server_side=True)
+        except (OSError, ValueError) as e:
+            self.tls_failed(addr, e)
+            return None
+        self.tls_done(tls_socket, started)
+        return tls_socket
 
+    async def tls_accept_async(self, writer, addr):
+        """Upgrade an accepted stream to TLS, returns False if the handshake failed"""
+        started = time.monotonic()
+        try:
+            await writer.start_tls(self.tls, ssl_handshake_timeout=self.tls_handshake_timeout)
         except Exception as e:
-            print(f"⚠ Firewall setup failed: {e}")
-            print("Continuing without firewall rules...")
+            self.tls_failed(addr, e)
+            return False
+        self.tls_done(writer.get_extra_info("ssl_object"), started)
+        return True
 
-    def handle_client(self, client_socket, addr):
-        """Handle individual client connections and forward to target"""
-        target_socket = None
-        try:
-            print(f"📥 New connection from {addr}")
+    def tls_done(self, ssl_object, started):
+        resumed = self.tls_stats.handshake_done(ssl_object)
+        self.metrics.inc("proxy_tls_handshakes_total", resumed="true" if resumed else "false")
+        self.metrics.observe("proxy_tls_handshake_seconds", time.monotonic() - started)
 
-            # Set socket timeout to prevent hanging
-            client_socket.settimeout(30)
+    def tls_failed(self, addr, error):
+        self.tls_stats.handshake_failed()
+        self.metrics.inc("proxy_tls_handshake_failures_total")
+        self.log.debug(f"🔒 TLS handshake with {addr} failed: {error}")
 
-            # Receive request
-            request_data = b""
-            while True:
-                try:
-                    chunk = client_socket.recv(1024)
-                    if not chunk:
-                        break
-                    request_data += chunk
-                    # Check if we have complete HTTP headers
-                    if b'\r\n\r\n' in request_data:
-                        break
-                except socket.timeout:
-                    print(f"⚠ Timeout receiving request from {addr}")
-                    return
+    def log_request_line(self, request):
+        """Log the request line and the method/path being forwarded"""
+        self.log.debug(f"📋 Request: {request.request_line.decode('latin-1')}")
+        self.log.debug(f"🔄 Forwarding {request.method.decode('latin-1')} "
+                       f"{request.target.decode('latin-1')} to backend")
 
-            if not request_data:
-                print(f"⚠ No data received from {addr}")
-                return
+    def log_response_line(self, status_line):
+        """Log the status line of a backend response"""
+        if status_line:
+            self.log.debug(f"📋 Response: {status_line.decode('latin-1').strip()}")
+
+    def is_local_client(self, addr):
+        return bool(addr) and (addr[0].startswith("127.") or addr[0] == "::1")
+
+    def metrics_response(self, keep_open):
+        """Answer for METRICS_PATH, the counters of this process in Prometheus format"""
+        body = self.metrics.render(self.collect_stats()).encode()
+        return (
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            b"Content-Length: %d\r\n"
+            b"Cache-Control: no-store\r\n"
+            b"%s\r\n\r\n" % (len(body), b"Connection: keep-alive" if keep_open else b"Connection: close")
+        ) + body
+
+    def record_request(self, request, addr, arrived, source, status, sent, first_sent=None):
+        """Count one answered request and write its access log line
+
+        arrived is when the request was read (the accept for the first one
+        on a connection), first_sent when its first response byte went out.
+        """
+        now = time.monotonic()
+        metrics = self.metrics
+        metrics.inc("proxy_requests_total", source=source)
+        metrics.inc("proxy_responses_total", code=f"{status // 100}xx" if status else "none")
+        metrics.inc("proxy_client_bytes_received_total", len(request.raw))
+        metrics.inc("proxy_client_bytes_sent_total", sent)
+        metrics.observe("proxy_first_byte_seconds", (first_sent or now) - arrived)
+        metrics.observe("proxy_request_duration_seconds", now - arrived)
+        metrics.observe("proxy_response_size_bytes", sent)
+        self.log.info(f"✅ {addr[0] if addr else '-'} {request.request_line.decode('latin-1')} "
+                      f"{status or '-'} {sent}B {(now - arrived) * 1000:.1f}ms {source}")
+
+    def get_backend_pool(self, host, port):
+        """Return the keep-alive pool for a backend, creating it on first use"""
+        key = (host, port)
+        pool = self.backend_pools.get(key)
+        if pool is None:
+            pool_class = AsyncBackendPool if self.mode == "asyncio" else BackendPool
+            with self.backend_pools_lock:
+                pool = self.backend_pools.setdefault(key, pool_class(
+                    host, port,
+                    max_size=self.pool_size,
+                    idle_timeout=self.pool_idle_timeout
+                ))
+        return pool
 
-            # Parse HTTP request
-            request_str = request_data.decode('utf-8', errors='ignore')
-            lines = request_str.split('\n')
-            if lines:
-                first_line = lines[0].strip()
-                print(f"📋 Request: {first_line}")
+    def pool_stats(self):
+        """Hit/miss counters of every backend pool"""
+        return [pool.stats() for pool in list(self.backend_pools.values())]
 
-                # Extract method and path
+    def collect_stats(self):
+        """Counters of this process, as reported by a worker to the master"""
+        return {
+            "backends": self.balancer.stats(),
+            "pools": self.pool_stats(),
+            "cache": self.cache.stats() if self.cache else None,
+            "coalescing": self.coalescer.stats() if self.coalescer else None,
+            "compression": self.variants.stats() if self.variants else None,
+            "tls": self.tls_stats.stats() if self.tls_stats else None,
+            "log_dropped": self.log.dropped,
+            "admission": self.admission.stats(),
+        }
+
+    def print_stats(self):
+        self.print_admission_stats()
+        self.print_tls_stats()
+        self.print_backend_stats()
+        self.print_pool_stats()
+        self.print_cache_stats()
+        self.print_coalescing_stats()
+        self.print_compression_stats()
+
+    def print_admission_stats(self):
+        stats = self.admission.stats()
+        if stats['blocked'] or stats['rate_limited'] or stats['overloaded']:
+            print(f"📊 Admission: {stats['blocked']} blocked, {stats['rate_limited']} rate limited, "
+                  f"{stats['overloaded']} over the {stats['max_connections']} connection limit")
+
+    def print_tls_stats(self):
+        if self.tls_stats is None:
+            return
+        stats = self.tls_stats.stats()
+        print(f"📊 TLS: {stats['handshakes']} handshakes, {stats['resumed']} resumed "
+              f"(resumption rate {stats['resumption_rate']:.1%}), {stats['failures']} failed, "
+              f"{stats['cached_sessions']} sessions cached")
+
+    def print_backend_stats(self):
+        for stats in self.balancer.stats():
+            state = "up" if stats['healthy'] else "down"
+            print(f"📊 Backend {stats['backend']} ({state}): {stats['requests']} requests, "
+                  f"{stats['failures']} failures, latency {stats['latency_ms']} ms")
+
+    def print_pool_stats(self):
+        for stats in self.pool_stats():
+            print(f"📊 Pool {stats['backend']}: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['stale']} stale, {stats['retries']} retries, {stats['idle']} idle")
+
+    def client_head(self, raw_head, keep_open):
+        """Response head for the client with our own Connection header"""
+        lines = raw_head.split(b"\r\n")
+        kept = [lines[0]]
+        for line in lines[1:]:
+            if line.split(b":", 1)[0].lower() not in HOP_BY_HOP_HEADERS:
+                kept.append(line)
+        kept.append(b"Connection: keep-alive" if keep_open else b"Connection: close")
+        return b"\r\n".join(kept) + b"\r\n\r\n"
+
+    def begin_fill(self, key, response, flight):
+        """Start collecting a response for the cache and/or coalesced followers
+
+        Without a cache fill the body is only collected when a follower is
+        already waiting; otherwise the flight ends here and the response
+        is relayed without a copy (and can be spliced).
+        """
+        fill = self.cache.begin_fill(key, response) if self.cache else None
+        if fill is not None or flight is None or self.coalescer.abandon(flight):
+            return fill
+        if response.state == "close" or not response_shareable(response.status, response.headers) \
+                or (response.state == "length" and response.remaining > self.coalescer.max_object_size):
+            # Let the followers go to the backend now rather than after this transfer
+            self.coalescer.finish(flight)
+            return None
+        return CacheFill(key, response, None, self.coalescer.max_object_size)
+
+    def finish_fill(self, fill, flight):
+        """Store a complete response and hand it to the requests waiting on it"""
+        entry = self.cache.finish_fill(fill) if fill.ttl is not None else None
+        if flight is not None:
+            if entry is None:
+                entry = CachedResponse(*fill.complete(), 0)
+            # A cache fill can be storable and still not fit the followers
+            self.coalescer.finish(flight, entry if response_shareable(entry.status, entry.headers) else None)
+
+    def client_encoding(self, request):
+        """Content coding the client's response may be compressed with, None for none
+
+        Compressed bodies go out chunked, which HTTP/1.0 clients cannot read.
+        """
+        if not self.compress or request.version != b"HTTP/1.1" or request.method == b"HEAD":
+            return None
+        return negotiate(request.headers.get(b"accept-encoding", b""))
+
+    def start_compression(self, request, response, encoding):
+        """Decide how a backend response reaches a client accepting encoding
+
+        Returns (compressor, variant): a StreamCompressor to compress the
+        body on the way, a compressed body already in the variant cache
+        (the backend body is then only read, not sent), or neither.
+        """
+        # Close-delimited bodies never complete cleanly, so no final chunk could be sent
+        if response.state == "close" or not compressible(
+                response.status, response.headers, request.method, self.compress_min_size):
+            return None, None
+        etag = strong_etag(response.headers)
+        if etag is not None:
+            variant = self.variants.get(VariantCache.etag_key(encoding, request, etag))
+            if variant is not None:
+                self.metrics.inc("proxy_compressed_responses_total", encoding=encoding.decode())
+                return None, variant
+        return StreamCompressor(encoding, self.compress_level, self.variants.max_object_size,
+                                hash_body=etag is None), None
+
+    def finish_compression(self, request, response, compressor):
+        """Count a streamed compression and keep the result for the next request"""
+        encoding = compressor.encoding
+        self.variants.count(compressor.bytes_in, compressor.bytes_out)
+        self.metrics.inc("proxy_compressed_responses_total", encoding=encoding.decode())
+        if compressor.collected is None:
+            return
+        etag = strong_etag(response.headers)
+        if etag is not None:
+            key = VariantCache.etag_key(encoding, request, etag)
+        else:
+            key = VariantCache.digest_key(encoding, compressor.digest.digest())
+        self.variants.put(key, bytes(compressor.collected))
+
+    def entry_answer(self, request, entry, keep_open, cached=True):
+        """Answer from a stored response, compressed if the client accepts it"""
+        raw_head = body = None
+        encoding = self.client_encoding(request)
+        if encoding and not entry.not_modified_by(request) \
+                and compressible(entry.status, entry.headers, request.method, self.compress_min_size):
+            etag = strong_etag(entry.headers)
+            if etag is not None:
+                key = VariantCache.etag_key(encoding, request, etag)
+            else:
+                key = VariantCache.digest_key(encoding, entry.digest)
+            body = self.variants.get(key)
+            if body is None:
+                body = compress_body(entry.body, encoding, self.compress_level)
+                self.variants.count(len(entry.body), len(body))
+                self.variants.put(key, body)
+            self.metrics.inc("proxy_compressed_responses_total", encoding=encoding.decode())
+            raw_head = compressed_head(entry.raw_head, encoding, len(body))
+        if cached:
+            return self.cache.answer(request, entry, keep_open, raw_head, body)
+        return entry.answer(request, keep_open, raw_head, body)
+
+    def relay(self, target_conn, request_data, request, client_socket, keep_open,
+              fill_key=None, flight=None, encoding=None):
+        """Send one request to the backend and stream the response to the client
+
+        Chunks are written to the client as soon as they arrive, through a
+        per-thread buffer that is reused for every response. Large
+        fixed-length or close-delimited bodies are spliced socket to socket
+        in the kernel; a slow client blocks the relay and so throttles the
+        backend. What happens to the bytes in between (head rewriting,
+        compression, cache fill, coalescing) is up to the ResponseRelay,
+        which is returned: its ResponseParser tells whether the response
+        completed and how it was framed.
+        """
+        relay = ResponseRelay(self, request, keep_open, fill_key, flight, encoding)
+        try:
+            target_conn.sock.sendall(request_data)
+        except OSError as e:
+            self.log.warning(f"⚠ Error sending to backend: {e}")
+            return relay
+        self.log.debug(f"📤 Forwarded {len(request_data)} bytes to backend")
+
+        # Stream response from backend
+        buffers = self.relay_buffers
+        target_socket = target_conn.sock
+        response = relay.response
+        while not response.complete:
+            try:
+                n = target_socket.recv_into(buffers.buffer)
+            except socket.timeout:
+                self.log.warning("⚠ Timeout receiving response from backend")
+                break
+            except Exception as e:
+                self.log.warning(f"⚠ Error receiving from backend: {e}")
+                break
+            if not n:
+                break
+            data = relay.feed(buffers.view[:n])
+            if data:
+                client_socket.sendall(data)
+
+            if self.use_splice and relay.can_splice():
+                count = response.remaining if response.state == "length" else None
                 try:
-                    parts = first_line.split()
-                    if len(parts) >= 2:
-                        method, path = parts[0], parts[1]
-                        print(f"🔄 Forwarding {method} {path} to backend")
-                    else:
-                        print(f"⚠ Invalid HTTP request format: {first_line}")
-                except Exception as e:
-                    print(f"⚠ Error parsing request: {e}")
+                    moved = splice_stream(target_socket, client_socket, buffers, count)
+                except socket.timeout:
+                    self.log.warning("⚠ Timeout relaying response body")
+                    break
+                relay.spliced(moved)
+                break
+
+        data = relay.finish()
+        if data:
+            client_socket.sendall(data)
+        return relay
 
-            # Connect to backend server
-            target_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            target_socket.settimeout(10)
+    async def relay_async(self, target_conn, request_data, request, writer, keep_open,
+                          fill_key=None, flight=None, encoding=None):
+        """Event-loop version of relay, drain() applies backpressure from the client"""
+        relay = ResponseRelay(self, request, keep_open, fill_key, flight, encoding)
+        try:
+            target_conn.writer.write(request_data)
+            await target_conn.writer.drain()
+        except OSError as e:
+            self.log.warning(f"⚠ Error sending to backend: {e}")
+            return relay
+        self.log.debug(f"📤 Forwarded {len(request_data)} bytes to backend")
 
+        # Stream response from backend
+        while not relay.response.complete:
             try:
-                target_socket.connect((self.target_host, self.target_port))
-                print(f"🔗 Connected to backend {self.target_host}:{self.target_port}")
+                chunk = await asyncio.wait_for(target_conn.reader.read(RELAY_BUFFER_SIZE), timeout=10)
+            except asyncio.TimeoutError:
+                self.log.warning("⚠ Timeout receiving response from backend")
+                break
             except Exception as e:
-                print(f"❌ Failed to connect to backend: {e}")
-                # Send 502 Bad Gateway response
-                error_response = (
-                    "HTTP/1.1 502 Bad Gateway\r\n"
-                    "Content-Type: text/html\r\n"
-                    "Connection: close\r\n"
-                    "\r\n"
-                    "<html><body><h1>502 Bad Gateway</h1>"
-                    "<p>The reverse proxy cannot connect to the backend server.</p>"
-                    f"<p>Backend: {self.target_host}:{self.target_port}</p>"
-                    "</body></html>\r\n"
-                )
-                client_socket.sendall(error_response.encode('utf-8'))
-                return
+                self.log.warning(f"⚠ Error receiving from backend: {e}")
+                break
+            if not chunk:
+                break
+            data = relay.feed(chunk)
+            if data:
+                writer.write(data)
+                await writer.drain()
 
-            # Forward request to backend
-            target_socket.sendall(request_data)
-            print(f"📤 Forwarded {len(request_data)} bytes to backend")
+        data = relay.finish()
+        if data:
+            writer.write(data)
+            await writer.drain()
+        return relay
 
-            # Receive response from backend
-            response_data = b""
-            target_socket.settimeout(10)
+    def handle_client(self, client_socket, addr):
+        """Serve every request of one client connection, in order
+
+        Requests are parsed as they arrive, so pipelined requests queue up
+        and are answered one after the other. The connection stays open
+        between requests until the client asks to close, the idle timeout
+        passes or max_requests_per_connection is reached.
+        """
+        session = ClientSession(self, addr)
+        try:
+            self.log.debug(f"📥 New connection from {addr}")
+            if self.tls is not None:
+                tls_socket = self.tls_accept(client_socket, addr)
+                if tls_socket is None:
+                    return
+                client_socket = tls_socket
 
             while True:
-                try:
-                    chunk = target_socket.recv(4096)
+                next_request = session.next_request()
+                if next_request is None:
+                    # Set socket timeout to prevent hanging
+                    client_socket.settimeout(session.read_timeout())
+                    try:
+                        chunk = client_socket.recv(RECV_SIZE)
+                    except socket.timeout:
+                        session.timed_out()
+                        return
                     if not chunk:
-                        break
-                    response_data += chunk
-                except socket.timeout:
-                    print("⚠ Timeout receiving response from backend")
-                    break
+                        session.ended()
+                        return
+                    error = session.received(chunk)
+                    if error:
+                        client_socket.sendall(error)
+                        return
+                    continue
+
+                request, keep_open, arrived = next_request
+                if not self.forward_request(request, client_socket, addr, keep_open, arrived):
+                    return
+
+        except Exception as e:
+            import traceback
+            self.log.error(f"❌ Error handling client {addr}: {e}\n{traceback.format_exc().rstrip()}")
+        finally:
+            session.close()
+            self.relay_buffers.close()
+            # Clean up connection
+            try:
+                if isinstance(client_socket, ssl.SSLSocket):
+                    # Send close_notify but do not wait for the client's: OpenSSL
+                    # drops the session from its cache if the connection just ends
+                    client_socket.setblocking(False)
+                    client_socket.unwrap()
+            except (OSError, ValueError):
+                pass
+            try:
+                client_socket.close()
+            except:
+                pass
+
+    def cache_lookup(self, request, keep_open):
+        """Check the response cache for a request
+
+        Returns the bytes of a cached answer (None on a miss) and the key
+        under which the backend response should be stored (None if it
+        must not be).
+        """
+        if self.cache is None and self.coalescer is None:
+            return None, None
+        if not request_cacheable(request):
+            if self.cache and request.method not in (b"GET", b"HEAD", b"OPTIONS"):
+                self.cache.invalidate(request.headers.get(b"host", b""), request.target)
+            return None, None
+
+        key = cache_key(request)
+        if self.cache and not request_wants_revalidation(request):
+            entry = self.cache.lookup(key)
+            if entry is not None:
+                return self.entry_answer(request, entry, keep_open), None
+        # HEAD responses have no body, only a GET can fill the cache
+        return None, key if request.method == b"GET" else None
+
+    def join_flight(self, request, fill_key, loop=None):
+        """Join the in-flight request for the same GET, returns (flight, leader)
+
+        Requests with cookies, validators or a Range get an answer that
+        fits only them and neither lead nor join a flight.
+        """
+        if self.coalescer is None or fill_key is None or not request_shareable(request):
+            return None, True
+        return self.coalescer.join(fill_key, loop)
+
+    def print_coalescing_stats(self):
+        if self.coalescer is None:
+            return
+        stats = self.coalescer.stats()
+        print(f"📊 Coalescing: {stats['coalesced']} backend calls saved, "
+              f"{stats['fallbacks']} followers fell back, {stats['leaders']} leader requests")
+
+    def print_compression_stats(self):
+        if self.variants is None:
+            return
+        stats = self.variants.stats()
+        if stats['bytes_in']:
+            print(f"📊 Compression: {stats['bytes_in']} bytes in, {stats['bytes_out']} out "
+                  f"({stats['bytes_out'] / stats['bytes_in']:.1%}), {stats['hits']} variant cache hits, "
+                  f"{stats['entries']} variants / {stats['bytes']} bytes")
+
+    def print_cache_stats(self):
+        if self.cache is None:
+            return
+        stats = self.cache.stats()
+        print(f"📊 Cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"(hit ratio {stats['hit_ratio']:.1%}), {stats['not_modified']} not modified, "
+              f"{stats['evictions']} evictions, {stats['entries']} entries / {stats['bytes']} bytes")
+
+    def local_answer(self, request, addr, keep_open):
+        """Answer the proxy can give without a backend: metrics, cache or None
+
+        Returns the bytes to send, where they came from, and the cache key
+        to fill from the backend response otherwise.
+        """
+        if request.target == METRICS_PATH and self.is_local_client(addr):
+            return self.metrics_response(keep_open), "metrics", None
+        answer, fill_key = self.cache_lookup(request, keep_open)
+        if answer is not None:
+            self.log.debug(f"💾 Answered {request.target.decode('latin-1')} from cache")
+            return answer, "cache", None
+        return None, None, fill_key
+
+    def shared_answer(self, request, shared, keep_open):
+        """A follower's answer from its leader's response, None to ask the backend"""
+        if shared is None:
+            return None
+        self.log.debug(f"🤝 Answered {request.target.decode('latin-1')} from an in-flight request")
+        return self.entry_answer(request, shared, keep_open, cached=False)
+
+    def backend_failed(self, backend, error, request, can_retry):
+        """Note a failed backend connect, returns another backend to try or None"""
+        self.metrics.inc("proxy_backend_errors_total", kind="connect")
+        self.log.error(f"❌ Failed to connect to backend {backend.name}: {error}")
+        if self.balancer.connect_failed(backend):
+            self.log.warning(f"💔 Backend {backend.name} ejected until it passes health checks")
+        # An idempotent request can still go to another backend
+        other = self.balancer.choose(request.target, exclude=backend) if can_retry else None
+        if other is not None:
+            self.balancer.finish(backend, ok=False)
+        return other
+
+    def backend_connected(self, backend, target_conn, connect_started):
+        if target_conn.reused:
+            self.log.debug(f"🔗 Reusing pooled connection to backend {backend.name}")
+        else:
+            self.metrics.observe("proxy_backend_connect_seconds", time.monotonic() - connect_started)
+            self.log.debug(f"🔗 Connected to backend {backend.name}")
+
+    def stale_connection(self, pool, target_conn, can_retry):
+        """The backend closed an idle pooled connection under us, True to retry on a fresh one"""
+        self.metrics.inc("proxy_backend_errors_total", kind="stale")
+        pool.discard(target_conn)
+        if can_retry:
+            pool.note_retry()
+            self.log.debug("♻ Pooled connection was stale, retrying on a fresh one")
+        return can_retry
+
+    def no_response(self):
+        """504 answer for a backend that sent nothing back"""
+        self.metrics.inc("proxy_backend_errors_total", kind="no_response")
+        self.log.warning("⚠ No response received from backend")
+        return self.gateway_timeout_response()
+
+    def relay_done(self, request, addr, arrived, keep_open, relay):
+        """Log a relayed response, True when the client connection can serve another request"""
+        response = relay.response
+        self.log.debug(f"📤 Forwarded {relay.forwarded} bytes to client")
+        # Log response status
+        self.log_response_line(response.status_line)
+        self.metrics.observe("proxy_backend_ttfb_seconds", relay.first_byte)
+        if not response.complete:
+            self.metrics.inc("proxy_backend_errors_total", kind="incomplete")
+        self.record_request(request, addr, arrived, "backend", response.status, relay.forwarded, relay.head_sent)
+        return keep_open and response.complete and response.state != "close"
+
+    def forward_done(self, pool, target_conn, backend, relay, flight):
+        """Cleanup after forwarding, whether the request succeeded or not"""
+        if target_conn:
+            pool.discard(target_conn)
+        if relay is None:
+            self.balancer.finish(backend, None, ok=False)
+        else:
+            self.balancer.finish(backend, relay.first_byte, ok=relay.forwarded > 0)
+        if flight is not None:
+            # Followers of a failed or unshareable response ask the backend themselves
+            self.coalescer.finish(flight)
+
+    def forward_request(self, request, client_socket, addr, keep_open, arrived):
+        """Forward one request to a backend and relay its response
+
+        Returns True when the client connection can serve another request.
+        """
+        answer, source, fill_key = self.local_answer(request, addr, keep_open)
+        if answer is None:
+            flight, leader = self.join_flight(request, fill_key)
+            if not leader:
+                answer, source = self.shared_answer(request, self.coalescer.wait(flight), keep_open), "coalesced"
+                flight = None
+        if answer is not None:
+            self.log_request_line(request)
+            client_socket.sendall(answer)
+            self.record_request(request, addr, arrived, source, response_status(answer), len(answer))
+            return keep_open
+
+        target_conn = None
+        pool = None
+        relay = None
+        backend = self.balancer.choose(request.target)
+        try:
+            self.log_request_line(request)
+
+            # Forward request to backend over a pooled keep-alive connection
+            backend_request = keep_alive_request(request)
+            encoding = self.client_encoding(request)
+            attempts = 2 if request.method in IDEMPOTENT_METHODS else 1
+            fresh = False
+
+            for attempt in range(attempts):
+                pool = self.get_backend_pool(backend.host, backend.port)
+                connect_started = time.monotonic()
+                try:
+                    target_conn = pool.connect() if fresh else pool.acquire()
                 except Exception as e:
-                    print(f"⚠ Error receiving from backend: {e}")
+                    other = self.backend_failed(backend, e, request, attempt + 1 < attempts)
+                    if other is None:
+                        # Send 502 Bad Gateway response
+                        answer = self.bad_gateway_response(backend)
+                        client_socket.sendall(answer)
+                        self.record_request(request, addr, arrived, "error", 502, len(answer))
+                        return False
+                    backend = other
+                    continue
+                self.backend_connected(backend, target_conn, connect_started)
+
+                relay = self.relay(target_conn, backend_request, request, client_socket, keep_open,
+                                   fill_key, flight, encoding)
+                if relay.forwarded or not target_conn.reused:
                     break
+                fresh = self.stale_connection(pool, target_conn, attempt + 1 < attempts)
+                target_conn = None
 
-            if response_data:
-                # Forward response to client
-                client_socket.sendall(response_data)
-                print(f"📤 Forwarded {len(response_data)} bytes to client")
+            if target_conn:
+                pool.release(target_conn, relay.response.complete and relay.response.keep_alive)
+                target_conn = None
 
-                # Log response status
-                response_str = response_data.decode('utf-8', errors='ignore')
-                if response_str:
-                    first_line = response_str.split('\n')[0].strip()
-                    print(f"📋 Response: {first_line}")
-            else:
-                print("⚠ No response received from backend")
+            if not relay.forwarded:
                 # Send 504 Gateway Timeout
-                error_response = (
-                    "HTTP/1.1 504 Gateway Timeout\r\n"
-                    "Content-Type: text/html\r\n"
-                    "Connection: close\r\n"
-                    "\r\n"
-                    "<html><body><h1>504 Gateway Timeout</h1>"
-                    "<p>The backend server did not respond in time.</p>"
-                    "</body></html>\r\n"
-                )
-                client_socket.sendall(error_response.encode('utf-8'))
-
-            print(f"✅ Request from {addr} completed successfully")
+                answer = self.no_response()
+                client_socket.sendall(answer)
+                self.record_request(request, addr, arrived, "error", 504, len(answer))
+                return False
+            return self.relay_done(request, addr, arrived, keep_open, relay)
+
+        finally:
+            self.forward_done(pool, target_conn, backend, relay, flight)
+
+    async def handle_client_async(self, reader, writer):
+        """Event-loop version of handle_client, one coroutine per admitted connection"""
+        addr = writer.get_extra_info('peername')
+        session = ClientSession(self, addr)
+        try:
+            self.log.debug(f"📥 New connection from {addr}")
+            if self.tls is not None and not await self.tls_accept_async(writer, addr):
+                return
+
+            while True:
+                next_request = session.next_request()
+                if next_request is None:
+                    try:
+                        chunk = await asyncio.wait_for(reader.read(RECV_SIZE), timeout=session.read_timeout())
+                    except asyncio.TimeoutError:
+                        session.timed_out()
+                        return
+                    if not chunk:
+                        session.ended()
+                        return
+                    error = session.received(chunk)
+                    if error:
+                        writer.write(error)
+                        await writer.drain()
+                        return
+                    continue
+
+                request, keep_open, arrived = next_request
+                if not await self.forward_request_async(request, writer, addr, keep_open, arrived):
+                    return
 
         except Exception as e:
-            print(f"❌ Error handling client {addr}: {e}")
             import traceback
-            traceback.print_exc()
+            self.log.error(f"❌ Error handling client {addr}: {e}\n{traceback.format_exc().rstrip()}")
         finally:
-            # Clean up connections
+            session.close()
+            # Clean up connection
             try:
-                if target_socket:
-                    target_socket.close()
-                client_socket.close()
+                writer.close()
             except:
                 pass
 
+    async def forward_request_async(self, request, writer, addr, keep_open, arrived):
+        """Event-loop version of forward_request"""
+        answer, source, fill_key = self.local_answer(request, addr, keep_open)
+        if answer is None:
+            flight, leader = self.join_flight(request, fill_key, asyncio.get_running_loop())
+            if not leader:
+                shared = await self.coalescer.wait_async(flight)
+                answer, source = self.shared_answer(request, shared, keep_open), "coalesced"
+                flight = None
+        if answer is not None:
+            self.log_request_line(request)
+            writer.write(answer)
+            await writer.drain()
+            self.record_request(request, addr, arrived, source, response_status(answer), len(answer))
+            return keep_open
+
+        target_conn = None
+        pool = None
+        relay = None
+        backend = self.balancer.choose(request.target)
+        try:
+            self.log_request_line(request)
+
+            # Forward request to backend over a pooled keep-alive connection
+            backend_request = keep_alive_request(request)
+            encoding = self.client_encoding(request)
+            attempts = 2 if request.method in IDEMPOTENT_METHODS else 1
+            fresh = False
+
+            for attempt in range(attempts):
+                pool = self.get_backend_pool(backend.host, backend.port)
+                connect_started = time.monotonic()
+                try:
+                    target_conn = await (pool.connect() if fresh else pool.acquire())
+                except Exception as e:
+                    other = self.backend_failed(backend, e, request, attempt + 1 < attempts)
+                    if other is None:
+                        # Send 502 Bad Gateway response
+                        answer = self.bad_gateway_response(backend)
+                        writer.write(answer)
+                        await writer.drain()
+                        self.record_request(request, addr, arrived, "error", 502, len(answer))
+                        return False
+                    backend = other
+                    continue
+                self.backend_connected(backend, target_conn, connect_started)
+
+                relay = await self.relay_async(target_conn, backend_request, request, writer, keep_open,
+                                               fill_key, flight, encoding)
+                if relay.forwarded or not target_conn.reused:
+                    break
+                fresh = self.stale_connection(pool, target_conn, attempt + 1 < attempts)
+                target_conn = None
+
+            if target_conn:
+                pool.release(target_conn, relay.response.complete and relay.response.keep_alive)
+                target_conn = None
+
+            if not relay.forwarded:
+                # Send 504 Gateway Timeout
+                answer = self.no_response()
+                writer.write(answer)
+                await writer.drain()
+                self.record_request(request, addr, arrived, "error", 504, len(answer))
+                return False
+            return self.relay_done(request, addr, arrived, keep_open, relay)
+
+        finally:
+            self.forward_done(pool, target_conn, backend, relay, flight)
+
+    async def serve_async(self, listener):
+        """Serve every client and backend socket from one asyncio event loop"""
+        server = await asyncio.get_running_loop().create_server(
+            lambda: AdmittingProtocol(self), sock=listener, backlog=LISTEN_BACKLOG)
+        self.server = server
+        self.loop = asyncio.get_running_loop()
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                if not self.stopping.is_set():
+                    raise
+
     def start(self):
-        """Start the reverse proxy server"""
+        """Start the reverse proxy, as a worker master or as a single process"""
+        if self.workers > 1:
+            # Once for all workers, which then only bind and serve
+            self.setup_firewall()
+            threading.Thread(target=self.probe_backends, daemon=True, name="backend-probe").start()
+            print(f"🏭 Starting {self.workers} worker processes sharing port {self.proxy_port}")
+            WorkerMaster(self, self.workers).run()
+        else:
+            self.serve()
+
+    def listen(self):
+        """Bind the listening socket, the first thing serve() does"""
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                # Every worker binds the same port, the kernel balances accepts
+                server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             server_socket.bind((self.proxy_host, self.proxy_port))
-            server_socket.listen(10)
+            server_socket.listen(LISTEN_BACKLOG)
+        except OSError:
+            server_socket.close()
+            raise
+        return server_socket
 
-            print(f"🚀 Reverse proxy listening on {self.current_ip}:{self.proxy_port}")
-            print(f"🎯 Forwarding requests to {self.target_host}:{self.target_port}")
-            print("📡 Waiting for connections...")
-            print("-" * 60)
+    def serve(self, worker=False):
+        """Serve clients from this process in the configured mode
 
-            while True:
+        The port is bound before anything else; the firewall is applied
+        right after and the backends are probed in the background, so
+        clients are queued by the kernel from the first milliseconds.
+        """
+        try:
+            listener = self.listen()
+        except OSError as e:
+            print(f"❌ Failed to start reverse proxy: {e}")
+            return
+        self.startup_seconds = time.monotonic() - self.created_at
+
+        print(f"🚀 Reverse proxy listening on {self.current_ip}:{self.proxy_port} ({self.mode}, "
+              f"ready in {self.startup_seconds * 1000:.1f} ms)")
+        if self.tls is not None:
+            tickets = "session tickets" if not self.tls.options & ssl.OP_NO_TICKET else "session cache only"
+            print(f"🔒 TLS termination on, resumption with {tickets}")
+        print(f"🎯 Forwarding requests to {', '.join(f'{h}:{p}' for h, p in self.backends)} "
+              f"({self.balancer.strategy})")
+
+        if not worker:
+            self.setup_firewall()
+            threading.Thread(target=self.probe_backends, daemon=True, name="backend-probe").start()
+        self.health_checker.start()
+        self.log.start()
+
+        print("📡 Waiting for connections...")
+        print("-" * 60)
+        if self.mode == "asyncio":
+            self.start_asyncio(listener)
+        else:
+            self.start_threaded(listener)
+
+    def stop(self):
+        """Stop accepting clients, serve() then returns (used by the benchmark)"""
+        self.stopping.set()
+        self.health_checker.stop()
+        self.log.stop()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+        elif self.server is not None:
+            # Wake up the blocked accept()
+            try:
+                self.server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.server.close()
+
+    def start_asyncio(self, listener):
+        """Run the asyncio serving mode until interrupted"""
+        try:
+            asyncio.run(self.serve_async(listener))
+        except KeyboardInterrupt:
+            # Pending log lines first, so the summary comes last
+            self.log.stop()
+            print("\n🛑 Reverse proxy shutting down...")
+            self.print_stats()
+        except Exception as e:
+            print(f"❌ Failed to start reverse proxy: {e}")
+            import traceback
+            traceback.print_exc()
+
+    def start_threaded(self, server_socket):
+        """Accept clients on the bound socket with one thread per connection"""
+        try:
+            self.server = server_socket
+            while not self.stopping.is_set():
                 try:
                     client_socket, addr = server_socket.accept()
+                    rejected = self.admission.admit(addr[0])
+                    if rejected:
+                        self.reject_connection(client_socket, addr, rejected)
+                        continue
 
                     # Handle each client in a separate thread
-                    client_thread = threading.Thread(
-                        target=self.handle_client,
-                        args=(client_socket, addr),
-                        daemon=True
-                    )
-                    client_thread.start()
+                    try:
+                        client_thread = threading.Thread(
+                            target=self.handle_client,
+                            args=(client_socket, addr),
+                            daemon=True
+                        )
+                        client_thread.start()
+                    except BaseException:
+                        # handle_client never ran, so its cleanup is ours to do
+                        self.admission.release()
+                        client_socket.close()
+                        raise
 
                 except KeyboardInterrupt:
+                    self.log.stop()
                     print("\n🛑 Reverse proxy shutting down...")
+                    self.print_stats()
                     break
                 except Exception as e:
-                    print(f"❌ Error accepting connection: {e}")
+                    if self.stopping.is_set():
+                        break
+                    self.log.error(f"❌ Error accepting connection: {e}")
 
         except Exception as e:
             print(f"❌ Failed to start reverse proxy: {e}")
@@ -271,7 +1378,120 @@ class ReverseProxy:
             except:
                 pass
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Reverse proxy for VM4")
+    parser.add_argument("--mode", choices=SERVE_MODES, default="threaded",
+                        help="threaded = one thread per client, asyncio = single event loop")
+    parser.add_argument("--listen-host", default="0.0.0.0")
+    parser.add_argument("--listen-port", type=int, default=8080)
+    parser.add_argument("--target-host", default="169.254.187.117")
+    parser.add_argument("--target-port", type=int, default=8080)
+    parser.add_argument("--backend", action="append", type=parse_backend, metavar="HOST:PORT",
+                        help="backend server, repeat for several (overrides --target-host/--target-port)")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="round-robin",
+                        help="how requests are spread over the backends")
+    parser.add_argument("--health-interval", type=float, default=5.0,
+                        help="seconds between active health checks")
+    parser.add_argument("--health-path", default="/",
+                        help="path requested with HEAD by the health checker")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes sharing the port with SO_REUSEPORT")
+    parser.add_argument("--cache-mb", type=float, default=0,
+                        help="size of the in-memory response cache in MiB (0 = disabled)")
+    parser.add_argument("--block", action="append", default=[], metavar="CIDR",
+                        help="refuse clients from this range, repeat for several")
+    parser.add_argument("--block-file", action="append", default=[], metavar="PATH",
+                        help="file with one CIDR to block per line")
+    parser.add_argument("--allow", action="append", default=[], metavar="CIDR",
+                        help="accept clients from this range even inside a blocked one")
+    parser.add_argument("--allow-file", action="append", default=[], metavar="PATH",
+                        help="file with one CIDR to allow per line")
+    parser.add_argument("--allow-only", action="store_true",
+                        help="refuse every client that is not in an allowed range")
+    parser.add_argument("--rate-limit", type=float, default=0,
+                        help="new connections per second allowed per client IP (0 = unlimited)")
+    parser.add_argument("--rate-burst", type=float, default=None,
+                        help="connections a client may open at once before the rate applies")
+    parser.add_argument("--max-connections", type=int, default=1024,
+                        help="open client connections before new ones get 503 (0 = unlimited)")
+    parser.add_argument("--no-firewall", action="store_true",
+                        help="do not touch the iptables rules")
+    parser.add_argument("--firewall-dry-run", action="store_true",
+                        help="print the iptables-restore ruleset instead of applying it")
+    parser.add_argument("--log-level", choices=tuple(LOG_LEVELS), default="info",
+                        help="debug logs every step of every request, info one line per request")
+    parser.add_argument("--no-compress", action="store_true",
+                        help="never gzip/deflate responses for clients that accept it")
+    parser.add_argument("--compress-level", type=int, default=6, choices=range(1, 10),
+                        metavar="1-9", help="zlib compression level")
+    parser.add_argument("--compress-min-size", type=int, default=MIN_COMPRESS_SIZE,
+                        help="bodies smaller than this many bytes are sent uncompressed")
+    parser.add_argument("--compress-cache-mb", type=float, default=8,
+                        help="memory for compressed variants of popular responses")
+    parser.add_argument("--tls-cert", default=None,
+                        help="PEM certificate (chain) to terminate TLS with, plain HTTP if not set")
+    parser.add_argument("--tls-key", default=None,
+                        help="PEM private key, if not in the --tls-cert file")
+    parser.add_argument("--tls-self-signed", action="store_true",
+                        help="terminate TLS with a throwaway self-signed certificate (testing)")
+    parser.add_argument("--tls-no-tickets", action="store_true",
+                        help="resume sessions from the server-side cache instead of stateless tickets")
+    parser.add_argument("--tls-handshake-timeout", type=float, default=HANDSHAKE_TIMEOUT,
+                        help="seconds a client gets to complete the TLS handshake")
+    parser.add_argument("--no-coalesce", action="store_true",
+                        help="send identical concurrent GETs to the backend separately")
+    parser.add_argument("--pool-size", type=int, default=32,
+                        help="max idle keep-alive connections kept per backend")
+    parser.add_argument("--pool-idle-timeout", type=float, default=30.0,
+                        help="seconds before an idle backend connection is closed")
+    parser.add_argument("--no-splice", action="store_true",
+                        help="always copy response bodies through the relay buffer")
+    parser.add_argument("--client-idle-timeout", type=float, default=15.0,
+                        help="seconds an idle keep-alive client connection stays open")
+    parser.add_argument("--max-requests-per-connection", type=int, default=100,
+                        help="close a client connection after this many requests")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
     print("🔄 Starting Reverse Proxy Server...")
     print("=" * 60)
-    proxy = ReverseProxy()
\ No newline at end of file
+    if args.tls_self_signed and not args.tls_cert:
+        args.tls_cert, args.tls_key = self_signed_certificate(tempfile.mkdtemp(prefix="revproxy-tls-"))
+        print(f"🔒 Generated self-signed certificate {args.tls_cert}")
+    proxy = ReverseProxy(
+        proxy_host=args.listen_host,
+        proxy_port=args.listen_port,
+        target_host=args.target_host,
+        target_port=args.target_port,
+        mode=args.mode,
+        pool_size=args.pool_size,
+        pool_idle_timeout=args.pool_idle_timeout,
+        use_splice=not args.no_splice,
+        client_idle_timeout=args.client_idle_timeout,
+        max_requests_per_connection=args.max_requests_per_connection,
+        backends=args.backend,
+        strategy=args.strategy,
+        health_interval=args.health_interval,
+        health_path=args.health_path,
+        cache_size=int(args.cache_mb * 1024 * 1024),
+        workers=args.workers,
+        coalesce=not args.no_coalesce,
+        compress=not args.no_compress,
+        compress_level=args.compress_level,
+        compress_min_size=args.compress_min_size,
+        compress_cache_size=int(args.compress_cache_mb * 1024 * 1024),
+        tls_cert=args.tls_cert,
+        tls_key=args.tls_key,
+        tls_session_tickets=not args.tls_no_tickets,
+        tls_handshake_timeout=args.tls_handshake_timeout,
+        log_level=args.log_level,
+        firewall=not args.no_firewall,
+        firewall_dry_run=args.firewall_dry_run,
+        block=args.block + [cidr for path in args.block_file for cidr in load_cidr_file(path)],
+        allow=args.allow + [cidr for path in args.allow_file for cidr in load_cidr_file(path)],
+        allow_only=args.allow_only,
+        rate_limit=args.rate_limit,
+        rate_burst=args.rate_burst,
+        max_connections=args.max_connections
+    )
\ No newline at end of file
@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import urllib.parse
+
+from http_parser import HTTPParseError, RequestParser
+
+# Read size for requests
+RECV_SIZE = 16 * 1024
+
+
+class StandInBackend:
+    """Minimal keep-alive HTTP/1.1 server that stands in for VM2 in benchmarks
+
+    Every GET answers with `size` bytes after `delay` seconds. A request can
+    override both with ?size=N&delay=S, so one backend serves a whole mix
+    of response shapes.
+    """
+
+    def __init__(self, host="127.0.0.1", port=9001, size=1024, delay=0.0):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.delay = delay
+        self.bodies = {}  # size -> body, built once per size
+        self.requests = 0
+
+    def body(self, size):
+        body = self.bodies.get(size)
+        if body is None:
+            body = self.bodies[size] = b"x" * size
+        return body
+
+    def response(self, request):
+        path, _, query = request.target.decode("latin-1").partition("?")
+        params = urllib.parse.parse_qs(query)
+        try:
+            size = int(params.get("size", [self.size])[0])
+            delay = float(params.get("delay", [self.delay])[0])
+        except ValueError:
+            return b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n", 0
+        body = b"" if request.method == b"HEAD" else self.body(size)
+        head = (
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/octet-stream\r\n"
+            b"Content-Length: %d\r\n"
+            b"%s\r\n" % (size, b"" if request.keep_alive else b"Connection: close\r\n")
+        )
+        return head + body, delay
+
+    async def handle(self, reader, writer):
+        parser = RequestParser()
+        try:
+            while True:
+                chunk = await reader.read(RECV_SIZE)
+                if not chunk:
+                    return
+                for request in parser.feed(chunk):
+                    self.requests += 1
+                    answer, delay = self.response(request)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    writer.write(answer)
+                    await writer.drain()
+                    if not request.keep_alive:
+                        return
+        except (ConnectionError, HTTPParseError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, ready=None):
+        server = await asyncio.start_server(self.handle, self.host, self.port,
+                                            reuse_address=True, backlog=1024)
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+    def run(self, ready=None):
+        try:
+            asyncio.run(self.serve(ready))
+        except KeyboardInterrupt:
+            print(f"\n🛑 Stand-in backend stopped after {self.requests} requests")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stand-in HTTP backend for proxy benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--size", type=int, default=1024,
+                        help="response body size in bytes (override per request with ?size=N)")
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="seconds to wait before answering (override with ?delay=S)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"🧪 Stand-in backend on {args.host}:{args.port} ({args.size} bytes, {args.delay}s delay)")
+    StandInBackend(args.host, args.port, args.size, args.delay).run()
@@ -0,0 +1,92 @@
+import collections
+import os
+import ssl
+import subprocess
+import threading
+
+# Seconds a client gets to finish the TLS handshake
+HANDSHAKE_TIMEOUT = 10.0
+
+# TLS 1.3 tickets issued per full handshake, one for each parallel connection
+# a browser is likely to open afterwards
+TICKETS_PER_HANDSHAKE = 2
+
+
+def server_context(certfile, keyfile=None, session_tickets=True, tickets=TICKETS_PER_HANDSHAKE):
+    """SSLContext for terminating client TLS with session resumption
+
+    With session_tickets the session state travels in tickets encrypted
+    with the context's key, so nothing is stored per client and any
+    process forked after the context was created can resume them. Without,
+    sessions stay in OpenSSL's server-side cache (session IDs for TLS 1.2,
+    stateful tickets for TLS 1.3) and only resume on the same process.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(certfile, keyfile)
+    context.set_alpn_protocols(["http/1.1"])
+    if session_tickets:
+        context.options &= ~ssl.OP_NO_TICKET
+    else:
+        context.options |= ssl.OP_NO_TICKET
+    context.num_tickets = tickets
+    return context
+
+
+def self_signed_certificate(directory, common_name="localhost", days=30):
+    """Write a throwaway P-256 key and certificate with openssl, returns (cert, key)"""
+    certfile = os.path.join(directory, "proxy-cert.pem")
+    keyfile = os.path.join(directory, "proxy-key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-nodes", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+         "-keyout", keyfile, "-out", certfile, "-days", str(days), "-subj", f"/CN={common_name}",
+         "-addext", f"subjectAltName=DNS:{common_name},DNS:localhost,IP:127.0.0.1"],
+        check=True,
+        capture_output=True,
+        timeout=30
+    )
+    return certfile, keyfile
+
+
+class TLSStats:
+    """Handshake counters, and how many handshakes resumed an earlier session"""
+
+    def __init__(self, context):
+        self.context = context
+        self.lock = threading.Lock()
+        self.handshakes = 0
+        self.resumed = 0
+        self.failures = 0
+        self.versions = collections.Counter()
+
+    def handshake_done(self, ssl_object):
+        """Count a completed handshake, returns whether it was resumed"""
+        resumed = ssl_object.session_reused
+        with self.lock:
+            self.handshakes += 1
+            if resumed:
+                self.resumed += 1
+            self.versions[ssl_object.version()] += 1
+        return resumed
+
+    def handshake_failed(self):
+        with self.lock:
+            self.failures += 1
+
+    def stats(self):
+        sessions = self.context.session_stats()
+        with self.lock:
+            return {
+                "handshakes": self.handshakes,
+                "full": self.handshakes - self.resumed,
+                "resumed": self.resumed,
+                "failures": self.failures,
+                "resumption_rate": round(self.resumed / self.handshakes, 4) if self.handshakes else 0.0,
+                "versions": dict(self.versions),
+                # OpenSSL's own server session cache
+                "cached_sessions": sessions["number"],
+                "cache_hits": sessions["hits"],
+                "cache_misses": sessions["misses"],
+                "cache_timeouts": sessions["timeouts"],
+                "cache_full": sessions["cache_full"],
+            }
@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+
+REUSE_PORT_SUPPORTED = hasattr(socket, "SO_REUSEPORT")
+
+# A worker that dies sooner than this after starting is restarted with a delay
+MIN_WORKER_LIFETIME = 1.0
+
+
+def stats_report(proxy, index):
+    return {
+        "worker": index,
+        "pid": os.getpid(),
+        "time": time.time(),
+        "stats": proxy.collect_stats(),
+    }
+
+
+def report_stats(proxy, index, stats_queue, interval):
+    """Worker side: push this process's counters to the master every interval"""
+    while True:
+        time.sleep(interval)
+        try:
+            stats_queue.put_nowait(stats_report(proxy, index))
+        except (queue.Full, OSError, ValueError):
+            pass
+
+
+def run_worker(proxy, index, stats_queue, interval):
+    def finish(signum, frame):
+        # Last report on the way out, flushed before the process exits
+        try:
+            proxy.log.flush()
+            stats_queue.put_nowait(stats_report(proxy, index))
+            stats_queue.close()
+            stats_queue.join_thread()
+        finally:
+            os._exit(0)
+
+    # Ctrl-C reaches the whole process group; only the master reacts to it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, finish)
+    threading.Thread(
+        target=report_stats,
+        args=(proxy, index, stats_queue, interval),
+        daemon=True
+    ).start()
+    proxy.serve(worker=True)
+
+
+class WorkerMaster:
+    """Pre-fork master: N worker processes share the listen port via SO_REUSEPORT
+
+    Every worker binds its own listening socket, so the kernel spreads new
+    connections over them and each process runs on its own core. The
+    master only restarts workers that exit and collects their statistics.
+    """
+
+    def __init__(self, proxy, count, stats_interval=5.0):
+        if not REUSE_PORT_SUPPORTED:
+            raise RuntimeError("SO_REUSEPORT is not available on this platform")
+        self.proxy = proxy
+        self.count = count
+        self.stats_interval = stats_interval
+        self.context = multiprocessing.get_context("fork")
+        self.stats_queue = self.context.Queue(maxsize=1024)
+        self.processes = {}
+        self.started_at = {}
+        self.restarts = 0
+        self.worker_stats = {}
+        self.running = False
+
+    def spawn(self, index):
+        process = self.context.Process(
+            target=run_worker,
+            args=(self.proxy, index, self.stats_queue, self.stats_interval),
+            name=f"proxy-worker-{index}",
+            daemon=True
+        )
+        # Do not let the child inherit (and later repeat) buffered output
+        sys.stdout.flush()
+        process.start()
+        self.processes[index] = process
+        self.started_at[index] = time.monotonic()
+        print(f"👷 Worker {index} started (pid {process.pid})")
+
+    def run(self):
+        self.running = True
+        for index in range(self.count):
+            self.spawn(index)
+        try:
+            while self.running:
+                self.drain_stats(timeout=0.5)
+                self.reap()
+        except KeyboardInterrupt:
+            print("\n🛑 Master shutting down workers...")
+        finally:
+            self.running = False
+            # A second Ctrl-C must not interrupt the shutdown itself
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            self.stop()
+            self.print_stats()
+
+    def reap(self):
+        """Restart every worker that has exited"""
+        for index, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            lived = time.monotonic() - self.started_at[index]
+            print(f"💥 Worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+            process.join(0)
+            self.restarts += 1
+            if lived < MIN_WORKER_LIFETIME:
+                # Crashing right after start, do not spin
+                time.sleep(MIN_WORKER_LIFETIME)
+            self.spawn(index)
+
+    def drain_stats(self, timeout):
+        try:
+            report = self.stats_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            self.worker_stats[report["worker"]] = report
+            try:
+                report = self.stats_queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def stop(self):
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(2)
+        self.drain_stats(timeout=0)
+
+    def totals(self):
+        """Counters summed over the latest report of every worker"""
+        totals = {"requests": 0, "cache_hits": 0, "coalesced": 0, "pool_hits": 0, "pool_misses": 0}
+        for report in self.worker_stats.values():
+            stats = report["stats"]
+            totals["requests"] += sum(b["requests"] for b in stats["backends"])
+            totals["pool_hits"] += sum(p["hits"] for p in stats["pools"])
+            totals["pool_misses"] += sum(p["misses"] for p in stats["pools"])
+            if stats["cache"]:
+                totals["cache_hits"] += stats["cache"]["hits"]
+            if stats["coalescing"]:
+                totals["coalesced"] += stats["coalescing"]["coalesced"]
+        return totals
+
+    def print_stats(self):
+        for index in sorted(self.worker_stats):
+            report = self.worker_stats[index]
+            stats = report["stats"]
+            requests = sum(b["requests"] for b in stats["backends"])
+            print(f"📊 Worker {index} (pid {report['pid']}): {requests} backend requests")
+        totals = self.totals()
+        print(f"📊 All workers: {totals['requests']} backend requests, {totals['cache_hits']} cache hits, "
+              f"{totals['coalesced']} coalesced, "
+              f"{totals['pool_hits']} pool hits / {totals['pool_misses']} misses, {self.restarts} restarts")
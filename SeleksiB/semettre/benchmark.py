@@ -7,16 +7,102 @@ import random
 from pathlib import Path
 from datetime import datetime
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # Increase the limit for integer string conversion
 sys.set_int_max_str_digits(2000000)  # Handle up to 1,000,000-digit numbers
 
-def generate_random_number(digits):
+# Random byte -> ASCII digit. Bytes 250..255 are dropped so every digit is equally likely
+DIGIT_TABLE = bytes(ord("0") + i % 10 for i in range(256))
+BIASED_BYTES = bytes(range(250, 256))
+
+# Operand shapes for --adversarial and --generate
+SHAPES = ("random", "nines", "sparse", "zero-runs", "lopsided", "power-of-ten")
+
+class DigitSource:
+    """Seeded generator of decimal digits, built in bulk instead of one randint per digit
+
+    The same seed gives the same numbers as long as the same backend is
+    used: NumPy when it is installed (unless use_numpy=False), otherwise
+    random.randbytes mapped through DIGIT_TABLE.
+    """
+
+    def __init__(self, seed, use_numpy=None):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        self.np_rng = np.random.default_rng(seed) if self.use_numpy else None
+
+    @property
+    def backend(self):
+        return "numpy" if self.use_numpy else "randbytes"
+
+    def digits(self, count):
+        """count uniformly random ASCII digits as a bytearray"""
+        if self.use_numpy:
+            return bytearray((self.np_rng.integers(0, 10, size=count, dtype=np.uint8) + ord("0")).tobytes())
+        out = bytearray()
+        while len(out) < count:
+            needed = count - len(out)
+            # About 2.3% of bytes are rejected, ask for a little more than needed
+            out += self.rng.randbytes(needed + needed // 32 + 16).translate(DIGIT_TABLE, BIASED_BYTES)
+        del out[count:]
+        return out
+
+    def number(self, digits, shape="random"):
+        """An n-digit number (no leading zero) of the given shape, as ASCII bytes"""
+        if shape == "nines":
+            return bytearray(b"9" * digits)
+        if shape == "power-of-ten":
+            return bytearray(b"1" + b"0" * (digits - 1))
+        if shape == "sparse":
+            # About 1 digit in 1000 non-zero
+            num = bytearray(b"0" * digits)
+            for position in self.rng.sample(range(1, digits), min(digits - 1, max(1, digits // 1000))):
+                num[position] = ord("0") + self.rng.randint(1, 9)
+        else:
+            num = self.digits(digits)
+            if shape == "zero-runs" and digits > 2:
+                # Long runs of zeros over a large part of the number
+                run = max(1, min(digits // 8, 4096))
+                for _ in range(max(1, digits // (2 * run))):
+                    start = self.rng.randrange(1, max(2, digits - run))
+                    num[start:start + run] = b"0" * len(num[start:start + run])
+        num[0] = ord("0") + self.rng.randint(1, 9)
+        return num
+
+    def pair(self, digits, shape="random"):
+        """Two operands as strings; lopsided pairs an n-digit number with a short one"""
+        if shape == "lopsided":
+            return self.number(digits).decode(), self.number(max(1, digits // 10000)).decode()
+        return self.number(digits, shape).decode(), self.number(digits, shape).decode()
+
+    def write(self, out, digits, shape="random"):
+        """Write "a b" for ./main straight to a binary file or buffer"""
+        if shape == "lopsided":
+            first, second = self.number(digits), self.number(max(1, digits // 10000))
+        else:
+            first, second = self.number(digits, shape), self.number(digits, shape)
+        out.write(first)
+        out.write(b" ")
+        out.write(second)
+        out.write(b"\n")
+
+def generate_random_number(digits, source=None):
     """Generate a random number as a string with specified digits"""
     print(f"Generating {digits}-digit number...")
-    num = str(random.randint(1, 9))
-    for _ in range(digits - 1):
-        num += str(random.randint(0, 9))
-    return num
+    if source is None:
+        source = DigitSource(random.getrandbits(64))
+    return source.number(digits).decode()
+
+def seed_from_args():
+    """--seed N from the command line, the current time otherwise"""
+    if "--seed" in sys.argv:
+        return int(sys.argv[sys.argv.index("--seed") + 1])
+    return int(time.time())
 
 def run_test(num1, num2, description="", timeout=30):
     """Run a test case, verify the result, and log to file with full digits"""
@@ -118,13 +204,13 @@ def write_to_file(lines):
             f.write(line + '\n')
 
 def main():
-    seed = int(time.time())
-    print(f"Random seed: {seed}")
-    random.seed(seed)
+    seed = seed_from_args()
+    source = DigitSource(seed)
+    print(f"Random seed: {seed} (digits from {source.backend})")
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     with open(f"test_results_{timestamp}.txt", 'w') as f:
-        f.write(f"Test Results (Seed: {seed})\n")
+        f.write(f"Test Results (Seed: {seed}, {source.backend})\n")
         f.write(f"{'='*60}\n")
         f.write("WARNING: Writing full digits for large numbers may cause significant I/O delays.\n")
     
@@ -160,36 +246,36 @@ def main():
         "Powers of 10 (30 digits each)"
     ))
     
-    num1_32 = generate_random_number(32)
-    num2_32 = generate_random_number(32)
+    num1_32 = generate_random_number(32, source)
+    num2_32 = generate_random_number(32, source)
     test_results.append(run_test(num1_32, num2_32, "32 Digits"))
     
-    num1_64 = generate_random_number(64)
-    num2_64 = generate_random_number(64)
+    num1_64 = generate_random_number(64, source)
+    num2_64 = generate_random_number(64, source)
     test_results.append(run_test(num1_64, num2_64, "64 Digits"))
     
-    num1_100 = generate_random_number(100)
-    num2_100 = generate_random_number(100)
+    num1_100 = generate_random_number(100, source)
+    num2_100 = generate_random_number(100, source)
     test_results.append(run_test(num1_100, num2_100, "100 Digits"))
     
-    num1_500 = generate_random_number(500)
-    num2_500 = generate_random_number(500)
+    num1_500 = generate_random_number(500, source)
+    num2_500 = generate_random_number(500, source)
     test_results.append(run_test(
         num1_500, num2_500, 
         "500 Digits", 
         timeout=60
     ))
     
-    num1_1000 = generate_random_number(1000)
-    num2_1000 = generate_random_number(1000)
+    num1_1000 = generate_random_number(1000, source)
+    num2_1000 = generate_random_number(1000, source)
     test_results.append(run_test(
         num1_1000, num2_1000,
         "1000 Digits",
         timeout=120
     ))
     
-    num1_5000 = generate_random_number(5000)
-    num2_5000 = generate_random_number(5000)
+    num1_5000 = generate_random_number(5000, source)
+    num2_5000 = generate_random_number(5000, source)
     test_results.append(run_test(
         num1_5000, num2_5000,
         "5000 Digits",
@@ -257,58 +343,100 @@ def run_extreme_tests(skip_million=False):
     """Run extreme tests for 8-point tier"""
     print("Running extreme tests for 8-point tier...")
     
-    seed = int(time.time())
-    print(f"Random seed: {seed}")
-    random.seed(seed)
+    seed = seed_from_args()
+    source = DigitSource(seed)
+    print(f"Random seed: {seed} (digits from {source.backend})")
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     with open(f"test_results_{timestamp}.txt", 'w') as f:
-        f.write(f"Extreme Test Results (Seed: {seed})\n")
+        f.write(f"Extreme Test Results (Seed: {seed}, {source.backend})\n")
         f.write(f"{'='*60}\n")
         f.write("WARNING: Writing full digits for large numbers may cause significant I/O delays.\n")
     
     print("WARNING: Writing full digits to file for large numbers may cause delays.")
     
-    num1_10k = generate_random_number(10000)
-    num2_10k = generate_random_number(10000)
+    num1_10k = generate_random_number(10000, source)
+    num2_10k = generate_random_number(10000, source)
     run_test(num1_10k, num2_10k, "10,000 digits 1", timeout=600)
     
-    num1_10k_alt = generate_random_number(10000)
-    num2_10k_alt = generate_random_number(10000)
+    num1_10k_alt = generate_random_number(10000, source)
+    num2_10k_alt = generate_random_number(10000, source)
     run_test(num1_10k_alt, num2_10k_alt, "10,000 digits 2", timeout=600)
     
-    num1_50k = generate_random_number(50000)
-    num2_50k = generate_random_number(50000)
+    num1_50k = generate_random_number(50000, source)
+    num2_50k = generate_random_number(50000, source)
     run_test(num1_50k, num2_50k, "50,000 digits", timeout=1200)
     
     if not skip_million:
-        num1_1m = generate_random_number(1000000)
-        num2_1m = generate_random_number(1000000)
+        num1_1m = generate_random_number(1000000, source)
+        num2_1m = generate_random_number(1000000, source)
         run_test(num1_1m, num2_1m, "1,000,000 digits", timeout=3600)
 
 def run_hell_tests():
     """Run hell tests for 8-point tier"""
     print("Running hell tests for 8-point tier...")
     
-    seed = int(time.time())
-    print(f"Random seed: {seed}")
-    random.seed(seed)
+    seed = seed_from_args()
+    source = DigitSource(seed)
+    print(f"Random seed: {seed} (digits from {source.backend})")
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     with open(f"test_results_{timestamp}.txt", 'w') as f:
-        f.write(f"Hell Test Results (Seed: {seed})\n")
+        f.write(f"Hell Test Results (Seed: {seed}, {source.backend})\n")
         f.write(f"{'='*60}\n")
         f.write("WARNING: Writing full digits for large numbers may cause significant I/O delays.\n")
     
     print("WARNING: Writing full digits to file for large numbers may cause delays.")
     
     for _ in range(10):
-        num1 = generate_random_number(1000000)
-        num2 = generate_random_number(1000000)
+        num1 = generate_random_number(1000000, source)
+        num2 = generate_random_number(1000000, source)
         run_test(num1, num2, "Hell test - 1,000,000 digits", timeout=3600)
 
+def run_adversarial_tests(digits=100000):
+    """Operands shaped to hit carry chains, zero handling and unbalanced splits"""
+    print("Running adversarial tests...")
+    
+    seed = seed_from_args()
+    source = DigitSource(seed)
+    print(f"Random seed: {seed} (digits from {source.backend})")
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    with open(f"test_results_{timestamp}.txt", 'w') as f:
+        f.write(f"Adversarial Test Results (Seed: {seed}, {source.backend})\n")
+        f.write(f"{'='*60}\n")
+    
+    for shape in SHAPES:
+        print(f"Generating {shape} operands with {digits} digits...")
+        num1, num2 = source.pair(digits, shape)
+        run_test(num1, num2, f"Adversarial {shape} - {digits:,} digits", timeout=1200)
+
+def write_operands(digits, shape, path):
+    """Write one operand pair for ./main to path ('-' for stdout) without building strings"""
+    seed = seed_from_args()
+    source = DigitSource(seed)
+    start_time = time.time()
+    if path == "-":
+        source.write(sys.stdout.buffer, digits, shape)
+        sys.stdout.buffer.flush()
+    else:
+        with open(path, "wb") as f:
+            source.write(f, digits, shape)
+    print(f"Wrote {shape} operands with {digits} digits to {path} in {time.time() - start_time:.3f}s "
+          f"(seed {seed}, {source.backend})", file=sys.stderr)
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1 and sys.argv[1] == "--extreme":
+    if len(sys.argv) > 2 and sys.argv[1] == "--generate":
+        # python3 benchmark.py --generate 1000000 [--shape sparse] [--seed 42] [--output nums.txt]
+        shape = sys.argv[sys.argv.index("--shape") + 1] if "--shape" in sys.argv else "random"
+        if shape not in SHAPES:
+            sys.exit(f"Unknown shape {shape}, choose from: {', '.join(SHAPES)}")
+        output = sys.argv[sys.argv.index("--output") + 1] if "--output" in sys.argv else "-"
+        write_operands(int(sys.argv[2]), shape, output)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--adversarial":
+        digits = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2].isdigit() else 100000
+        run_adversarial_tests(digits)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--extreme":
         skip_million = "--skip-million" in sys.argv
         run_extreme_tests(skip_million=skip_million)
     elif len(sys.argv) > 1 and sys.argv[1] == "--hell":